@@ -1,8 +1,8 @@
-from resource import app
+from resource import create_app
 import os
 
+app = create_app()
 port = int(os.environ.get("PORT", 5000))
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=port)
-
@@ -0,0 +1 @@
+"""Seeded, in-process load tests of every endpoint, see `python -m benchmarks --help`"""
@@ -0,0 +1,159 @@
+import os
+import platform
+import subprocess
+import sys
+import time
+import click
+
+SCALE_NAMES = ("1k", "100k", "1m")
+
+
+def bench_app(scale, database_url, data_dir, bcrypt_rounds):
+    """An app on the benchmark database of a scale, a SQLite file in data_dir unless database_url is given"""
+    os.makedirs(data_dir, exist_ok=True)
+
+    from resource import create_app, db
+    from resource.ratelimit import DEFAULT_CONCURRENCY_LIMITS
+
+    config = {
+        "SQLALCHEMY_DATABASE_URI": database_url or "sqlite:///" + os.path.abspath(
+            os.path.join(data_dir, f"bench-{scale}.sqlite")),
+        "IMAGE_STORE_PATH": os.path.abspath(os.path.join(data_dir, f"images-{scale}")),
+        "RESPONSE_CACHE_DIR": os.path.abspath(os.path.join(data_dir, f"response-cache-{scale}")),
+        "METRICS_DIR": "",
+        "SLOW_REQUEST_SECONDS": 0,
+        "ADMIN_USER_IDS": [1],
+        # every request comes from one address, and the scenarios measure the endpoints, not the limits
+        "RATE_LIMIT_BACKEND": "none",
+        "CONCURRENCY_LIMITS": dict.fromkeys(DEFAULT_CONCURRENCY_LIMITS, 0),
+    }
+    if bcrypt_rounds:
+        config["BCRYPT_LOG_ROUNDS"] = bcrypt_rounds
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.group()
+def cli():
+    """Seeded load tests of the API, run in process through the Flask test client"""
+
+
+def common_options(fn):
+    fn = click.option("--scale", type=click.Choice(SCALE_NAMES), default="1k", show_default=True,
+                      help="Number of seeded dishes")(fn)
+    fn = click.option("--database-url", default=None,
+                      help="Database to seed and test, defaults to a SQLite file in --data-dir")(fn)
+    fn = click.option("--data-dir", default=os.path.join("instance", "benchmarks"), show_default=True,
+                      help="SQLite files, images and results")(fn)
+    fn = click.option("--bcrypt-rounds", type=int, default=None,
+                      help="bcrypt cost of the app, defaults to BCRYPT_LOG_ROUNDS")(fn)
+    return fn
+
+
+@cli.command("seed")
+@common_options
+@click.option("--likes-per-dish", default=5, show_default=True)
+@click.option("--image-fraction", default=0.3, show_default=True, help="Share of the dishes with an image")
+def seed_command(scale, database_url, data_dir, bcrypt_rounds, likes_per_dish, image_fraction):
+    """Seed the benchmark database of a scale, nothing happens when it already has dishes"""
+    from benchmarks.seed import SCALES, seed
+
+    app = bench_app(scale, database_url, data_dir, bcrypt_rounds)
+    with app.app_context():
+        if not seed(SCALES[scale], likes_per_dish, image_fraction, echo=click.echo):
+            click.echo("already seeded")
+
+
+@cli.command("run")
+@common_options
+@click.option("--concurrency", default=8, show_default=True, help="Threads sending requests")
+@click.option("--requests", "request_count", default=200, show_default=True, help="Timed requests per scenario")
+@click.option("--warmup", default=20, show_default=True, help="Untimed requests per scenario sent first")
+@click.option("--only", multiple=True, help="Run the scenarios whose name starts with this, e.g. dish.search")
+@click.option("--output", default=None, help="Where to write the JSON results")
+@click.option("--baseline", default=None, type=click.Path(exists=True),
+              help="Results of an earlier run, the run fails when it regressed against them")
+@click.option("--tolerance", default=0.2, show_default=True, help="Allowed relative slowdown against the baseline")
+def run_command(scale, database_url, data_dir, bcrypt_rounds, concurrency, request_count, warmup, only,
+                output, baseline, tolerance):
+    """Seed if needed, then load every endpoint and report throughput and latency percentiles"""
+    from benchmarks.load import run_scenario
+    from benchmarks.report import compare, format_table, load, save
+    from benchmarks.scenarios import SCENARIOS, BenchContext
+    from benchmarks.seed import SCALES, seed
+    from resource import db
+
+    app = bench_app(scale, database_url, data_dir, bcrypt_rounds)
+    with app.app_context():
+        seed(SCALES[scale], echo=click.echo)
+        ctx = BenchContext()
+        dialect = db.engine.dialect.name
+
+    results = {
+        "meta": {
+            "scale": scale,
+            "dishes": ctx.max_dish_id,
+            "database": dialect,
+            "concurrency": concurrency,
+            "requests": request_count,
+            "warmup": warmup,
+            "bcrypt_rounds": app.config["BCRYPT_LOG_ROUNDS"],
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "scenarios": {},
+    }
+
+    for scenario in SCENARIOS:
+        if only and not scenario.name.startswith(tuple(only)):
+            continue
+        summary, failures = run_scenario(app, ctx, scenario, request_count, concurrency, warmup)
+        results["scenarios"][scenario.name] = summary
+        click.echo(f"{scenario.name}: {summary['throughput_rps']} req/s, p95 {summary['p95_ms']} ms")
+        for failure in failures:
+            click.echo(f"  unexpected {failure['status']} from {failure['path']}: {failure['body']}", err=True)
+
+    click.echo(format_table(results))
+
+    output = output or os.path.join(data_dir, f"results-{scale}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    save(results, output)
+    click.echo(f"results written to {output}")
+
+    if baseline:
+        regressions = compare(results, load(baseline), tolerance)
+        for regression in regressions:
+            click.echo(f"REGRESSION {regression}", err=True)
+        if regressions:
+            sys.exit(1)
+        click.echo("no regressions against the baseline")
+
+
+@cli.command("compare")
+@click.argument("results", type=click.Path(exists=True))
+@click.argument("baseline", type=click.Path(exists=True))
+@click.option("--tolerance", default=0.2, show_default=True, help="Allowed relative slowdown against the baseline")
+def compare_command(results, baseline, tolerance):
+    """Compare two saved runs, exits with 1 when RESULTS regressed against BASELINE"""
+    from benchmarks.report import compare, load
+
+    regressions = compare(load(results), load(baseline), tolerance)
+    for regression in regressions:
+        click.echo(f"REGRESSION {regression}", err=True)
+    if regressions:
+        sys.exit(1)
+    click.echo("no regressions")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,74 @@
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(sorted_values, p):
+    """Nearest rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, errors, wall_seconds):
+    latencies = sorted(latencies)
+    to_ms = (lambda seconds: round(seconds * 1000, 3) if seconds is not None else None)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / wall_seconds, 2) if wall_seconds else None,
+        "mean_ms": to_ms(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_ms": to_ms(percentile(latencies, 50)),
+        "p95_ms": to_ms(percentile(latencies, 95)),
+        "p99_ms": to_ms(percentile(latencies, 99)),
+        "max_ms": to_ms(latencies[-1]) if latencies else None,
+    }
+
+
+def run_scenario(app, ctx, scenario, requests, concurrency, warmup=0, random_seed=42):
+    """Fire `requests` requests of one scenario from `concurrency` threads through the Flask test client.
+
+    Every request is built before the clock starts, so only the requests themselves are timed.
+    Returns the summary and a few of the unexpected responses.
+    """
+    rng = random.Random(f"{random_seed}:{scenario.name}")
+    with app.app_context():
+        prepared = [scenario.build(ctx, rng) for _ in range(warmup + requests)]
+
+    local = threading.local()
+    lock = threading.Lock()
+    latencies = []
+    failures = []
+
+    def fire(kwargs, timed):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        kwargs = dict(kwargs)
+        path = kwargs.pop("path")
+
+        started = time.perf_counter()
+        response = client.open(path, method=scenario.method, **kwargs)
+        # streamed bodies are only produced while they are read
+        body = response.get_data()
+        elapsed = time.perf_counter() - started
+        response.close()
+
+        if not timed:
+            return
+        with lock:
+            latencies.append(elapsed)
+            if response.status_code not in scenario.expected:
+                failures.append({"path": path, "status": response.status_code,
+                                 "body": body[:300].decode("utf-8", "replace")})
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda kwargs: fire(kwargs, False), prepared[:warmup]))
+        started = time.perf_counter()
+        list(pool.map(lambda kwargs: fire(kwargs, True), prepared[warmup:]))
+        wall_seconds = time.perf_counter() - started
+
+    return summarize(latencies, len(failures), wall_seconds), failures[:5]
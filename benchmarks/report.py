@@ -0,0 +1,50 @@
+import json
+
+
+def save(results, path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance=0.2, min_delta_ms=1.0):
+    """Regressions of results against a baseline run, an empty list when there are none.
+
+    A scenario regresses when its p95 or p99 grows by more than `tolerance` (and by at least
+    min_delta_ms, sub millisecond noise is ignored), when its throughput drops by more than
+    `tolerance`, or when it answers more unexpected statuses than the baseline did.
+    """
+    regressions = []
+    for name, current in sorted(results["scenarios"].items()):
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+
+        for key in ("p95_ms", "p99_ms"):
+            if current[key] is None or before[key] is None:
+                continue
+            if current[key] > before[key] * (1 + tolerance) and current[key] - before[key] >= min_delta_ms:
+                regressions.append(f"{name}: {key} {before[key]} -> {current[key]}")
+
+        if before["throughput_rps"] and current["throughput_rps"] is not None \
+                and current["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput_rps {before['throughput_rps']} -> {current['throughput_rps']}")
+
+        if current["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {current['errors']}")
+
+    return regressions
+
+
+def format_table(results):
+    columns = ("requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+    width = max([len(name) for name in results["scenarios"]] + [8])
+    lines = [f"{'scenario':<{width}}  " + "  ".join(f"{column:>14}" for column in columns)]
+    for name, summary in sorted(results["scenarios"].items()):
+        lines.append(f"{name:<{width}}  " + "  ".join(f"{str(summary[column]):>14}" for column in columns))
+    return "\n".join(lines)
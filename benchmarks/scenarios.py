@@ -0,0 +1,238 @@
+import io
+import json
+import uuid
+from datetime import datetime
+from flask_jwt_extended import create_access_token, create_refresh_token
+from resource import db
+from resource.models import Users, DishView
+from benchmarks.seed import BENCH_PASSWORD, ingredient_vocabulary, solid_png
+
+SCENARIOS = []
+
+
+class Scenario:
+    """One endpoint under load, build(ctx, rng) returns the keyword arguments of one test client request"""
+
+    def __init__(self, name, method, build, expected):
+        self.name = name
+        self.method = method
+        self.build = build
+        self.expected = expected
+
+
+def scenario(name, method, expected=(200, 201)):
+    def decorator(build):
+        SCENARIOS.append(Scenario(name, method, build, expected))
+        return build
+
+    return decorator
+
+
+class BenchContext:
+    """What the scenarios need to know about the seeded database, read once before a run"""
+
+    ADMIN_USER_ID = 1
+
+    def __init__(self, token_users=50):
+        self.max_dish_id = db.session.query(db.func.max(DishView.id)).scalar() or 0
+        self.user_count = db.session.query(db.func.count(Users.id)).scalar()
+        self.image_dish_ids = [dish_id for dish_id, in db.session.query(DishView.id)
+                               .filter(DishView.image_key.isnot(None)).limit(1000)]
+        self.user_ids = list(range(1, min(self.user_count, token_users) + 1))
+        self.refresh_tokens = {user_id: create_refresh_token(identity=user_id) for user_id in self.user_ids}
+        self.access_tokens = {user_id: create_access_token(identity=user_id) for user_id in self.user_ids}
+        self.ingredients = ingredient_vocabulary()
+        self.image = solid_png(128, (200, 80, 20))
+
+    def auth(self, rng, user_id=None):
+        user_id = user_id or rng.choice(self.user_ids)
+        return {"Authorization": f"Bearer {self.refresh_tokens[user_id]}"}
+
+    def dish_id(self, rng):
+        return rng.randint(1, self.max_dish_id)
+
+    def scratch_dish(self, rng, with_image=False):
+        """Insert a dish that a destructive scenario may change or delete, outside of the timed part"""
+        dish = DishView(name=f"Scratch {uuid.uuid4().hex[:8]}", Instructions="Boil and serve",
+                        Ingredients=rng.sample(self.ingredients, 4), date_posted=datetime.utcnow(),
+                        user_id=rng.choice(self.user_ids))
+        if with_image:
+            source = db.session.get(DishView, rng.choice(self.image_dish_ids))
+            dish.image_key = source.image_key
+            dish.image_size = source.image_size
+            dish.image_content_type = source.image_content_type
+        db.session.add(dish)
+        db.session.commit()
+        return dish.id
+
+
+# >>>>>>>>>>> user namespace <<<<<<<<<<<<<<
+
+@scenario("user.register", "POST")
+def register(ctx, rng):
+    email = f"{uuid.uuid4().hex}@bench.example.com"
+    return {"path": "/user/register", "json": {"id": 0, "firstname": "Load", "lastname": "Test", "email": email,
+                                               "password": BENCH_PASSWORD, "phone": "08000000000"}}
+
+
+@scenario("user.login", "POST")
+def login(ctx, rng):
+    user_id = rng.choice(ctx.user_ids)
+    return {"path": "/user/login", "json": {"email": f"bench{user_id - 1}@example.com", "password": BENCH_PASSWORD}}
+
+
+@scenario("user.welcome", "GET")
+def welcome(ctx, rng):
+    user_id = rng.choice(ctx.user_ids)
+    return {"path": "/user/welcome", "headers": {"Authorization": f"Bearer {ctx.access_tokens[user_id]}"}}
+
+
+@scenario("user.refresh", "POST")
+def refresh(ctx, rng):
+    return {"path": "/user/refresh", "headers": ctx.auth(rng)}
+
+
+@scenario("user.logout", "POST")
+def logout(ctx, rng):
+    # every logout revokes its token, so each one gets a fresh token
+    token = create_refresh_token(identity=rng.choice(ctx.user_ids))
+    return {"path": "/user/logout", "headers": {"Authorization": f"Bearer {token}"}}
+
+
+# >>>>>>>>>>> dish namespace <<<<<<<<<<<<<<
+
+@scenario("dish.create", "POST")
+def create_dish(ctx, rng):
+    return {"path": "/dish", "headers": ctx.auth(rng), "content_type": "multipart/form-data",
+            "data": {"name": "Bench Stew", "Instructions": "Simmer for an hour",
+                     "Ingredients": rng.sample(ctx.ingredients, 6),
+                     "dish_image_url": (io.BytesIO(ctx.image), "stew.png")}}
+
+
+@scenario("dish.list", "GET")
+def list_dishes(ctx, rng):
+    return {"path": "/dish/", "headers": ctx.auth(rng)}
+
+
+@scenario("dish.trending", "GET")
+def trending(ctx, rng):
+    return {"path": f"/dish/trending?limit={rng.choice((10, 50))}"}
+
+
+@scenario("dish.list_with_likes", "GET")
+def list_dishes_with_likes(ctx, rng):
+    return {"path": "/dish/?include_likes=1", "headers": ctx.auth(rng)}
+
+
+@scenario("dish.image_upload", "PUT")
+def upload_image(ctx, rng):
+    return {"path": f"/dish/image/{ctx.scratch_dish(rng)}/", "headers": ctx.auth(rng), "data": ctx.image,
+            "content_type": "application/octet-stream"}
+
+
+@scenario("dish.image_view", "GET")
+def view_image(ctx, rng):
+    return {"path": f"/dish/image/view/{rng.choice(ctx.image_dish_ids)}"}
+
+
+@scenario("dish.image_delete", "DELETE")
+def delete_image(ctx, rng):
+    return {"path": f"/dish/image/delete/{ctx.scratch_dish(rng, with_image=True)}", "headers": ctx.auth(rng)}
+
+
+@scenario("dish.like", "POST")
+def like(ctx, rng):
+    return {"path": f"/dish/likes/{ctx.dish_id(rng)}", "headers": ctx.auth(rng)}
+
+
+@scenario("dish.unlike", "DELETE")
+def unlike(ctx, rng):
+    return {"path": f"/dish/likes/{ctx.dish_id(rng)}", "headers": ctx.auth(rng)}
+
+
+@scenario("dish.by_user", "GET")
+def dishes_by_user(ctx, rng):
+    return {"path": f"/dish/user/{rng.randint(1, ctx.user_count)}", "headers": ctx.auth(rng)}
+
+
+@scenario("dish.update", "PUT")
+def update_dish(ctx, rng):
+    return {"path": f"/dish/{ctx.scratch_dish(rng)}", "headers": ctx.auth(rng),
+            "json": {"name": "Updated Stew", "Instructions": "Simmer for two hours",
+                     "Ingredients": rng.sample(ctx.ingredients, 5)}}
+
+
+@scenario("dish.delete", "DELETE")
+def delete_dish(ctx, rng):
+    return {"path": f"/dish/delete/{ctx.scratch_dish(rng)}", "headers": ctx.auth(rng)}
+
+
+@scenario("dish.detail", "GET")
+def dish_detail(ctx, rng):
+    return {"path": f"/dish/dishes/{ctx.dish_id(rng)}"}
+
+
+@scenario("dish.search_ingredients", "GET")
+def search_ingredients(ctx, rng):
+    terms = ",".join(rng.sample(ctx.ingredients[:40], 2))
+    return {"path": f"/dish/search/ingredients?ingredients={terms}&mode={rng.choice(('all', 'any', 'most'))}",
+            "headers": ctx.auth(rng)}
+
+
+@scenario("dish.search", "GET")
+def search_text(ctx, rng):
+    return {"path": f"/dish/search?q={rng.choice(ctx.ingredients).split()[-1]}", "headers": ctx.auth(rng)}
+
+
+@scenario("dish.autocomplete", "GET")
+def autocomplete(ctx, rng):
+    return {"path": f"/dish/autocomplete?prefix={rng.choice(('j', 'st', 'sou', 'gr', 'pe', 'roa'))}",
+            "headers": ctx.auth(rng)}
+
+
+@scenario("dish.popular_ingredients", "GET")
+def popular_ingredients(ctx, rng):
+    return {"path": f"/dish/ingredients/popular?limit={rng.choice((10, 20, 50))}"}
+
+
+@scenario("dish.similar", "GET")
+def similar_dishes(ctx, rng):
+    return {"path": f"/dish/{ctx.dish_id(rng)}/similar", "headers": ctx.auth(rng)}
+
+
+@scenario("dish.feed", "GET")
+def feed(ctx, rng):
+    return {"path": "/dish/feed", "headers": ctx.auth(rng)}
+
+
+@scenario("dish.bulk_export", "GET")
+def bulk_export(ctx, rng):
+    after_id = max(0, ctx.dish_id(rng) - 500)
+    return {"path": f"/dish/bulk?after_id={after_id}", "headers": ctx.auth(rng, ctx.ADMIN_USER_ID)}
+
+
+@scenario("dish.bulk_import", "POST")
+def bulk_import(ctx, rng):
+    lines = (json.dumps({"name": "Imported Soup", "Instructions": "Stir well",
+                         "Ingredients": rng.sample(ctx.ingredients, 5), "user_id": rng.choice(ctx.user_ids)})
+             for _ in range(100))
+    return {"path": "/dish/bulk", "headers": ctx.auth(rng, ctx.ADMIN_USER_ID),
+            "data": "\n".join(lines) + "\n", "content_type": "application/x-ndjson"}
+
+
+@scenario("dish.batch_get", "POST")
+def batch_get(ctx, rng):
+    return {"path": "/dish/batch/get", "json": {"ids": [ctx.dish_id(rng) for _ in range(20)]}}
+
+
+@scenario("dish.batch_likes", "POST")
+def batch_likes(ctx, rng):
+    ids = list({ctx.dish_id(rng) for _ in range(20)})
+    return {"path": "/dish/batch/likes", "headers": ctx.auth(rng),
+            "json": {"like": ids[:len(ids) // 2], "unlike": ids[len(ids) // 2:]}}
+
+
+@scenario("dish.batch_delete", "POST")
+def batch_delete(ctx, rng):
+    return {"path": "/dish/batch/delete", "headers": ctx.auth(rng),
+            "json": {"ids": [ctx.scratch_dish(rng) for _ in range(5)]}}
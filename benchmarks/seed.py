@@ -0,0 +1,133 @@
+import random
+import struct
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from resource import db, bcrypt, image_store, ingredient_index, name_index, recommender, trending, \
+    catalog_snapshot, ingredient_dictionary
+from resource.bulk import write_batch
+from resource.models import Users, DishView, likes
+
+SCALES = {"1k": 1000, "100k": 100000, "1m": 1000000}
+
+BENCH_PASSWORD = "bench-password"
+
+_BASES = ["rice", "beans", "chicken", "beef", "pork", "fish", "shrimp", "egg", "tomato", "onion", "garlic",
+          "pepper", "yam", "plantain", "cassava", "spinach", "okra", "carrot", "potato", "flour", "milk",
+          "butter", "cheese", "lentils", "corn", "ginger", "lemon", "coconut", "peanut", "mushroom"]
+_KINDS = ["", "red", "green", "smoked", "dried", "fresh", "ground", "sweet", "hot", "wild"]
+_WORDS = ["jollof", "stew", "soup", "pie", "curry", "salad", "fried", "grilled", "roast", "spicy", "pepper",
+          "egusi", "moimoi", "puff", "pottage", "sauce", "bowl", "wrap", "bake", "toast", "rolls"]
+
+
+def ingredient_vocabulary():
+    return [f"{kind} {base}".strip() for base in _BASES for kind in _KINDS]
+
+
+def zipf_weights(count, skew=1.0):
+    """Cumulative weights where the item of rank r is picked ~1/r**skew as often as the first, like real ingredients"""
+    total = 0
+    weights = []
+    for rank in range(1, count + 1):
+        total += 1 / rank ** skew
+        weights.append(total)
+    return weights
+
+
+def solid_png(size, color):
+    """A size x size PNG of one color, built without Pillow"""
+    row = b"\x00" + bytes(color) * size
+    raw = zlib.compress(row * size)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", raw) + chunk(b"IEND", b"")
+
+
+def seed(dishes, likes_per_dish=5, image_fraction=0.3, batch_size=5000, random_seed=42, echo=print):
+    """Fill an empty database with users, dishes, images and likes, the same data for the same arguments.
+
+    Returns False when the database already has dishes.
+    """
+    if db.session.query(DishView.id).first() is not None:
+        return False
+
+    rng = random.Random(random_seed)
+    vocabulary = ingredient_vocabulary()
+    rng.shuffle(vocabulary)
+    weights = zipf_weights(len(vocabulary))
+    ingredient_dictionary.reset()
+    ingredient_ids = dict(zip(vocabulary, ingredient_dictionary.ids(vocabulary)))
+    users = max(10, dishes // 10)
+    password = bcrypt.generate_password_hash(BENCH_PASSWORD).decode("utf-8")
+
+    for start in range(0, users, batch_size):
+        db.session.execute(insert(Users), [
+            {"firstname": f"Bench{i}", "lastname": "User", "email": f"bench{i}@example.com",
+             "password": password, "phone": f"080{i:08d}"}
+            for i in range(start, min(users, start + batch_size))
+        ])
+        db.session.commit()
+    echo(f"{users} users")
+
+    images = []
+    for i in range(20):
+        data = solid_png(rng.choice((64, 256, 640)), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        images.append((image_store.put(data), len(data)))
+
+    now = datetime.utcnow()
+    oldest = now - timedelta(days=730)
+    table = DishView.__table__
+    for start in range(0, dishes, batch_size):
+        rows = []
+        for _ in range(min(batch_size, dishes - start)):
+            ingredients = sorted(set(rng.choices(vocabulary, cum_weights=weights, k=rng.randint(3, 12))))
+            image = rng.choice(images) if rng.random() < image_fraction else None
+            date_posted = oldest + timedelta(seconds=rng.randrange(730 * 86400))
+            rows.append({
+                "name": " ".join(rng.choice(_WORDS) for _ in range(rng.randint(1, 3))).title(),
+                "Instructions": " ".join(rng.choice(_WORDS + _BASES) for _ in range(rng.randint(10, 60))),
+                "ingredient_ids": [ingredient_ids[name] for name in ingredients],
+                "ingredient_labels": None,
+                "date_posted": date_posted,
+                "user_id": rng.randint(1, users),
+                "like_count": min(users, int(rng.paretovariate(1.5) * likes_per_dish / 3)),
+                # replaced once the likes are in
+                "trending_score": trending.initial_score(date_posted),
+                "image_key": image[0] if image else None,
+                "image_size": image[1] if image else None,
+                "image_content_type": "image/png" if image else None,
+            })
+        write_batch(db.session, table, rows)
+        db.session.commit()
+        echo(f"{start + len(rows)} dishes")
+
+    # likes follow the like_count of each dish and are given some time after it was posted
+    last_id = 0
+    total = 0
+    while True:
+        counts = db.session.query(DishView.id, DishView.like_count, DishView.date_posted) \
+            .filter(DishView.id > last_id).order_by(DishView.id).limit(batch_size).all()
+        if not counts:
+            break
+        rows = [{"user.id": user_id, "dishview.id": dish_id,
+                 "created_at": date_posted + (now - date_posted) * rng.random() ** 3}
+                for dish_id, like_count, date_posted in counts
+                for user_id in rng.sample(range(1, users + 1), like_count)]
+        if rows:
+            db.session.execute(insert(likes), rows)
+            db.session.commit()
+        total += len(rows)
+        last_id = counts[-1][0]
+    echo(f"{total} likes")
+
+    trending.recompute_all(db.session, batch_size)
+    echo("trending scores")
+
+    ingredient_index.reset()
+    name_index.reset()
+    recommender.reset()
+    catalog_snapshot.reset()
+    return True
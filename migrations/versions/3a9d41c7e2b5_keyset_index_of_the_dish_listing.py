@@ -0,0 +1,24 @@
+"""keyset index of the dish listing
+
+Revision ID: 3a9d41c7e2b5
+Revises: 6c2f0e8b1d3a
+Create Date: 2026-10-18 11:32:37.104552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a9d41c7e2b5'
+down_revision = '6c2f0e8b1d3a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_dishview_date_posted_id', 'dishview', ['date_posted', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_dishview_date_posted_id', table_name='dishview')
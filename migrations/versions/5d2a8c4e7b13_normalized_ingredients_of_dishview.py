@@ -0,0 +1,39 @@
+"""normalized ingredients of dishview
+
+Revision ID: 5d2a8c4e7b13
+Revises: e41b8c6d9f27
+Create Date: 2026-10-18 11:37:40.162583
+
+Existing dishes get a NULL ingredients_normalized, `flask normalize-ingredients` fills it in.
+The GIN index only exists on postgres, SQLite searches through the in-process index.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2a8c4e7b13'
+down_revision = 'e41b8c6d9f27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('dishview') as batch_op:
+        batch_op.add_column(sa.Column('ingredients_normalized',
+                                      postgresql.ARRAY(sa.String()).with_variant(sa.JSON(), 'sqlite'),
+                                      nullable=True))
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.create_index('ix_dishview_ingredients_normalized', 'dishview', ['ingredients_normalized'],
+                        unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_dishview_ingredients_normalized', table_name='dishview', postgresql_using='gin')
+
+    with op.batch_alter_table('dishview') as batch_op:
+        batch_op.drop_column('ingredients_normalized')
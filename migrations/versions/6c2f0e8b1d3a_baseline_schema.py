@@ -0,0 +1,88 @@
+"""baseline schema
+
+Revision ID: 6c2f0e8b1d3a
+Revises:
+Create Date: 2026-10-18 11:30:12.418301
+
+The tables as the app created them with db.create_all() before there were migrations. A database
+created back then already has them, it is marked with `flask db stamp 6c2f0e8b1d3a` instead of
+running this revision.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '6c2f0e8b1d3a'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+StringArray = postgresql.ARRAY(sa.String()).with_variant(sa.JSON(), "sqlite")
+
+
+def upgrade():
+    op.create_table(
+        'user_sign_up',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('firstname', sa.String(length=255), nullable=False),
+        sa.Column('lastname', sa.String(length=255), nullable=False),
+        sa.Column('email', sa.String(length=255), nullable=False),
+        sa.Column('password', sa.String(length=255), nullable=False),
+        sa.Column('phone', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email')
+    )
+    op.create_table(
+        'dish',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('Instructions', sa.String(length=500), nullable=False),
+        sa.Column('Ingredients', StringArray, nullable=False),
+        sa.Column('date_posted', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'dishview',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('Instructions', sa.String(length=500), nullable=False),
+        sa.Column('Ingredients', StringArray, nullable=False),
+        sa.Column('date_posted', sa.DateTime(), nullable=False),
+        sa.Column('dish_image_url', sa.LargeBinary(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user_sign_up.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'likes',
+        sa.Column('user.id', sa.Integer(), nullable=False),
+        sa.Column('dishview.id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['dishview.id'], ['dishview.id']),
+        sa.ForeignKeyConstraint(['user.id'], ['user_sign_up.id']),
+        sa.PrimaryKeyConstraint('user.id', 'dishview.id')
+    )
+    op.create_table(
+        'user_login',
+        sa.Column('email', sa.String(length=255), nullable=False),
+        sa.Column('password', sa.String(length=255), nullable=False),
+        sa.PrimaryKeyConstraint('email')
+    )
+    op.create_table(
+        'revoke_token',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('jti', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('jti')
+    )
+
+
+def downgrade():
+    op.drop_table('revoke_token')
+    op.drop_table('user_login')
+    op.drop_table('likes')
+    op.drop_table('dishview')
+    op.drop_table('dish')
+    op.drop_table('user_sign_up')
@@ -0,0 +1,73 @@
+"""search vector of dishview and the catalog change log
+
+Revision ID: 9c4f2e6a8d10
+Revises: 5d2a8c4e7b13
+Create Date: 2026-10-18 11:38:34.518204
+
+On postgres the trigger fills search_vector for new and updated rows, `flask setup-search`
+backfills the existing ones in batches. catalog_changes may already exist on databases the app
+created with create_all.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4f2e6a8d10'
+down_revision = '5d2a8c4e7b13'
+branch_labels = None
+depends_on = None
+
+SEARCH_VECTOR_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION dishview_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW."Instructions", '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS dishview_search_vector_trigger ON dishview",
+    """
+    CREATE TRIGGER dishview_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, "Instructions" ON dishview
+    FOR EACH ROW EXECUTE FUNCTION dishview_search_vector_update()
+    """,
+]
+
+
+def upgrade():
+    postgres = op.get_bind().dialect.name == 'postgresql'
+
+    with op.batch_alter_table('dishview') as batch_op:
+        batch_op.add_column(sa.Column('search_vector', postgresql.TSVECTOR().with_variant(sa.Text(), 'sqlite'),
+                                      nullable=True))
+    if postgres:
+        op.create_index('ix_dishview_search_vector', 'dishview', ['search_vector'], unique=False,
+                        postgresql_using='gin')
+        for statement in SEARCH_VECTOR_DDL:
+            op.execute(statement)
+
+    if not sa.inspect(op.get_bind()).has_table('catalog_changes'):
+        op.create_table('catalog_changes',
+                        sa.Column('id', sa.Integer(), nullable=False),
+                        sa.Column('dish_id', sa.Integer(), nullable=False),
+                        sa.Column('created_at', sa.DateTime(), nullable=False),
+                        sa.PrimaryKeyConstraint('id'))
+        op.create_index('ix_catalog_changes_created_at', 'catalog_changes', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_catalog_changes_created_at', table_name='catalog_changes')
+    op.drop_table('catalog_changes')
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP TRIGGER IF EXISTS dishview_search_vector_trigger ON dishview")
+        op.execute("DROP FUNCTION IF EXISTS dishview_search_vector_update()")
+        op.drop_index('ix_dishview_search_vector', table_name='dishview', postgresql_using='gin')
+    with op.batch_alter_table('dishview') as batch_op:
+        batch_op.drop_column('search_vector')
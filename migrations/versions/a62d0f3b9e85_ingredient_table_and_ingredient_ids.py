@@ -0,0 +1,87 @@
+"""ingredient table and ingredient ids of dishview
+
+Revision ID: a62d0f3b9e85
+Revises: f3a7c9e1b258
+Create Date: 2026-10-18 12:20:18.204317
+
+Existing dishes get a NULL ingredient_ids and keep their names in "Ingredients", which the app
+reads as a fallback, `flask migrate-ingredients` converts them in batches. ingredients_normalized
+is superseded by the ids and dropped. The GIN index only exists on postgres, SQLite searches
+through the in-process index. A downgrade writes the names of the converted dishes back to
+"Ingredients" and leaves ingredients_normalized NULL for `flask normalize-ingredients`.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a62d0f3b9e85'
+down_revision = 'f3a7c9e1b258'
+branch_labels = None
+depends_on = None
+
+StringArray = postgresql.ARRAY(sa.String()).with_variant(sa.JSON(), 'sqlite')
+IntegerArray = postgresql.ARRAY(sa.Integer()).with_variant(sa.JSON(), 'sqlite')
+
+
+def upgrade():
+    op.create_table(
+        'ingredient',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('display_name', sa.String(length=255), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name'),
+    )
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_dishview_ingredients_normalized', table_name='dishview', postgresql_using='gin')
+
+    with op.batch_alter_table('dishview') as batch_op:
+        batch_op.add_column(sa.Column('ingredient_ids', IntegerArray, nullable=True))
+        batch_op.add_column(sa.Column('ingredient_labels', StringArray, nullable=True))
+        batch_op.alter_column('Ingredients', existing_type=StringArray, nullable=True)
+        batch_op.drop_column('ingredients_normalized')
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.create_index('ix_dishview_ingredient_ids', 'dishview', ['ingredient_ids'],
+                        unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    # the converted rows get their names back before the column is required again, every row has
+    # either ids or legacy names
+    connection = op.get_bind()
+    dishview = sa.table('dishview', sa.column('id', sa.Integer), sa.column('ingredient_ids', IntegerArray),
+                        sa.column('ingredient_labels', StringArray), sa.column('Ingredients', StringArray))
+    names = dict(connection.execute(sa.text('SELECT id, coalesce(display_name, name) FROM ingredient')).all())
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.select(dishview.c.id, dishview.c.ingredient_ids, dishview.c.ingredient_labels)
+                                  .where(dishview.c.id > last_id, dishview.c.ingredient_ids.isnot(None))
+                                  .order_by(dishview.c.id).limit(1000)).all()
+        if not rows:
+            break
+        connection.execute(
+            dishview.update().where(dishview.c.id == sa.bindparam('dish_id')),
+            [{'dish_id': dish_id,
+              'Ingredients': labels if labels is not None else [names[i] for i in ingredient_ids if i in names]}
+             for dish_id, ingredient_ids, labels in rows])
+        last_id = rows[-1].id
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_dishview_ingredient_ids', table_name='dishview', postgresql_using='gin')
+
+    with op.batch_alter_table('dishview') as batch_op:
+        batch_op.add_column(sa.Column('ingredients_normalized', StringArray, nullable=True))
+        batch_op.alter_column('Ingredients', existing_type=StringArray, nullable=False)
+        batch_op.drop_column('ingredient_labels')
+        batch_op.drop_column('ingredient_ids')
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.create_index('ix_dishview_ingredients_normalized', 'dishview', ['ingredients_normalized'],
+                        unique=False, postgresql_using='gin')
+
+    op.drop_table('ingredient')
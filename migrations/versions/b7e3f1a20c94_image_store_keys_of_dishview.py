@@ -0,0 +1,32 @@
+"""image store keys of dishview
+
+Revision ID: b7e3f1a20c94
+Revises: 3a9d41c7e2b5
+Create Date: 2026-10-18 11:33:13.552907
+
+The image bytes stay in dish_image_url until `flask migrate-images` moves them to the store.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3f1a20c94'
+down_revision = '3a9d41c7e2b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('dishview') as batch_op:
+        batch_op.add_column(sa.Column('image_key', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('image_size', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('image_content_type', sa.String(length=100), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('dishview') as batch_op:
+        batch_op.drop_column('image_content_type')
+        batch_op.drop_column('image_size')
+        batch_op.drop_column('image_key')
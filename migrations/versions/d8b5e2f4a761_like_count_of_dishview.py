@@ -0,0 +1,31 @@
+"""like count of dishview
+
+Revision ID: d8b5e2f4a761
+Revises: 9c4f2e6a8d10
+Create Date: 2026-10-18 11:39:27.094415
+
+The counters of existing dishes are filled from the likes table, same as `flask recount-likes`.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8b5e2f4a761'
+down_revision = '9c4f2e6a8d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('dishview') as batch_op:
+        batch_op.add_column(sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute('UPDATE dishview SET like_count = '
+               '(SELECT count(*) FROM likes WHERE likes."dishview.id" = dishview.id)')
+
+
+def downgrade():
+    with op.batch_alter_table('dishview') as batch_op:
+        batch_op.drop_column('like_count')
@@ -0,0 +1,32 @@
+"""expiry of revoked tokens
+
+Revision ID: e41b8c6d9f27
+Revises: b7e3f1a20c94
+Create Date: 2026-10-18 11:36:33.780214
+
+Rows revoked before this revision keep a NULL expires_at, `flask purge-revoked-tokens` leaves them.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41b8c6d9f27'
+down_revision = 'b7e3f1a20c94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('revoke_token') as batch_op:
+        batch_op.add_column(sa.Column('expires_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_revoke_token_created_at', ['created_at'], unique=False)
+        batch_op.create_index('ix_revoke_token_expires_at', ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('revoke_token') as batch_op:
+        batch_op.drop_index('ix_revoke_token_expires_at')
+        batch_op.drop_index('ix_revoke_token_created_at')
+        batch_op.drop_column('expires_at')
@@ -0,0 +1,60 @@
+"""trending score of dishview
+
+Revision ID: f3a7c9e1b258
+Revises: d8b5e2f4a761
+Create Date: 2026-10-18 12:02:41.518203
+
+The likes given so far have no created_at, they count as given when the dish was posted, so the
+score of an existing dish is its initial score plus log(1 + like_count). `flask recompute-trending`
+writes the same.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a7c9e1b258'
+down_revision = 'd8b5e2f4a761'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('likes') as batch_op:
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_likes_dishview_id', ['dishview.id'], unique=False)
+
+    with op.batch_alter_table('dishview') as batch_op:
+        batch_op.add_column(sa.Column('trending_score', sa.Float(), server_default='0', nullable=False))
+        batch_op.create_index('ix_dishview_trending_score_id', ['trending_score', 'id'], unique=False)
+
+    # the scores use the half life of the app running the upgrade
+    trending = current_app.extensions['trending']
+    dishview = sa.table('dishview', sa.column('id', sa.Integer), sa.column('date_posted', sa.DateTime),
+                        sa.column('like_count', sa.Integer), sa.column('trending_score', sa.Float))
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.select(dishview.c.id, dishview.c.date_posted, dishview.c.like_count)
+                                  .where(dishview.c.id > last_id).order_by(dishview.c.id).limit(1000)).all()
+        if not rows:
+            break
+        connection.execute(
+            dishview.update().where(dishview.c.id == sa.bindparam('dish_id')),
+            [{'dish_id': dish_id,
+              'trending_score': trending.updated_score(trending.initial_score(date_posted),
+                                                       [date_posted] * like_count)}
+             for dish_id, date_posted, like_count in rows])
+        last_id = rows[-1].id
+
+
+def downgrade():
+    with op.batch_alter_table('dishview') as batch_op:
+        batch_op.drop_index('ix_dishview_trending_score_id')
+        batch_op.drop_column('trending_score')
+
+    with op.batch_alter_table('likes') as batch_op:
+        batch_op.drop_index('ix_likes_dishview_id')
+        batch_op.drop_column('created_at')
@@ -0,0 +1,167 @@
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+from flask import Request, current_app
+from sqlalchemy import insert
+from resource.storage import sniff_image_type
+
+# dishview columns written by an import, in COPY order
+IMPORT_COLUMNS = ["name", "Instructions", "ingredient_ids", "ingredient_labels", "date_posted", "user_id",
+                  "like_count", "trending_score", "image_key", "image_size", "image_content_type"]
+
+
+class BulkRequest(Request):
+    """Request class that lets the bulk import body go past MAX_CONTENT_LENGTH, it is read line by line"""
+
+    @property
+    def max_content_length(self):
+        if self.endpoint == "dish_bulk":
+            return current_app.config["BULK_MAX_CONTENT_LENGTH"]
+        return super().max_content_length
+
+
+class BulkRowError(ValueError):
+    """A line of an import that can not be turned into a dish"""
+
+
+def parse_row(line, image_store, trending, ingredient_dictionary):
+    """Validate one NDJSON line of an import and turn it into a dict of dishview columns"""
+    try:
+        data = json.loads(line)
+    except ValueError:
+        raise BulkRowError("Invalid JSON")
+    if not isinstance(data, dict):
+        raise BulkRowError("Expected a JSON object")
+
+    name = data.get("name")
+    instructions = data.get("Instructions")
+    ingredients = data.get("Ingredients")
+    if not isinstance(name, str) or not name or len(name) > 255:
+        raise BulkRowError("name must be a string of 1 to 255 characters")
+    if not isinstance(instructions, str) or not instructions or len(instructions) > 500:
+        raise BulkRowError("Instructions must be a string of 1 to 500 characters")
+    if not isinstance(ingredients, list) or not ingredients or not all(isinstance(i, str) for i in ingredients):
+        raise BulkRowError("Ingredients must be a non empty list of strings")
+
+    try:
+        date_posted = datetime.fromisoformat(data["date_posted"]) if data.get("date_posted") \
+            else datetime.utcnow()
+    except (TypeError, ValueError):
+        raise BulkRowError("date_posted must be an ISO 8601 date")
+
+    # new ingredients are committed here, before the batch, like the images
+    ingredient_ids, ingredient_labels = ingredient_dictionary.encode(ingredients)
+    row = {
+        "name": name,
+        "Instructions": instructions,
+        "ingredient_ids": ingredient_ids,
+        "ingredient_labels": ingredient_labels,
+        "date_posted": date_posted,
+        "user_id": data.get("user_id"),
+        "like_count": 0,
+        "trending_score": trending.initial_score(date_posted),
+        "image_key": None,
+        "image_size": None,
+        "image_content_type": None,
+    }
+
+    if data.get("dish_image"):
+        try:
+            image = base64.b64decode(data["dish_image"])
+        except Exception:
+            raise BulkRowError("Invalid image data")
+        content_type = sniff_image_type(image[:32])
+        if content_type is None:
+            raise BulkRowError("Unsupported image type")
+        row.update(image_key=image_store.put(image), image_size=len(image), image_content_type=content_type)
+    elif data.get("image_key"):
+        # an export of the same image store refers to its blobs by key
+        if not image_store.exists(data["image_key"]):
+            raise BulkRowError(f"Unknown image_key {data['image_key']}")
+        row.update(image_key=data["image_key"], image_size=data.get("image_size"),
+                   image_content_type=data.get("image_content_type"))
+
+    return row
+
+
+def _pg_array(values):
+    """Postgres array literal of integers, e.g. {3,17}"""
+    return "{" + ",".join(str(int(value)) for value in values) + "}"
+
+
+def _pg_text_array(values):
+    """Postgres array literal of strings, every element quoted, e.g. {"Eggs","eggs"}"""
+    return "{" + ",".join('"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"' for value in values) + "}"
+
+
+def _csv_value(column, value):
+    if value is None:
+        return ""
+    if column == "ingredient_ids":
+        return _pg_array(value)
+    if column == "ingredient_labels":
+        return _pg_text_array(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def copy_rows(session, table, rows):
+    """Write rows with a single COPY ... FROM STDIN inside the session's transaction"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_csv_value(column, row[column]) for column in IMPORT_COLUMNS])
+    buffer.seek(0)
+
+    columns = ", ".join(f'"{column}"' for column in IMPORT_COLUMNS)
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table.name} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def insert_rows(session, table, rows):
+    """executemany fallback for databases without COPY"""
+    session.execute(insert(table), rows)
+
+
+def write_batch(session, table, rows):
+    if session.get_bind().dialect.name == "postgresql":
+        copy_rows(session, table, rows)
+    else:
+        insert_rows(session, table, rows)
+
+
+def write_rows_one_by_one(session, table, numbered_rows):
+    """Insert a failed batch row by row in savepoints, returns the (line, error) of the rows that fail"""
+    errors = []
+    for line_number, row in numbered_rows:
+        try:
+            with session.begin_nested():
+                insert_rows(session, table, [row])
+        except Exception as e:
+            errors.append((line_number, str(getattr(e, "orig", e))))
+    return errors
+
+
+def export_row(dish, image_store, include_images):
+    row = {
+        "id": dish.id,
+        "name": dish.name,
+        "Instructions": dish.Instructions,
+        "Ingredients": dish.Ingredients,
+        "date_posted": dish.date_posted.isoformat(),
+        "user_id": dish.user_id,
+        "like_count": dish.like_count,
+        "image_key": dish.image_key,
+        "image_size": dish.image_size,
+        "image_content_type": dish.image_content_type,
+    }
+    if include_images and dish.image_key and image_store.exists(dish.image_key):
+        with open(image_store.path(dish.image_key), "rb") as f:
+            row["dish_image"] = base64.b64encode(f.read()).decode("ascii")
+    return row
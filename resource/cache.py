@@ -0,0 +1,216 @@
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import request, Response
+from resource.serializers import dumps
+
+
+class LocalCacheBackend:
+    """LRU dict with a TTL, private to one worker process"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class FileCacheBackend:
+    """One JSON file per key in a directory that every gunicorn worker on the host shares.
+
+    Files are only unlinked by the reader that finds them expired, so once per TTL one of the
+    workers also sweeps the directory for files nobody read again, their mtime tells when they
+    were written. The mtime of the SWEEP_MARKER file tells the workers when the last sweep ran.
+    """
+
+    SWEEP_MARKER = ".swept"
+
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                expires, value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if expires < time.time():
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            return None
+        return value
+
+    def set(self, key, value):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump([time.time() + self.ttl, value], f)
+        os.replace(tmp_path, self._path(key))
+        self._maybe_sweep()
+
+    def _maybe_sweep(self):
+        marker = os.path.join(self.directory, self.SWEEP_MARKER)
+        now = time.time()
+        try:
+            if os.stat(marker).st_mtime + self.ttl > now:
+                return
+        except FileNotFoundError:
+            pass
+        # the others see the fresh mtime, two workers racing here both sweep, which is harmless
+        with open(marker, "a"):
+            os.utime(marker, (now, now))
+        self.sweep(now)
+
+    def sweep(self, now=None):
+        """Unlink the entries (and left over temporary files) written more than a TTL ago"""
+        deadline = (now or time.time()) - self.ttl
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.name != self.SWEEP_MARKER and entry.stat().st_mtime < deadline:
+                        os.unlink(entry.path)
+                        removed += 1
+                except OSError:
+                    # read or removed by another worker meanwhile
+                    pass
+        return removed
+
+
+class ResponseCache:
+    """Caches whole GET responses under a versioned ETag.
+
+    Every cached response depends on one or more scopes such as "dish:5" or "user:2". Each scope
+    has a version token in the backend, and the ETag is derived from the URL and the versions of
+    its scopes. invalidate() replaces the version tokens, so every response built on the old data
+    stops matching at once without hunting down its entries. The entry of a URL is stored under
+    the URL with its ETag inside, a new version overwrites it instead of leaving it behind.
+
+    The version tokens are only as shared as the backend. The default "filesystem" backend is seen
+    by every worker of the host, so a write through one worker invalidates the responses all of
+    them cached. The "local" backend is private to a worker, the others keep serving what they
+    cached until RESPONSE_CACHE_TTL runs out, it is only meant for a single worker.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("RESPONSE_CACHE_BACKEND", "filesystem")
+        app.config.setdefault("RESPONSE_CACHE_TTL", 60)
+        app.config.setdefault("RESPONSE_CACHE_MAX_ENTRIES", 10000)
+        app.config.setdefault("RESPONSE_CACHE_DIR", os.path.join(app.instance_path, "response_cache"))
+
+        backend = app.config["RESPONSE_CACHE_BACKEND"]
+        ttl = app.config["RESPONSE_CACHE_TTL"]
+        if backend == "local":
+            self.backend = LocalCacheBackend(app.config["RESPONSE_CACHE_MAX_ENTRIES"], ttl)
+        elif backend == "filesystem":
+            self.backend = FileCacheBackend(app.config["RESPONSE_CACHE_DIR"], ttl)
+        elif backend == "none":
+            self.backend = None
+        else:
+            raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND {backend}")
+        app.extensions["response_cache"] = self
+
+    def version(self, scope):
+        key = f"version:{scope}"
+        version = self.backend.get(key)
+        if version is None:
+            version = uuid.uuid4().hex
+            self.backend.set(key, version)
+        return version
+
+    def invalidate(self, *scopes):
+        if self.backend is None:
+            return
+        for scope in scopes:
+            self.backend.set(f"version:{scope}", uuid.uuid4().hex)
+
+    def cached(self, scopes):
+        """Decorator for Resource.get methods, scopes is called with the view args and returns the scope names"""
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(resource, *args, **kwargs):
+                if self.backend is None:
+                    return fn(resource, *args, **kwargs)
+
+                versions = [f"{scope}={self.version(scope)}" for scope in scopes(**kwargs)]
+                # Accept can switch the response format and X-Fields the fields in it
+                key = "|".join([request.full_path, request.headers.get("Accept", ""),
+                                request.headers.get("X-Fields", "")])
+                etag = hashlib.sha1("|".join([key] + versions).encode("utf-8")).hexdigest()
+
+                if request.if_none_match.contains(etag):
+                    response = Response(status=304)
+                    response.set_etag(etag)
+                    return response
+
+                entry = self.backend.get(f"response:{key}")
+                if entry is None or entry["etag"] != etag:
+                    result = fn(resource, *args, **kwargs)
+                    entry = self._entry(result)
+                    if entry is None:
+                        # errors and other non 200 answers are not cached
+                        return result
+                    entry["etag"] = etag
+                    self.backend.set(f"response:{key}", entry)
+
+                response = Response(entry["body"], status=200, mimetype=entry["mimetype"])
+                response.set_etag(etag)
+                return response
+
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def _entry(result):
+        status = 200
+        if isinstance(result, tuple):
+            result, status = result[0], result[1]
+
+        if isinstance(result, Response):
+            # reading a streamed body here would buffer all of it
+            if result.is_streamed or result.status_code != 200 or status != 200:
+                return None
+            return {"body": result.get_data(as_text=True), "mimetype": result.mimetype}
+
+        if status != 200:
+            return None
+        return {"body": dumps(result) + "\n", "mimetype": "application/json"}
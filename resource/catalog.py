@@ -0,0 +1,341 @@
+import bisect
+import os
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+from sqlalchemy import func
+
+
+def load_rows(session, columns, dish_ids):
+    """(rows, ids no longer in the table) of some dishes, the first column must be DishView.id"""
+    from resource.models import DishView
+
+    dish_ids = list(dish_ids)
+    rows, missing = [], []
+    for start in range(0, len(dish_ids), 500):
+        chunk = dish_ids[start:start + 500]
+        found = session.query(*columns).filter(DishView.id.in_(chunk)).all()
+        rows.extend(found)
+        found_ids = {row[0] for row in found}
+        missing.extend(dish_id for dish_id in chunk if dish_id not in found_ids)
+    return rows, missing
+
+
+def log_changes(session, dish_ids):
+    """Record changed or deleted dishes for the other workers, inside the caller's transaction"""
+    if not dish_ids:
+        return
+    from resource.models import CatalogChange
+
+    now = datetime.utcnow()
+    session.add_all([CatalogChange(dish_id=dish_id, created_at=now) for dish_id in dish_ids])
+
+
+def purge_changes(session, retention_seconds):
+    """Delete the log entries older than retention_seconds, returns how many"""
+    from resource.models import CatalogChange
+
+    cutoff = datetime.utcnow() - timedelta(seconds=retention_seconds)
+    deleted = session.query(CatalogChange).filter(CatalogChange.created_at < cutoff) \
+        .delete(synchronize_session=False)
+    session.commit()
+    return deleted
+
+
+class ChangeFeed:
+    """The dishes created, changed or deleted since the last poll, for the per worker copies of
+    the dishview table (the search and autocomplete indexes).
+
+    New dishes are found by an id watermark, which also covers rows written outside the handlers,
+    changed and deleted ones through the catalog_changes log the write handlers append to in their
+    own transaction. Each poll re-reads the last CATALOG_LOG_GRACE_SECONDS of the log so entries
+    committed late, or not replicated yet, are not missed.
+    """
+
+    def __init__(self):
+        self.dish_watermark = 0
+        self._log_watermark = None
+
+    def start(self, session):
+        """Take the watermarks, before the owner reads the table, so nothing written meanwhile is missed"""
+        from resource.models import CatalogChange, DishView
+
+        self._log_watermark = session.query(func.max(CatalogChange.created_at)).scalar()
+        self.dish_watermark = session.query(func.max(DishView.id)).scalar() or 0
+
+    def poll(self, session):
+        """Ids of the dishes created since the last poll and of the ones logged as changed or deleted"""
+        from flask import current_app
+        from resource.models import CatalogChange, DishView
+
+        dish_ids = set()
+        for dish_id, in session.query(DishView.id).filter(DishView.id > self.dish_watermark):
+            dish_ids.add(dish_id)
+            self.dish_watermark = max(self.dish_watermark, dish_id)
+
+        changes = session.query(CatalogChange.dish_id, CatalogChange.created_at)
+        if self._log_watermark is not None:
+            grace = timedelta(seconds=current_app.config["CATALOG_LOG_GRACE_SECONDS"])
+            changes = changes.filter(CatalogChange.created_at >= self._log_watermark - grace)
+        for dish_id, created_at in changes:
+            dish_ids.add(dish_id)
+            if self._log_watermark is None or created_at > self._log_watermark:
+                self._log_watermark = created_at
+        return dish_ids
+
+
+class CatalogRefresher:
+    """Pulls the writes of the other workers into the per worker indexes from a background thread.
+
+    Every CATALOG_REFRESH_SECONDS it calls refresh() on each watched index inside an app context,
+    requests keep reading the index they find and never wait on the database for it. The thread is
+    started by the first request a process serves, so every gunicorn worker forked from a
+    preloaded app runs its own. CATALOG_REFRESH_SECONDS=0 leaves the thread off, the indexes then
+    only see the writes of their own worker until refresh_all() is called.
+    """
+
+    def __init__(self, app=None):
+        self.interval = 1
+        self._app = None
+        self._targets = []
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("CATALOG_REFRESH_SECONDS", 1)
+        app.config.setdefault("CATALOG_LOG_GRACE_SECONDS", 5)
+        app.config.setdefault("CATALOG_LOG_RETENTION_SECONDS", 3600)
+        self.interval = app.config["CATALOG_REFRESH_SECONDS"]
+        self._app = app
+        app.before_request(self.start)
+        app.extensions["catalog_refresher"] = self
+
+    def watch(self, *targets):
+        """Objects with a refresh() method, it must be a no-op until they are built"""
+        self._targets.extend(targets)
+
+    def start(self):
+        """Start the refresh thread of this process unless it runs already"""
+        if not self.interval or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="catalog-refresh", daemon=True).start()
+
+    def _run(self):
+        pid = os.getpid()
+        # a thread does not survive a fork, but stop anyway if this one somehow ends up in a child
+        while self._pid == pid:
+            time.sleep(self.interval)
+            self.refresh_all()
+
+    def refresh_all(self):
+        with self._app.app_context():
+            for target in list(self._targets):
+                try:
+                    target.refresh()
+                except Exception:
+                    # the index stays as it is and is brought up to date on the next tick
+                    self._app.logger.exception("Refreshing %s failed", type(target).__name__)
+
+
+class DishRecord:
+    """The DishView columns the read endpoints serve, without the image and the search columns"""
+
+    __slots__ = ("id", "name", "Instructions", "ingredient_ids", "ingredient_labels", "legacy_ingredients",
+                 "date_posted", "like_count", "user_id")
+
+    COLUMNS = __slots__
+
+    def __init__(self, row):
+        self.id, self.name, self.Instructions, ingredient_ids, ingredient_labels, legacy_ingredients, \
+            self.date_posted, self.like_count, self.user_id = row
+        # 4 bytes per ingredient, the names are looked up in the IngredientDictionary when serialized,
+        # None for a dish `flask migrate-ingredients` has not converted yet
+        self.ingredient_ids = array("i", ingredient_ids) if ingredient_ids is not None else None
+        # None unless the dish spells its ingredients differently than their display names
+        self.ingredient_labels = tuple(ingredient_labels) if ingredient_labels is not None else None
+        # the names of a dish that is not converted yet, None once it is
+        self.legacy_ingredients = tuple(legacy_ingredients) if ingredient_ids is None and legacy_ingredients else None
+
+    @property
+    def key(self):
+        return self.date_posted, self.id
+
+
+class CatalogSnapshot:
+    """Read-through copy of the dish catalog held by each worker, for the dish detail, the dishes
+    of a user and the listing.
+
+    Built from the dishview table on first use, then kept current like the search indexes: the
+    handlers of this worker reload the dishes they wrote right after their commit, and the
+    CatalogRefresher pulls in the writes of the other workers through a ChangeFeed. With the
+    snapshot on, likes are logged in catalog_changes too, so the like counts follow. A dish or
+    user id past the watermarks is read through to the database.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.RLock()
+        self.reset()
+
+    def init_app(self, app):
+        app.config.setdefault("CATALOG_SNAPSHOT", False)
+        self.enabled = app.config["CATALOG_SNAPSHOT"]
+        # the records of a previous app would outlive it, its database may not be this one
+        self.reset()
+        app.extensions["catalog_snapshot"] = self
+
+    def reset(self):
+        """Forget everything, the next read rebuilds from the tables"""
+        with self._lock:
+            self._records = None
+            self._by_user = {}
+            self._keys = []
+            self._user_ids = set()
+            self._user_watermark = 0
+            self._feed = ChangeFeed()
+
+    # >>>>>>>>>>> reads <<<<<<<<<<<<<<
+
+    def get(self, dish_id):
+        """The record of a dish, None when there is no such dish"""
+        self._ensure_built()
+        record = self._records.get(dish_id)
+        if record is None and dish_id > self._feed.dish_watermark:
+            # created by another worker since the last refresh
+            self.reload([dish_id])
+            record = self._records.get(dish_id)
+        return record
+
+    def has_user(self, user_id):
+        self._ensure_built()
+        if user_id not in self._user_ids and user_id > self._user_watermark:
+            self._load_users()
+        return user_id in self._user_ids
+
+    def by_user(self, user_id):
+        """Records of the dishes of a user, oldest first"""
+        self._ensure_built()
+        with self._lock:
+            return [self._records[dish_id] for dish_id in self._by_user.get(user_id, ())]
+
+    def newest(self, after=None, limit=None):
+        """Records newest first on (date_posted, id), from the ones older than the `after` key on"""
+        self._ensure_built()
+        with self._lock:
+            end = bisect.bisect_left(self._keys, after) if after is not None else len(self._keys)
+            start = max(0, end - limit) if limit is not None else 0
+            return [self._records[dish_id] for _, dish_id in reversed(self._keys[start:end])]
+
+    def newest_batches(self, after, batch_size):
+        """newest() in lists of batch_size records, for streamed responses"""
+        while True:
+            batch = self.newest(after, batch_size)
+            if not batch:
+                return
+            yield batch
+            after = batch[-1].key
+
+    # >>>>>>>>>>> writes <<<<<<<<<<<<<<
+
+    def log(self, session, dish_ids):
+        """log_changes for writes only the snapshot copies, e.g. the like counts"""
+        if self.enabled:
+            log_changes(session, dish_ids)
+
+    def reload(self, dish_ids):
+        """Re-read some dishes, the ones no longer in the table are dropped. The handlers call it
+        after their commit, so the next read of this worker sees its own writes"""
+        if self._records is None:
+            return
+        from resource import db
+        from resource.models import DishView
+
+        rows, deleted = load_rows(db.session, [getattr(DishView, column) for column in DishRecord.COLUMNS],
+                                  dish_ids)
+        with self._lock:
+            if self._records is None:
+                return
+            for row in rows:
+                self._put(DishRecord(row))
+            for dish_id in deleted:
+                self._drop(dish_id)
+
+    def remove(self, dish_id):
+        with self._lock:
+            if self._records is not None:
+                self._drop(dish_id)
+
+    # >>>>>>>>>>> building and refreshing <<<<<<<<<<<<<<
+
+    def _ensure_built(self):
+        if self._records is None:
+            self.build()
+
+    def build(self):
+        from resource import db
+        from resource.models import DishView, Users
+
+        with self._lock:
+            # before the table is read, the first refresh applies whatever is written meanwhile
+            feed = ChangeFeed()
+            feed.start(db.session)
+            records = {}
+            query = db.session.query(*[getattr(DishView, column) for column in DishRecord.COLUMNS])
+            for row in query.order_by(DishView.id).yield_per(10000):
+                records[row[0]] = DishRecord(row)
+
+            self._keys = sorted(record.key for record in records.values())
+            self._by_user = {}
+            for record in records.values():
+                self._by_user.setdefault(record.user_id, []).append(record.id)
+            self._user_ids = {user_id for user_id, in db.session.query(Users.id)}
+            self._user_watermark = max(self._user_ids, default=0)
+            self._feed = feed
+            self._records = records
+
+    def refresh(self):
+        """Pull in the dishes and users other workers created, and the dishes they changed or deleted"""
+        if self._records is None:
+            return
+        from resource import db
+
+        self.reload(self._feed.poll(db.session))
+        self._load_users()
+
+    def _load_users(self):
+        from resource import db
+        from resource.models import Users
+
+        user_ids = [user_id for user_id, in db.session.query(Users.id).filter(Users.id > self._user_watermark)]
+        with self._lock:
+            self._user_ids.update(user_ids)
+            self._user_watermark = max([self._user_watermark] + user_ids)
+
+    def _put(self, record):
+        self._drop(record.id)
+        self._records[record.id] = record
+        bisect.insort(self._keys, record.key)
+        bisect.insort(self._by_user.setdefault(record.user_id, []), record.id)
+
+    def _drop(self, dish_id):
+        record = self._records.pop(dish_id, None)
+        if record is None:
+            return
+        position = bisect.bisect_left(self._keys, record.key)
+        if position < len(self._keys) and self._keys[position] == record.key:
+            del self._keys[position]
+        ids = self._by_user.get(record.user_id)
+        if ids:
+            position = bisect.bisect_left(ids, dish_id)
+            if position < len(ids) and ids[position] == dish_id:
+                del ids[position]
+
+    def __len__(self):
+        return len(self._records or ())
@@ -0,0 +1,237 @@
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import update
+from sqlalchemy.orm import undefer
+from resource import db, image_store, thumbnails, revoked_tokens, trending, catalog_snapshot, ingredient_dictionary
+from resource.storage import sniff_image_type
+from resource.catalog import purge_changes
+from resource.search import SEARCH_VECTOR_DDL
+from resource.models import DishView, likes
+
+
+class MigrateCommands(click.Group):
+    """`flask db ...` of Flask-Migrate, alembic is only imported when one of them runs instead of in every worker"""
+
+    def _group(self, ctx):
+        from flask.cli import ScriptInfo
+        from flask_migrate import Migrate
+        from flask_migrate.cli import db as migrate_group
+
+        app = ctx.ensure_object(ScriptInfo).load_app()
+        if "migrate" not in app.extensions:
+            Migrate(app, db)
+        return migrate_group
+
+    def list_commands(self, ctx):
+        return self._group(ctx).list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._group(ctx).get_command(ctx, name)
+
+
+migrate_commands = MigrateCommands("db", help="Perform database migrations.")
+
+
+@click.command("init-db")
+@with_appcontext
+def init_db():
+    """Create the missing tables, indexes and search trigger, run once per deploy instead of on every boot"""
+    db.create_all()
+    click.echo("done")
+
+
+@click.command("boot-report")
+@click.option("--path", default="/swagger.json", show_default=True, help="Request timed as the first request")
+@with_appcontext
+def boot_report(path):
+    """Print the import and create_app times of this process and time its first request"""
+    timings = current_app.extensions["boot_timings"]
+    if timings["first_request_seconds"] is None:
+        status = current_app.test_client().get(path).status_code
+        click.echo(f"GET {path}: {status}")
+
+    for name, seconds in timings.items():
+        click.echo(f"{name}: {seconds * 1000:.1f} ms")
+
+
+@click.command("migrate-images")
+@with_appcontext
+@click.option("--batch-size", default=100, show_default=True, help="Dishes moved per transaction")
+def migrate_images(batch_size):
+    """Move the image bytes still stored in the dishview table into the image store"""
+    last_id = 0
+    moved = 0
+
+    while True:
+        dishes = DishView.query.options(undefer(DishView.dish_image_url)) \
+            .filter(DishView.id > last_id,
+                    DishView.image_key.is_(None),
+                    DishView.dish_image_url.isnot(None)) \
+            .order_by(DishView.id) \
+            .limit(batch_size) \
+            .all()
+
+        if not dishes:
+            break
+
+        for dish in dishes:
+            data = dish.dish_image_url
+            dish.image_key = image_store.put(data)
+            dish.image_size = len(data)
+            dish.image_content_type = sniff_image_type(data[:32]) or "application/octet-stream"
+            dish.dish_image_url = None
+            last_id = dish.id
+
+        # blobs are written before the commit, a crash in between only leaves an unreferenced file
+        db.session.commit()
+        db.session.expunge_all()
+        moved += len(dishes)
+        click.echo(f"moved {moved} images (last dish id {last_id})")
+
+    click.echo(f"done, {moved} images moved")
+
+
+@click.command("build-thumbnails")
+@with_appcontext
+def build_thumbnails():
+    """Build the missing resized variants of every stored dish image"""
+    keys = [key for key, in db.session.query(DishView.image_key)
+            .filter(DishView.image_key.isnot(None)).distinct()]
+
+    for count, key in enumerate(keys, start=1):
+        thumbnails.build(key)
+        if count % 100 == 0:
+            click.echo(f"built {count}/{len(keys)}")
+
+    click.echo(f"done, {len(keys)} images")
+
+
+@click.command("purge-revoked-tokens")
+@with_appcontext
+def purge_revoked_tokens():
+    """Delete the revoked tokens that have expired anyway, meant to run from cron e.g. hourly"""
+    deleted = revoked_tokens.purge()
+    click.echo(f"done, {deleted} rows deleted")
+
+
+@click.command("purge-catalog-changes")
+@with_appcontext
+def purge_catalog_changes():
+    """Delete the catalog change log entries older than CATALOG_LOG_RETENTION_SECONDS, meant to run from cron"""
+    deleted = purge_changes(db.session, current_app.config["CATALOG_LOG_RETENTION_SECONDS"])
+    click.echo(f"done, {deleted} rows deleted")
+
+
+@click.command("migrate-ingredients")
+@with_appcontext
+@click.option("--batch-size", default=1000, show_default=True, help="Dishes converted per transaction")
+def migrate_ingredients(batch_size):
+    """Move the ingredient names still stored in the dishview rows into the ingredient table.
+
+    Run it right after the schema upgrade, rows that are not converted yet have no ingredients
+    in the listings and searches, and restart the workers afterwards so their in-memory indexes
+    are rebuilt. The legacy column is emptied, VACUUM reclaims the space.
+    """
+    last_id = 0
+    converted = 0
+
+    while True:
+        rows = db.session.query(DishView.id, DishView.legacy_ingredients) \
+            .filter(DishView.id > last_id, DishView.ingredient_ids.is_(None)) \
+            .order_by(DishView.id) \
+            .limit(batch_size) \
+            .all()
+
+        if not rows:
+            break
+
+        # the new names of the whole batch in one round trip, the rows then only hit the cache
+        ingredient_dictionary.ids([name for _, names in rows for name in names or ()])
+        encoded = [(dish_id, ingredient_dictionary.encode(names)) for dish_id, names in rows]
+        db.session.execute(update(DishView), [
+            {"id": dish_id, "ingredient_ids": ingredient_ids, "ingredient_labels": labels, "legacy_ingredients": None}
+            for dish_id, (ingredient_ids, labels) in encoded
+        ])
+        db.session.commit()
+        converted += len(rows)
+        last_id = rows[-1][0]
+        click.echo(f"converted {converted} dishes (last dish id {last_id}), {len(ingredient_dictionary)} ingredients")
+
+    click.echo(f"done, {converted} dishes converted")
+
+
+@click.command("setup-search")
+@with_appcontext
+@click.option("--batch-size", default=10000, show_default=True, help="Dishes backfilled per transaction")
+def setup_search(batch_size):
+    """Install the search_vector trigger on an existing postgres database and backfill the column"""
+    if db.engine.dialect.name != "postgresql":
+        click.echo("full text search needs postgres, nothing to do")
+        return
+
+    for statement in SEARCH_VECTOR_DDL:
+        db.session.execute(db.text(statement))
+    db.session.commit()
+
+    last_id = 0
+    while True:
+        ids = [dish_id for dish_id, in db.session.query(DishView.id)
+               .filter(DishView.id > last_id).order_by(DishView.id).limit(batch_size)]
+        if not ids:
+            break
+        # touching name fires the trigger
+        DishView.query.filter(DishView.id.between(ids[0], ids[-1])) \
+            .update({DishView.name: DishView.name}, synchronize_session=False)
+        db.session.commit()
+        last_id = ids[-1]
+        click.echo(f"indexed up to dish id {last_id}")
+
+    click.echo("done")
+
+
+@click.command("recount-likes")
+@with_appcontext
+def recount_likes():
+    """Recompute dishview.like_count from the likes table"""
+    counts = db.select(db.func.count()).select_from(likes) \
+        .where(likes.c["dishview.id"] == DishView.id) \
+        .scalar_subquery()
+    DishView.query.update({DishView.like_count: counts}, synchronize_session=False)
+    db.session.commit()
+    click.echo("done")
+
+
+@click.command("recompute-trending")
+@with_appcontext
+@click.option("--batch-size", default=1000, show_default=True, help="Dishes updated per transaction")
+def recompute_trending(batch_size):
+    """Recompute dishview.trending_score from the likes table, after a TRENDING_HALF_LIFE_HOURS change"""
+    total = trending.recompute_all(db.session, batch_size)
+    click.echo(f"done, {total} dishes")
+
+
+@click.command("catalog-report")
+@with_appcontext
+def catalog_report():
+    """Build the catalog snapshot and print the memory it takes, in total and per 100k dishes"""
+    import tracemalloc
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    catalog_snapshot.build()
+    seconds = time.perf_counter() - started
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    dishes = len(catalog_snapshot)
+    click.echo(f"{dishes} dishes built in {seconds:.1f} s (traced)")
+    click.echo(f"memory: {size / 1024 ** 2:.1f} MiB")
+    if dishes:
+        click.echo(f"per 100k dishes: {size / dishes * 100000 / 1024 ** 2:.1f} MiB")
+
+
+COMMANDS = (migrate_commands, init_db, boot_report, migrate_images, build_thumbnails, purge_revoked_tokens,
+            purge_catalog_changes, migrate_ingredients, setup_search, recount_likes, recompute_trending,
+            catalog_report)
@@ -0,0 +1,69 @@
+import functools
+import os
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+
+REPLICA_BIND = "replica"
+
+
+def engine_options(url):
+    """Pool settings from the environment, SQLite keeps the defaults of its own pool classes"""
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        # recycle before the server or a proxy drops idle connections
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        # test connections on checkout instead of failing the first query after an idle period
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "1") == "1",
+    }
+
+
+def configure_database(app):
+    """Pool settings of the primary and optional replica database, for the URLs the config names.
+
+    SQLALCHEMY_ENGINE_OPTIONS given in the config is kept as is.
+    """
+    url = app.config["SQLALCHEMY_DATABASE_URI"]
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(url))
+
+    replica_url = app.config.get("DATABASE_REPLICA_URL")
+    if replica_url:
+        app.config["SQLALCHEMY_BINDS"] = {REPLICA_BIND: {"url": replica_url, **engine_options(replica_url)}}
+
+
+class RoutingSession(Session):
+    """Sends the reads of read_only handlers to the replica bind and everything else to the primary.
+
+    Once a session flushes or executes anything but a SELECT (DML, raw SQL, a bare connection)
+    it stays on the primary, so a handler always reads its own writes even when the replica lags
+    behind.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._use_replica(clause):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_replica(self, clause):
+        # anything but a SELECT may write, raw SQL included
+        if self._flushing or not getattr(clause, "is_select", False):
+            self.info["pinned_to_primary"] = True
+        if self.info.get("pinned_to_primary"):
+            return False
+        return has_app_context() and g.get("db_read_only", False)
+
+
+def read_only(fn):
+    """Marks a handler whose queries may be answered by the read replica"""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return fn(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,129 @@
+import functools
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from resource.slots import LocalSlots, SharedSlots
+
+
+class HashPoolOverloaded(Exception):
+    """Raised when the password hashing queue is full, the request should be retried later"""
+
+    def __init__(self, retry_after):
+        super().__init__("Password hashing is overloaded, try again later")
+        self.retry_after = retry_after
+
+
+def _nothing():
+    pass
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small dedicated thread pool.
+
+    bcrypt releases the GIL, so a few threads (HASH_WORKERS) per worker are enough to keep the
+    cores busy while the number of hashes in flight stays bounded. When HASH_WORKERS +
+    HASH_QUEUE_DEPTH hashes are already running or waiting, new ones are refused with
+    HashPoolOverloaded instead of piling up.
+
+    The hashes are counted in HASH_SLOTS_FILE, one count for all the workers of the host, so the
+    bound also holds for sync workers, which hash one password at a time each. With an empty
+    HASH_SLOTS_FILE they are counted per worker, which only bounds anything with threaded workers.
+    """
+
+    SLOT_NAME = "password_hash"
+
+    def __init__(self, app=None, bcrypt=None):
+        self.bcrypt = bcrypt
+        self.rounds = None
+        self.retry_after = 1
+        self.workers = 0
+        self.capacity = 0
+        self.slots = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._logger = None
+        self._metrics = None
+        if app is not None:
+            self.init_app(app, bcrypt)
+
+    def init_app(self, app, bcrypt, metrics=None):
+        app.config.setdefault("HASH_WORKERS", 4)
+        app.config.setdefault("HASH_QUEUE_DEPTH", 16)
+        app.config.setdefault("HASH_RETRY_AFTER", 1)
+        app.config.setdefault("HASH_SLOTS_FILE", os.path.join(app.instance_path, "hash_slots.sqlite"))
+        self.bcrypt = bcrypt
+        self._metrics = metrics
+        self.rounds = app.config.get("BCRYPT_LOG_ROUNDS", 12)
+        self.retry_after = app.config["HASH_RETRY_AFTER"]
+        self.workers = app.config["HASH_WORKERS"]
+        self.capacity = self.workers + app.config["HASH_QUEUE_DEPTH"]
+        path = app.config["HASH_SLOTS_FILE"]
+        self.slots = SharedSlots(path) if path else LocalSlots()
+        self._logger = app.logger
+        app.extensions["password_hasher"] = self
+
+    def _get_executor(self):
+        # started on the first hash, threads made before a gunicorn --preload fork would not exist in the workers
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            return self._executor
+
+    def _acquire(self):
+        """Take a slot for one hash, returns the function that gives it back"""
+        try:
+            token = self.slots.acquire(self.SLOT_NAME, self.capacity)
+        except sqlite3.Error as e:
+            # a broken slots file must not lock every user out
+            self._logger.warning("Password hash slots failed, hashing without a bound: %s", e)
+            return _nothing
+        if token is None:
+            raise HashPoolOverloaded(self.retry_after)
+        return functools.partial(self._release, token)
+
+    def _release(self, token):
+        try:
+            self.slots.release(token)
+        except sqlite3.Error as e:
+            # the lease of the slot runs out eventually
+            self._logger.warning("Could not release a password hash slot: %s", e)
+
+    def _timed(self, operation, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            if self._metrics is not None:
+                self._metrics.observe_bcrypt(operation, time.perf_counter() - started)
+
+    def _call(self, release, operation, fn, *args):
+        # released in the pool thread, before the caller wakes up and answers the request
+        try:
+            return self._timed(operation, fn, *args)
+        finally:
+            release()
+
+    def _run(self, operation, fn, *args):
+        release = self._acquire()
+        try:
+            future = self._get_executor().submit(self._call, release, operation, fn, *args)
+        except Exception:
+            release()
+            raise
+        return future.result()
+
+    def hash(self, password):
+        return self._run("hash", self.bcrypt.generate_password_hash, password, self.rounds).decode("utf-8")
+
+    def check(self, password_hash, password):
+        return self._run("check", self.bcrypt.check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when the hash was made with a different cost than BCRYPT_LOG_ROUNDS"""
+        # bcrypt hashes look like $2b$12$<salt+hash>
+        try:
+            return int(password_hash.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
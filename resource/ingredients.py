@@ -0,0 +1,137 @@
+import sys
+import threading
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from resource.search import clean_ingredients
+
+
+class IngredientDictionary:
+    """Per worker id <-> name cache of the ingredient table, dishes store the ids only.
+
+    An ingredient is keyed by its cleaned name (lower cased and trimmed), what the searches
+    match on, and shown with its display name, the spelling of the first dish that used it.
+    Dishes that spell an ingredient differently keep their own spelling next to the ids, see
+    encode().
+
+    An ingredient is never renamed or deleted, so the cache can not go stale, it only misses
+    the ingredients other workers added since it was loaded and reads those on demand. New
+    names are inserted on their own connection and committed at once: a dish transaction that
+    rolls back leaves an unused ingredient behind instead of ids in the cache that never existed.
+    """
+
+    def __init__(self):
+        self._names = None
+        self._ids = {}
+        self._lock = threading.RLock()
+
+    def init_app(self, app):
+        app.config.setdefault("POPULAR_INGREDIENTS_MAX_RESULTS", 100)
+        # the ids of another app's database mean nothing here
+        self.reset()
+        app.extensions["ingredient_dictionary"] = self
+
+    def reset(self):
+        """Forget everything, the next lookup reloads the table"""
+        with self._lock:
+            self._names = None
+            self._ids = {}
+
+    def _ensure_loaded(self):
+        if self._names is not None:
+            return
+        from resource import db
+        from resource.models import Ingredient
+
+        with self._lock:
+            if self._names is None:
+                with db.engine.connect() as connection:
+                    rows = connection.execute(select(Ingredient.id, Ingredient.name, Ingredient.display_name)).all()
+                names, ids = {}, {}
+                for ingredient_id, name, display_name in rows:
+                    names[ingredient_id] = sys.intern(display_name or name)
+                    ids[sys.intern(name)] = ingredient_id
+                self._ids = ids
+                # published last, readers skip the lock once it is set
+                self._names = names
+
+    def _remember(self, rows):
+        for ingredient_id, name, display_name in rows:
+            self._names[ingredient_id] = sys.intern(display_name or name)
+            self._ids[sys.intern(name)] = ingredient_id
+
+    def _fetch(self, column, values):
+        """Read the given ingredients (by id or by name) that this worker has not seen yet"""
+        from resource import db
+        from resource.models import Ingredient
+
+        with db.engine.connect() as connection:
+            rows = connection.execute(select(Ingredient.id, Ingredient.name, Ingredient.display_name)
+                                      .where(getattr(Ingredient, column).in_(list(values)))).all()
+        with self._lock:
+            self._remember(rows)
+
+    def _insert(self, display_names):
+        """Insert the ingredients of {name: display name}, a name that is already there keeps its display name"""
+        from resource import db
+        from resource.models import Ingredient
+
+        insert = pg_insert if db.engine.dialect.name == "postgresql" else sqlite_insert
+        statement = insert(Ingredient.__table__).on_conflict_do_nothing(index_elements=["name"])
+        # committed on its own, see the class docstring
+        with db.engine.begin() as connection:
+            connection.execute(statement, [{"name": name, "display_name": display_name}
+                                           for name, display_name in display_names.items()])
+
+    def names(self, ingredient_ids):
+        """Display names of a list of ingredient ids, in the same order"""
+        if not ingredient_ids:
+            return []
+        self._ensure_loaded()
+        names = self._names
+        try:
+            return [names[ingredient_id] for ingredient_id in ingredient_ids]
+        except KeyError:
+            self._fetch("id", [i for i in ingredient_ids if i not in names])
+            # ids of a row always exist, the ingredients are committed before the dish
+            return [names[ingredient_id] for ingredient_id in ingredient_ids if ingredient_id in names]
+
+    def lookup(self, names):
+        """Ids of already clean names, None for the ones no dish ever used"""
+        self._ensure_loaded()
+        missing = [name for name in names if name not in self._ids]
+        if missing:
+            self._fetch("name", missing)
+        return [self._ids.get(name) for name in names]
+
+    def ids(self, ingredients):
+        """Ids of the cleaned names of a list of ingredients, adding the new ones to the table"""
+        names = clean_ingredients(ingredients)
+        self._ensure_loaded()
+        missing = [name for name in names if name not in self._ids]
+        if missing:
+            self._fetch("name", missing)
+            missing = [name for name in missing if name not in self._ids]
+            if missing:
+                # the first spelling of each new name becomes its display name
+                spellings = {}
+                for ingredient in ingredients:
+                    if ingredient and ingredient.strip():
+                        spellings.setdefault(ingredient.strip().lower(), ingredient.strip())
+                self._insert({name: spellings[name] for name in missing})
+                self._fetch("name", missing)
+        return [self._ids[name] for name in names]
+
+    def encode(self, ingredients):
+        """(ids, labels) of the ingredients a client sent for a dish.
+
+        labels is the list exactly as sent when the display names of the ids would not give it
+        back (other spellings, duplicates, blanks), None otherwise, which is almost always.
+        """
+        ingredient_ids = self.ids(ingredients)
+        ingredients = list(ingredients or ())
+        return ingredient_ids, (None if self.names(ingredient_ids) == ingredients else ingredients)
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._names)
@@ -0,0 +1,368 @@
+import atexit
+import fcntl
+import glob
+import hmac
+import ipaddress
+import json
+import os
+import tempfile
+import threading
+import time
+from flask import Response, abort, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from resource.slots import process_alive
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+BCRYPT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+# name -> (type, help, buckets)
+METRICS = {
+    "http_requests_total": ("counter", "Requests answered, by endpoint, method and status", None),
+    "http_request_duration_seconds": ("histogram", "Time to build the response", LATENCY_BUCKETS),
+    "http_response_size_bytes": ("histogram", "Size of the response body, streamed bodies are left out",
+                                 SIZE_BUCKETS),
+    "db_queries_per_request": ("histogram", "SQL statements issued by one request", QUERY_COUNT_BUCKETS),
+    "db_duration_seconds_per_request": ("histogram", "Time one request spent waiting on SQL statements",
+                                        LATENCY_BUCKETS),
+    "db_queries_total": ("counter", "SQL statements issued, by endpoint", None),
+    "bcrypt_duration_seconds": ("histogram", "Time of one bcrypt hash or check", BCRYPT_BUCKETS),
+}
+
+
+class MetricsRegistry:
+    """Counters and histograms of one process, keyed by (name, labels)"""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            # per bucket counts (not cumulative) with +Inf last, then the sum
+            entry = self.histograms.get(key)
+            if entry is None:
+                entry = self.histograms[key] = [0] * (len(buckets) + 2)
+            position = len(buckets)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    position = i
+                    break
+            entry[position] += 1
+            entry[-1] += value
+
+    def dump(self):
+        with self._lock:
+            return {
+                "counters": [[name, labels, value] for (name, labels), value in self.counters.items()],
+                "histograms": [[name, labels, entry] for (name, labels), entry in self.histograms.items()],
+            }
+
+    def merge(self, data):
+        with self._lock:
+            for name, labels, value in data["counters"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                self.counters[key] = self.counters.get(key, 0) + value
+            for name, labels, entry in data["histograms"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                current = self.histograms.get(key)
+                if current is None:
+                    self.histograms[key] = list(entry)
+                else:
+                    self.histograms[key] = [a + b for a, b in zip(current, entry)]
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, buckets) in METRICS.items():
+                if kind == "counter":
+                    samples = sorted((labels, value) for (n, labels), value in self.counters.items() if n == name)
+                else:
+                    samples = sorted((labels, entry) for (n, labels), entry in self.histograms.items() if n == name)
+                if not samples:
+                    continue
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    if kind == "counter":
+                        lines.append(f"{name}{_labels(labels)} {value}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + ("+Inf",), value[:-1]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {value[-1]}")
+                    lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+_engine_events_installed = False
+
+
+def _install_engine_events():
+    """Time every SQL statement of every engine, and charge it to the current request"""
+    global _engine_events_installed
+    if _engine_events_installed:
+        return
+    _engine_events_installed = True
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        if not has_request_context():
+            return
+        stats = g.get("request_metrics")
+        if stats is None:
+            return
+        stats["queries"] += 1
+        stats["db_seconds"] += elapsed
+        if len(stats["statements"]) < stats["max_statements"]:
+            stats["statements"].append((elapsed, statement))
+
+
+class Metrics:
+    """Request, SQL and bcrypt metrics served on /metrics in Prometheus text format.
+
+    Every process keeps its own registry and writes it to METRICS_DIR/<pid>-<start time>.json at
+    most every METRICS_FLUSH_SECONDS, a worker that gets the pid of a dead one writes a file of its
+    own. /metrics sums the files of all the gunicorn workers, so any worker can answer the scrape.
+    The files of dead workers are folded into RETIRED_FILE, which keeps their counts in the sums,
+    so the counters do not go backwards while workers come and go.
+
+    The scrape is refused unless it comes from an address in METRICS_ALLOWED_IPS, or carries
+    METRICS_TOKEN as a bearer token. A request forwarded by a proxy (with X-Forwarded-For) is not
+    let in by its address, a proxy on the host would make every client look local. With neither
+    setting /metrics is a 404.
+    """
+
+    RETIRED_FILE = "retired.json"
+    LOCK_FILE = ".lock"
+
+    def __init__(self, app=None):
+        self.registry = MetricsRegistry()
+        self.directory = None
+        self.flush_seconds = 1
+        self.slow_seconds = 0
+        self.max_statements = 0
+        self.token = None
+        self.allowed_networks = []
+        self._last_flush = 0
+        self._flush_lock = threading.Lock()
+        self._pid = None
+        self._started = None
+        self._logger = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("METRICS_DIR", os.path.join(app.instance_path, "metrics"))
+        app.config.setdefault("METRICS_FLUSH_SECONDS", 1)
+        app.config.setdefault("SLOW_REQUEST_SECONDS", 0)
+        app.config.setdefault("SLOW_REQUEST_MAX_STATEMENTS", 50)
+        app.config.setdefault("METRICS_TOKEN", None)
+        app.config.setdefault("METRICS_ALLOWED_IPS", [])
+        self.registry = MetricsRegistry()
+        self.directory = app.config["METRICS_DIR"] or None
+        self.token = app.config["METRICS_TOKEN"] or None
+        self.allowed_networks = [ipaddress.ip_network(network.strip(), strict=False)
+                                 for network in app.config["METRICS_ALLOWED_IPS"] if network.strip()]
+        self.flush_seconds = app.config["METRICS_FLUSH_SECONDS"]
+        self.slow_seconds = app.config["SLOW_REQUEST_SECONDS"]
+        self.max_statements = app.config["SLOW_REQUEST_MAX_STATEMENTS"]
+        self._logger = app.logger
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            atexit.register(self.flush)
+
+        _install_engine_events()
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+        app.add_url_rule("/metrics", "metrics", self.view)
+        app.extensions["metrics"] = self
+
+    def _start(self):
+        g.request_metrics = {
+            "started": time.perf_counter(),
+            "queries": 0,
+            "db_seconds": 0.0,
+            "statements": [],
+            "max_statements": self.max_statements,
+        }
+
+    def _finish(self, response):
+        size = None if response.is_streamed else response.calculate_content_length()
+        self._record(response.status_code, size)
+        return response
+
+    def _teardown(self, exc):
+        # an exception that escaped the handlers never reached _finish
+        if exc is not None:
+            self._record(500, None)
+
+    def _record(self, status, size):
+        stats = g.pop("request_metrics", None)
+        if stats is None:
+            return
+        duration = time.perf_counter() - stats["started"]
+        endpoint = request.endpoint or "unmatched"
+        if endpoint == "metrics":
+            return
+
+        self.registry.inc("http_requests_total", endpoint=endpoint, method=request.method, status=status)
+        self.registry.observe("http_request_duration_seconds", duration, endpoint=endpoint, method=request.method)
+        if size is not None:
+            self.registry.observe("http_response_size_bytes", size, endpoint=endpoint)
+        self.registry.observe("db_queries_per_request", stats["queries"], endpoint=endpoint)
+        self.registry.observe("db_duration_seconds_per_request", stats["db_seconds"], endpoint=endpoint)
+        self.registry.inc("db_queries_total", stats["queries"], endpoint=endpoint)
+
+        if self.slow_seconds and duration >= self.slow_seconds:
+            statements = "\n".join(f"  {elapsed * 1000:.1f} ms  {' '.join(statement.split())}"
+                                   for elapsed, statement in stats["statements"])
+            self._logger.warning("Slow request %s %s: %.3f s, %d queries in %.3f s\n%s",
+                                 request.method, request.full_path.rstrip("?"), duration,
+                                 stats["queries"], stats["db_seconds"], statements)
+
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def observe_bcrypt(self, operation, seconds):
+        self.registry.observe("bcrypt_duration_seconds", seconds, operation=operation)
+
+    def flush(self):
+        """Write this process's registry to its file in METRICS_DIR"""
+        if not self.directory:
+            return
+        with self._flush_lock:
+            self._last_flush = time.monotonic()
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.registry.dump(), f)
+            os.replace(tmp_path, self._path())
+
+    def _path(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            # first flush of this process, also of a worker forked from a preloaded app
+            self._pid, self._started = pid, time.time()
+        return os.path.join(self.directory, f"{pid}-{self._started:.6f}.json")
+
+    def collect(self):
+        """Registry of every worker of the host summed together, with the dead ones"""
+        if not self.directory:
+            return self.registry
+        self.flush()
+        with open(os.path.join(self.directory, self.LOCK_FILE), "a") as lock:
+            # a scrape must not sum a dead worker's file while another one folds it into the retired counts
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                retired = self._retire_dead_workers()
+                total = MetricsRegistry()
+                total.merge(retired)
+                for path in self._worker_files():
+                    if os.path.basename(path) in retired["folded"]:
+                        continue
+                    try:
+                        with open(path) as f:
+                            total.merge(json.load(f))
+                    except (OSError, ValueError):
+                        continue
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return total
+
+    def _worker_files(self):
+        return glob.glob(os.path.join(self.directory, "*-*.json"))
+
+    def _retire_dead_workers(self):
+        """Add the files of the workers that are gone to RETIRED_FILE and remove them, under the lock.
+
+        The names of the folded files are kept in RETIRED_FILE until they are removed, so they are
+        neither counted twice nor folded again when a scrape dies halfway.
+        """
+        retired_path = os.path.join(self.directory, self.RETIRED_FILE)
+        try:
+            with open(retired_path) as f:
+                retired = json.load(f)
+        except (OSError, ValueError):
+            retired = {"counters": [], "histograms": [], "folded": []}
+
+        names = {os.path.basename(path): path for path in self._worker_files()}
+        folded = [name for name in retired["folded"] if name in names]
+        dead = []
+        for name in names:
+            try:
+                pid = int(name.split("-", 1)[0])
+            except ValueError:
+                continue
+            if name not in folded and not process_alive(pid):
+                dead.append(name)
+        if dead or len(folded) != len(retired["folded"]):
+            total = MetricsRegistry()
+            total.merge(retired)
+            for name in dead:
+                try:
+                    with open(names[name]) as f:
+                        total.merge(json.load(f))
+                except (OSError, ValueError):
+                    continue
+                folded.append(name)
+            retired = {**total.dump(), "folded": folded}
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(retired, f)
+            os.replace(tmp_path, retired_path)
+
+        for name in folded:
+            try:
+                os.unlink(names[name])
+            except OSError:
+                pass
+        return retired
+
+    def allowed(self):
+        """Whether the current request may scrape, by its bearer token or its address"""
+        if self.token:
+            scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+            if scheme.lower() == "bearer" and hmac.compare_digest(credentials.strip().encode(), self.token.encode()):
+                return True
+        if self.allowed_networks and "X-Forwarded-For" not in request.headers:
+            try:
+                address = ipaddress.ip_address(request.remote_addr or "")
+            except ValueError:
+                return False
+            return any(address in network for network in self.allowed_networks)
+        return False
+
+    def view(self):
+        if not self.token and not self.allowed_networks:
+            abort(404)
+        if not self.allowed():
+            abort(403)
+        return Response(self.collect().render(), mimetype="text/plain; version=0.0.4")
@@ -1,11 +1,20 @@
-from sqlalchemy.dialects.postgresql import ARRAY
-from resource import db
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
+from resource import db, trending, ingredient_dictionary
 from datetime import datetime
+from resource.search import SEARCH_VECTOR_DDL
+
+# postgres text[] and integer[], stored as JSON on SQLite so the models also work in tests
+StringArray = ARRAY(db.String).with_variant(db.JSON(none_as_null=True), "sqlite")
+IntegerArray = ARRAY(db.Integer).with_variant(db.JSON(none_as_null=True), "sqlite")
 
 likes = db.Table(
     "likes",
     db.Column("user.id", db.Integer, db.ForeignKey("user_sign_up.id"), primary_key=True),
-    db.Column("dishview.id", db.Integer, db.ForeignKey("dishview.id"), primary_key=True)
+    db.Column("dishview.id", db.Integer, db.ForeignKey("dishview.id"), primary_key=True),
+    # when the like was given, NULL for likes from before the column existed
+    db.Column("created_at", db.DateTime, nullable=True, default=datetime.utcnow),
+    # the likes of one dish, the primary key only covers those of one user
+    db.Index("ix_likes_dishview_id", "dishview.id")
 )
 
 
@@ -30,26 +39,89 @@ class Dish(db.Model):
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     name = db.Column(db.String(255), nullable=False, unique=False)
     Instructions = db.Column(db.String(500), nullable=False, unique=False)
-    Ingredients = db.Column(ARRAY(db.String), nullable=False, unique=False)
+    Ingredients = db.Column(StringArray, nullable=False, unique=False)
     date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     # dish_views = db.relationship('DishView', backref='dish', lazy=True)
 
 
+class Ingredient(db.Model):
+    """Lower cased, trimmed ingredient names, dishes refer to them by id through IngredientDictionary"""
+    __tablename__ = "ingredient"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False, unique=True)
+    # trimmed spelling of the first dish that used it, what the responses show, NULL shows the name
+    display_name = db.Column(db.String(255), nullable=True)
+
+
+def _initial_trending_score(context):
+    return trending.initial_score(context.get_current_parameters().get("date_posted") or datetime.utcnow())
+
+
 class DishView(db.Model):
     __tablename__ = "dishview"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        # keyset pagination of the dish listing walks this index
+        db.Index("ix_dishview_date_posted_id", "date_posted", "id"),
+        # ingredient search, && and @> on the ingredient ids
+        db.Index("ix_dishview_ingredient_ids", "ingredient_ids",
+                 postgresql_using="gin").ddl_if(dialect="postgresql"),
+        # full text search over name and Instructions
+        db.Index("ix_dishview_search_vector", "search_vector",
+                 postgresql_using="gin").ddl_if(dialect="postgresql"),
+        # /dish/trending reads the first K entries
+        db.Index("ix_dishview_trending_score_id", "trending_score", "id"),
+        {"extend_existing": True}
+    )
 
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     name = db.Column(db.String(255), nullable=False, unique=False)
     Instructions = db.Column(db.String(500), nullable=False, unique=False)
-    Ingredients = db.Column(ARRAY(db.String), nullable=False, unique=False)
+    # ids in the ingredient table, in the order they were given, NULL for rows that
+    # `flask migrate-ingredients` has not converted yet
+    ingredient_ids = db.Column(IntegerArray, nullable=True)
+    # the Ingredients exactly as the client sent them, only stored when the display names of the
+    # ids do not give them back (another spelling, duplicates), NULL for almost every row
+    ingredient_labels = db.Column(StringArray, nullable=True)
+    # legacy ingredient names, only read by the migrate-ingredients command and as a fallback for
+    # rows that have not been migrated yet, the Ingredients property is what the code uses
+    legacy_ingredients = db.deferred(db.Column("Ingredients", StringArray, nullable=True))
     date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    dish_image_url = db.Column(db.LargeBinary, nullable=True, default='default.jpg')
+    # weighted tsvector of name and Instructions, maintained by a trigger on postgres (SEARCH_VECTOR_DDL)
+    search_vector = db.deferred(db.Column(TSVECTOR().with_variant(db.Text(), "sqlite"), nullable=True))
+    # legacy inline image bytes, only read by the migrate-images command and as a fallback
+    # for rows that have not been migrated yet
+    dish_image_url = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    # sha256 key of the image in the image store plus its metadata
+    image_key = db.Column(db.String(64), nullable=True)
+    image_size = db.Column(db.Integer, nullable=True)
+    image_content_type = db.Column(db.String(100), nullable=True)
+    # number of rows in likes for this dish, kept in step by the like/unlike handlers
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # time decayed popularity (see TrendingScores), kept in step by the like/unlike handlers,
+    # `flask recompute-trending` fills it for existing rows
+    trending_score = db.Column(db.Float, nullable=False, default=_initial_trending_score, server_default="0")
     # many-to-many relationship-----many users can like many dishes
     user_likes = db.relationship("Users", secondary="likes", backref="liked_dishes", lazy="dynamic")
     # one-to-many relationship----many dish can be created by one user
     user_id = db.Column(db.Integer, db.ForeignKey('user_sign_up.id'))
 
+    @property
+    def Ingredients(self):
+        if self.ingredient_ids is None:
+            return self.legacy_ingredients
+        if self.ingredient_labels is not None:
+            return self.ingredient_labels
+        return ingredient_dictionary.names(self.ingredient_ids)
+
+    @Ingredients.setter
+    def Ingredients(self, ingredients):
+        self.ingredient_ids, self.ingredient_labels = ingredient_dictionary.encode(ingredients)
+
+
+for statement in SEARCH_VECTOR_DDL:
+    db.event.listen(DishView.__table__, "after_create", db.DDL(statement).execute_if(dialect="postgresql"))
+
 
 class UserLogin(db.Model):
     __tablename__ = "user_login"
@@ -63,4 +135,17 @@ class RevokeToken(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     jti = db.Column(db.String, unique=True, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # when the revoked token would have expired anyway, the row can be purged after that
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
+
+
+class CatalogChange(db.Model):
+    """Dishes changed or deleted by a handler, read by the in-process indexes and the catalog snapshot
+    of every worker"""
+    __tablename__ = "catalog_changes"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # no foreign key, the log also names dishes that were deleted
+    dish_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
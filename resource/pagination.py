@@ -0,0 +1,76 @@
+from flask import current_app, request
+from sqlalchemy import or_, and_
+from datetime import datetime
+import base64
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor can not be decoded"""
+
+
+def encode_cursor(date_posted, dish_id):
+    """Turn the (date_posted, id) of the last row of a page into an opaque cursor"""
+    raw = f"{date_posted.isoformat()}|{dish_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Reverse of encode_cursor, returns a (date_posted, id) tuple"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        date_posted, dish_id = raw.split("|")
+        return datetime.fromisoformat(date_posted), int(dish_id)
+    except Exception:
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+
+
+def page_limit():
+    """Read ?limit= from the request, clamped to DISH_MAX_PAGE_SIZE"""
+    default = current_app.config["DISH_PAGE_SIZE"]
+    maximum = current_app.config["DISH_MAX_PAGE_SIZE"]
+    limit = request.args.get("limit", default, type=int)
+    return max(1, min(limit, maximum))
+
+
+def keyset_query(query, model, cursor):
+    """Order query newest first on (date_posted, id) and skip to the rows after the cursor"""
+    query = query.order_by(model.date_posted.desc(), model.id.desc())
+
+    if cursor:
+        date_posted, dish_id = decode_cursor(cursor)
+        query = query.filter(
+            or_(model.date_posted < date_posted,
+                and_(model.date_posted == date_posted, model.id < dish_id))
+        )
+
+    return query
+
+
+def keyset_page(query, model, cursor, limit):
+    """Newest first keyset pagination on (date_posted, id).
+
+    Returns the rows of the page and the cursor of the next page (None on the last page).
+    """
+    query = keyset_query(query, model, cursor)
+
+    # fetch one extra row to know whether there is a next page
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.date_posted, last.id)
+
+    return rows, next_cursor
+
+
+def snapshot_page(catalog, cursor, limit):
+    """keyset_page over the records of the catalog snapshot"""
+    after = decode_cursor(cursor) if cursor else None
+    records = catalog.newest(after, limit + 1)
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(*records[-1].key)
+
+    return records, next_cursor
@@ -0,0 +1,266 @@
+import functools
+import math
+import os
+import sqlite3
+import threading
+import time
+from flask import Response, request
+from flask_jwt_extended import get_jwt_identity
+from resource.slots import LocalSlots, SharedSlots, SharedSQLite
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# name -> "count/period", the bucket holds count tokens and refills count of them per period
+DEFAULT_RATE_LIMITS = {
+    "register": "5/minute",
+    "login": "10/minute",
+    "dish_create": "30/minute",
+    "dish_image": "30/minute",
+    "dish_list": "300/minute",
+}
+
+# endpoint class -> requests of that class the workers of a host serve at the same time
+DEFAULT_CONCURRENCY_LIMITS = {
+    "auth": 4,
+    "upload": 4,
+    "scan": 8,
+}
+
+# how often the buckets that filled up again are forgotten
+PURGE_SECONDS = 60
+
+BUCKETS_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, "
+    "full_at REAL NOT NULL)",
+)
+
+
+def parse_rate(spec):
+    """(tokens per second, burst) of a "count/period" limit, None for "none" or "0" """
+    spec = str(spec).strip().lower()
+    if spec in ("", "none", "0"):
+        return None
+    count, _, period = spec.partition("/")
+    try:
+        count = float(count)
+        seconds = PERIODS[period.strip() or "second"]
+    except (ValueError, KeyError):
+        raise ValueError(f"Invalid rate limit {spec}, expected e.g. 10/minute")
+    if count <= 0:
+        return None
+    return count / seconds, count
+
+
+def parse_pairs(value):
+    """{"a": "1", "b": "2"} from "a=1,b=2", how RATE_LIMITS and CONCURRENCY_LIMITS are set in the environment"""
+    pairs = {}
+    for item in value.split(","):
+        if item.strip():
+            name, _, setting = item.partition("=")
+            pairs[name.strip()] = setting.strip()
+    return pairs
+
+
+def _nothing():
+    pass
+
+
+class RateLimited(Exception):
+    """Raised when a client used up its bucket or an endpoint class is at its concurrency cap"""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class LocalBucketBackend:
+    """Token buckets in a dict, private to one worker process"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._last_purge = time.monotonic()
+
+    def take(self, key, rate, burst):
+        """Take a token, returns 0 when there was one or else the seconds until there is"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            if now - self._last_purge >= PURGE_SECONDS:
+                self._last_purge = now
+                self._buckets = {k: bucket for k, bucket in self._buckets.items() if bucket[2] > now}
+            return wait
+
+
+class SQLiteBucketBackend:
+    """Token buckets in a SQLite file that every gunicorn worker on the host shares, each take is
+    one short write transaction"""
+
+    def __init__(self, path):
+        self.db = SharedSQLite(path, BUCKETS_SCHEMA)
+        self._last_purge = time.time()
+
+    def take(self, key, rate, burst):
+        """Take a token, returns 0 when there was one or else the seconds until there is"""
+        now = time.time()
+        with self.db.transaction() as connection:
+            row = connection.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            connection.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                               (key, tokens, now, now + (burst - tokens) / rate))
+            if now - self._last_purge >= PURGE_SECONDS:
+                self._last_purge = now
+                connection.execute("DELETE FROM buckets WHERE full_at < ?", (now,))
+        return wait
+
+
+class RateLimiter:
+    """Token bucket rate limits per client and concurrency caps per endpoint class.
+
+    A client is the JWT identity when the handler requires a token and the remote address
+    otherwise. RATE_LIMITS maps the limit names of the endpoints to "count/period" and
+    overrides the defaults, RATE_LIMIT_BACKEND keeps the buckets per worker ("local") or in a
+    SQLite file shared by the workers of the host ("sqlite"). The limits are off ("none") unless
+    a backend is chosen, and then RATE_LIMIT_PROXY_HOPS must be set too: behind a proxy every
+    request comes from the proxy's address, limiting by it would throttle all clients as one.
+    An app with a backend and no RATE_LIMIT_PROXY_HOPS refuses to start.
+
+    CONCURRENCY_LIMITS caps the requests of an endpoint class the workers of the host serve at
+    once, so logins or uploads can not take every worker while the cheap reads wait. With the
+    "sqlite" backend the slots are SharedSlots in the same file, which bounds sync workers (one
+    request per process) as well as threaded ones. With "local" or "none" they are counted per
+    worker, which only caps anything with threaded workers. Clients over their rate get a 429,
+    requests over the cap a 503, both with a Retry-After.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.slots = None
+        self.limits = {}
+        self.caps = {}
+        self.retry_after = 1
+        self.proxy_hops = 0
+        self._logger = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("RATE_LIMIT_BACKEND", "none")
+        app.config.setdefault("RATE_LIMIT_FILE", os.path.join(app.instance_path, "rate_limits.sqlite"))
+        app.config.setdefault("RATE_LIMITS", {})
+        app.config.setdefault("CONCURRENCY_LIMITS", {})
+        app.config.setdefault("CONCURRENCY_RETRY_AFTER", 1)
+        app.config.setdefault("RATE_LIMIT_PROXY_HOPS", None)
+
+        backend = app.config["RATE_LIMIT_BACKEND"]
+        if backend != "none" and app.config["RATE_LIMIT_PROXY_HOPS"] is None:
+            raise ValueError(f"RATE_LIMIT_BACKEND {backend} needs RATE_LIMIT_PROXY_HOPS, the number of proxies in "
+                             f"front of the app (0 when clients connect to it directly)")
+        if backend == "local":
+            self.backend = LocalBucketBackend()
+            self.slots = LocalSlots()
+        elif backend == "sqlite":
+            self.backend = SQLiteBucketBackend(app.config["RATE_LIMIT_FILE"])
+            self.slots = SharedSlots(app.config["RATE_LIMIT_FILE"])
+        elif backend == "none":
+            self.backend = None
+            self.slots = LocalSlots()
+        else:
+            raise ValueError(f"Unknown RATE_LIMIT_BACKEND {backend}")
+
+        limits = {**DEFAULT_RATE_LIMITS, **app.config["RATE_LIMITS"]}
+        self.limits = {name: parse_rate(spec) for name, spec in limits.items()}
+        caps = {**DEFAULT_CONCURRENCY_LIMITS, **app.config["CONCURRENCY_LIMITS"]}
+        self.caps = {name: int(cap) for name, cap in caps.items() if int(cap) > 0}
+        self.retry_after = app.config["CONCURRENCY_RETRY_AFTER"]
+        self.proxy_hops = app.config["RATE_LIMIT_PROXY_HOPS"] or 0
+        self._logger = app.logger
+        app.extensions["rate_limiter"] = self
+
+    def client(self):
+        """The JWT identity of the request when it was verified, else the remote address"""
+        try:
+            identity = get_jwt_identity()
+        except RuntimeError:
+            identity = None
+        if identity is not None:
+            return f"user:{identity}"
+        address = request.remote_addr
+        if self.proxy_hops:
+            # the proxies in front of the app append the address they got the request from
+            forwarded = [part.strip() for part in request.headers.get("X-Forwarded-For", "").split(",") if part.strip()]
+            if len(forwarded) >= self.proxy_hops:
+                address = forwarded[-self.proxy_hops]
+        return f"ip:{address}"
+
+    def check(self, name):
+        """Take a token from the bucket of the current client for the limit name, raises RateLimited"""
+        limit = self.limits.get(name)
+        if self.backend is None or limit is None:
+            return
+        rate, burst = limit
+        try:
+            wait = self.backend.take(f"{name}:{self.client()}", rate, burst)
+        except sqlite3.Error as e:
+            # a broken limiter must not take the endpoints down with it
+            self._logger.warning("Rate limit backend failed, letting the request through: %s", e)
+            return
+        if wait:
+            raise RateLimited("Too many requests, try again later", 429, math.ceil(wait))
+
+    def acquire(self, name, cap):
+        """Take one of the cap slots of name, returns the function that gives it back, raises
+        RateLimited when they are all taken"""
+        try:
+            token = self.slots.acquire(name, cap)
+        except sqlite3.Error as e:
+            self._logger.warning("Concurrency slots failed, letting the request through: %s", e)
+            return _nothing
+        if token is None:
+            raise RateLimited("Server busy, try again later", 503, self.retry_after)
+        return functools.partial(self._release, token)
+
+    def _release(self, token):
+        try:
+            self.slots.release(token)
+        except sqlite3.Error as e:
+            # the lease of the slot runs out eventually
+            self._logger.warning("Could not release a concurrency slot: %s", e)
+
+    def limit(self, name, endpoint_class=None):
+        """Decorator for Resource methods, goes below jwt_required so the identity is known"""
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                cap = self.caps.get(endpoint_class)
+                try:
+                    self.check(name)
+                    release = self.acquire(endpoint_class, cap) if cap else _nothing
+                except RateLimited as e:
+                    return {"Error": str(e)}, e.status, {"Retry-After": str(e.retry_after)}
+
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException:
+                    release()
+                    raise
+                if isinstance(result, Response) and result.is_streamed:
+                    # the work of a streamed response is done while it is sent
+                    result.call_on_close(release)
+                else:
+                    release()
+                return result
+
+            return wrapper
+
+        return decorator
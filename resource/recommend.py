@@ -0,0 +1,354 @@
+import heapq
+import math
+import threading
+from resource.catalog import ChangeFeed, load_rows
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # optional, the recommender falls back to the inverted IngredientIndex
+    np = None
+    sparse = None
+
+SIMILARITY_METRICS = ("jaccard", "cosine")
+
+
+def similarity(metric, overlap, query_size, sizes):
+    """Jaccard or cosine of binary ingredient vectors from their overlap and sizes, works on arrays too"""
+    if metric == "cosine":
+        return overlap / ((query_size * sizes) ** 0.5)
+    return overlap / (query_size + sizes - overlap)
+
+
+def rank(candidates, limit):
+    """Best (dish_id, score) pairs first, ties go to the newest dish"""
+    return heapq.nsmallest(limit, candidates, key=lambda pair: (-pair[1], -pair[0]))
+
+
+class SimilarityMatrix:
+    """Sparse dish x ingredient matrix, scored with NumPy.
+
+    The rows are the dishes sorted by id, the columns the ingredient ids renumbered in the order
+    they were first seen, so a long unused range of ids takes no columns. The matrix is
+    kept twice, as CSR for the ingredients of one dish and as CSC whose columns are the postings
+    of one ingredient, so a query only touches the dishes sharing an ingredient with it.
+
+    Dishes created or updated after the build go to a small pending dict and their old row is
+    masked out, once there are compact_after such changes the matrix is rebuilt from the alive
+    rows and the pending dishes without reading the table again.
+    """
+
+    def __init__(self, compact_after=1000):
+        self.compact_after = compact_after
+        self._vocabulary = {}
+        self._dish_ids = np.zeros(0, dtype=np.int64)
+        self._rows = sparse.csr_matrix((0, 0), dtype=np.int32)
+        self._columns = sparse.csc_matrix((0, 0), dtype=np.int32)
+        self._sizes = np.zeros(0, dtype=np.float64)
+        self._alive = np.zeros(0, dtype=np.bool_)
+        self._dead = 0
+        self._pending = {}
+
+    def _columns_of(self, ingredient_ids):
+        vocabulary = self._vocabulary
+        return sorted({vocabulary.setdefault(ingredient_id, len(vocabulary)) for ingredient_id in ingredient_ids})
+
+    def _set_matrix(self, dish_ids, rows):
+        self._dish_ids = dish_ids
+        self._rows = rows
+        self._columns = rows.tocsc()
+        self._sizes = np.diff(rows.indptr).astype(np.float64)
+        self._alive = np.ones(len(dish_ids), dtype=np.bool_)
+        self._dead = 0
+        self._pending = {}
+
+    def build(self, rows):
+        """Load (dish_id, ingredient_ids) pairs, ordered by dish id"""
+        dish_ids, indptr, indices = [], [0], []
+        for dish_id, ingredient_ids in rows:
+            columns = self._columns_of(ingredient_ids or ())
+            dish_ids.append(dish_id)
+            indices.extend(columns)
+            indptr.append(len(indices))
+
+        indices = np.asarray(indices, dtype=np.int32)
+        matrix = sparse.csr_matrix((np.ones(len(indices), dtype=np.int32), indices, np.asarray(indptr)),
+                                   shape=(len(dish_ids), len(self._vocabulary)))
+        self._set_matrix(np.asarray(dish_ids, dtype=np.int64), matrix)
+
+    def _row_of(self, dish_id):
+        position = int(np.searchsorted(self._dish_ids, dish_id))
+        if position < len(self._dish_ids) and self._dish_ids[position] == dish_id and self._alive[position]:
+            return position
+        return None
+
+    def _mask_row(self, dish_id):
+        row = self._row_of(dish_id)
+        if row is not None:
+            self._alive[row] = False
+            self._dead += 1
+
+    def add(self, dish_id, ingredient_ids):
+        columns = frozenset(self._columns_of(ingredient_ids or ()))
+        if self.ingredients_of(dish_id) == columns:
+            # e.g. an update of the name only, the row stays where it is
+            return
+        self._mask_row(dish_id)
+        self._pending[dish_id] = columns
+        self._maybe_compact()
+
+    def remove(self, dish_id):
+        self._mask_row(dish_id)
+        self._pending.pop(dish_id, None)
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self._dead + len(self._pending) < self.compact_after:
+            return
+        alive = np.flatnonzero(self._alive)
+        pending_ids = np.fromiter(self._pending, dtype=np.int64, count=len(self._pending))
+        pending_indptr = np.cumsum([0] + [len(columns) for columns in self._pending.values()])
+        pending_indices = np.fromiter((column for columns in self._pending.values() for column in sorted(columns)),
+                                      dtype=np.int32, count=int(pending_indptr[-1]))
+        shape = (len(self._vocabulary),)
+        pending = sparse.csr_matrix((np.ones(len(pending_indices), dtype=np.int32), pending_indices, pending_indptr),
+                                    shape=(len(pending_ids),) + shape)
+        kept = self._rows[alive]
+        kept.resize((len(alive),) + shape)
+
+        dish_ids = np.concatenate([self._dish_ids[alive], pending_ids])
+        order = np.argsort(dish_ids, kind="stable")
+        self._set_matrix(dish_ids[order], sparse.vstack([kept, pending], format="csr")[order])
+
+    def ingredients_of(self, dish_id):
+        """Column ids of a dish, None when it is unknown"""
+        columns = self._pending.get(dish_id)
+        if columns is not None:
+            return columns
+        row = self._row_of(dish_id)
+        if row is None:
+            return None
+        return frozenset(self._rows.indices[self._rows.indptr[row]:self._rows.indptr[row + 1]].tolist())
+
+    def _candidates(self, overlap, floor, excluded):
+        """Alive, not excluded rows whose overlap is at least floor"""
+        rows = np.flatnonzero(overlap >= floor)
+        rows = rows[self._alive[rows]]
+        if len(excluded):
+            rows = rows[~np.isin(self._dish_ids[rows], excluded)]
+        return rows
+
+    def top(self, weights, metric, limit, exclude=()):
+        """Best (dish_id, score) pairs for a {column: weight} query vector of whole numbers.
+
+        With weights of 1 the score is the Jaccard or cosine similarity of two dishes, other
+        weights (a profile of liked dishes) are scored by cosine.
+        """
+        if not weights:
+            return []
+        binary = all(weight == 1 for weight in weights.values())
+        if not binary:
+            metric = "cosine"
+        norm = len(weights) if binary else sum(weight * weight for weight in weights.values())
+        heaviest = max(weights.values())
+
+        # weighted overlap with every matrix row, counted from the postings of the query's ingredients
+        # or, when those cover a good part of the matrix (a profile of many liked dishes), by a
+        # sparse matrix vector product over all of it
+        columns = np.fromiter((column for column in weights if column < self._columns.shape[1]), dtype=np.int64)
+        starts, ends = self._columns.indptr[columns], self._columns.indptr[columns + 1]
+        if (ends - starts).sum() * 3 > self._rows.nnz:
+            query = np.zeros(self._rows.shape[1], dtype=np.int32)
+            query[columns] = [weights[column] for column in columns.tolist()]
+            overlap = self._rows @ query
+        else:
+            postings = np.concatenate([self._columns.indices[start:end] for start, end in zip(starts, ends)]
+                                      or [np.zeros(0, dtype=np.int32)])
+            if binary:
+                overlap = np.bincount(postings, minlength=len(self._dish_ids))
+            else:
+                query = np.fromiter((weights[column] for column in columns.tolist()), dtype=np.float64,
+                                    count=len(columns))
+                overlap = np.bincount(postings, weights=np.repeat(query, ends - starts),
+                                      minlength=len(self._dish_ids)).astype(np.int64)
+        excluded = np.asarray(sorted(exclude), dtype=np.int64)
+
+        # Scoring every row sharing a common ingredient costs more than the counting above. A
+        # score is at most overlap / norm (Jaccard) or sqrt(overlap * heaviest / norm) (cosine),
+        # so the rows with the highest overlaps give a score every result has to reach, and only
+        # the rows whose overlap allows that score are scored.
+        histogram = np.bincount(overlap)
+        enough = limit + len(excluded) + self._dead
+        # rows with at least each overlap
+        above = np.cumsum(histogram[::-1])[::-1]
+        levels = np.flatnonzero(above >= enough)
+        floor = max(1, int(levels[-1])) if len(levels) else 1
+        candidates = self._candidates(overlap, floor, excluded)
+        scores = similarity(metric, overlap[candidates], norm, self._sizes[candidates])
+        if floor > 1 and len(scores) >= limit:
+            reachable = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+            if metric == "cosine":
+                needed = reachable * reachable * norm / heaviest
+            else:
+                needed = reachable * norm
+            needed = max(1, math.ceil(needed - 1e-9))
+            if needed < floor:
+                candidates = self._candidates(overlap, needed, excluded)
+                scores = similarity(metric, overlap[candidates], norm, self._sizes[candidates])
+
+        if len(candidates) > limit:
+            # everything scoring at least the limit-th best score, ties included, then ordered like rank()
+            threshold = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+            keep = scores >= threshold
+            candidates, scores = candidates[keep], scores[keep]
+            best = np.lexsort((-self._dish_ids[candidates], -scores))[:limit]
+            candidates, scores = candidates[best], scores[best]
+        ranked = list(zip(self._dish_ids[candidates].tolist(), scores.tolist()))
+
+        for dish_id, dish_columns in self._pending.items():
+            if dish_id in exclude:
+                continue
+            shared = sum(weights.get(column, 0) for column in dish_columns)
+            if shared:
+                ranked.append((dish_id, float(similarity(metric, shared, norm, len(dish_columns)))))
+
+        return rank(ranked, limit)
+
+
+class Recommender:
+    """"Similar dishes" and the "because you liked" feed from the ingredient overlap of dishes.
+
+    Held in memory per worker like the IngredientIndex: built from the dishview table on first
+    use, then kept current by the create, update and delete handlers of this worker and with the
+    writes of the other workers by the CatalogRefresher. Without NumPy and SciPy the same scores
+    are computed from the IngredientIndex postings in pure Python.
+    """
+
+    def __init__(self):
+        self._matrix = None
+        self._feed = ChangeFeed()
+        self._lock = threading.RLock()
+        self.ingredient_index = None
+
+    def init_app(self, app, ingredient_index):
+        app.config.setdefault("SIMILARITY_METRIC", "jaccard")
+        app.config.setdefault("SIMILARITY_COMPACT_AFTER", 1000)
+        app.config.setdefault("SIMILAR_MAX_RESULTS", 50)
+        app.config.setdefault("FEED_MAX_LIKES", 200)
+        if app.config["SIMILARITY_METRIC"] not in SIMILARITY_METRICS:
+            raise ValueError(f"SIMILARITY_METRIC must be one of {', '.join(SIMILARITY_METRICS)}")
+        self.reset()
+        self.metric = app.config["SIMILARITY_METRIC"]
+        self.compact_after = app.config["SIMILARITY_COMPACT_AFTER"]
+        self.ingredient_index = ingredient_index
+        app.extensions["recommender"] = self
+
+    @property
+    def vectorized(self):
+        return np is not None
+
+    def reset(self):
+        """Forget the matrix, the next query rebuilds it (after writes that bypass the handlers)"""
+        with self._lock:
+            self._matrix = None
+            self._feed = ChangeFeed()
+
+    def _ensure_built(self):
+        if self._matrix is not None:
+            return self._matrix
+        from resource import db
+        from resource.models import DishView
+
+        with self._lock:
+            if self._matrix is None:
+                # before the table is read, the first refresh applies whatever is written meanwhile
+                self._feed.start(db.session)
+                matrix = SimilarityMatrix(self.compact_after)
+                matrix.build(db.session.query(DishView.id, DishView.ingredient_ids)
+                             .order_by(DishView.id).yield_per(10000))
+                self._matrix = matrix
+            return self._matrix
+
+    def refresh(self):
+        """Re-read the dishes other workers created, changed or deleted since the last refresh"""
+        if self._matrix is None:
+            return
+        from resource import db
+        from resource.models import DishView
+
+        # read outside the lock, queries go on against the current matrix meanwhile
+        rows, deleted = load_rows(db.session, [DishView.id, DishView.ingredient_ids], self._feed.poll(db.session))
+        with self._lock:
+            if self._matrix is None:
+                return
+            for dish_id, ingredient_ids in rows:
+                self._matrix.add(dish_id, ingredient_ids)
+            for dish_id in deleted:
+                self._matrix.remove(dish_id)
+
+    def add(self, dish_id, ingredient_ids):
+        # the IngredientIndex is kept current by the handlers itself
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix.add(dish_id, ingredient_ids)
+
+    def remove(self, dish_id):
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix.remove(dish_id)
+
+    def similar(self, dish_id, limit):
+        """(dish_id, score) pairs of the dishes most similar to a dish, None when the dish is unknown"""
+        if not self.vectorized:
+            ingredients = self.ingredient_index.ingredients_of(dish_id)
+            if ingredients is None:
+                return None
+            return self._top_fallback(dict.fromkeys(ingredients, 1), self.metric, limit, {dish_id})
+
+        matrix = self._ensure_built()
+        with self._lock:
+            columns = matrix.ingredients_of(dish_id)
+            if columns is None:
+                return None
+            return matrix.top(dict.fromkeys(columns, 1), self.metric, limit, {dish_id})
+
+    def feed(self, liked_ids, limit):
+        """(dish_id, score, liked dish_id) of the dishes closest to a user's liked dishes, the liked dish
+        sharing the most ingredients with a recommendation is the "because you liked" one"""
+        if self.vectorized:
+            matrix = self._ensure_built()
+            with self._lock:
+                liked = {dish_id: matrix.ingredients_of(dish_id) for dish_id in liked_ids}
+                liked = {dish_id: columns for dish_id, columns in liked.items() if columns}
+                ranked = matrix.top(self._profile(liked), "cosine", limit, set(liked_ids))
+                candidates = {dish_id: matrix.ingredients_of(dish_id) for dish_id, _ in ranked}
+        else:
+            liked = {dish_id: self.ingredient_index.ingredients_of(dish_id) for dish_id in liked_ids}
+            liked = {dish_id: set(ingredient_ids) for dish_id, ingredient_ids in liked.items() if ingredient_ids}
+            ranked = self._top_fallback(self._profile(liked), "cosine", limit, set(liked_ids))
+            candidates = {dish_id: set(self.ingredient_index.ingredients_of(dish_id) or ())
+                          for dish_id, _ in ranked}
+
+        return [(dish_id, score, max(liked, key=lambda liked_id: (len(liked[liked_id] & candidates[dish_id]),
+                                                                  liked_id)))
+                for dish_id, score in ranked]
+
+    @staticmethod
+    def _profile(liked):
+        """How many of the liked dishes contain each ingredient"""
+        profile = {}
+        for ingredients in liked.values():
+            for ingredient in ingredients:
+                profile[ingredient] = profile.get(ingredient, 0) + 1
+        return profile
+
+    def _top_fallback(self, weights, metric, limit, exclude):
+        if not weights:
+            return []
+        binary = all(weight == 1 for weight in weights.values())
+        if not binary:
+            metric = "cosine"
+        norm = len(weights) if binary else math.fsum(weight * weight for weight in weights.values())
+        overlaps = self.ingredient_index.overlaps(weights)
+        return rank([(dish_id, similarity(metric, overlap, norm, size))
+                     for dish_id, (overlap, size) in overlaps.items() if dish_id not in exclude], limit)
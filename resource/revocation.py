@@ -0,0 +1,180 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+
+class BloomFilter:
+    """Fixed size bloom filter over strings, no false negatives, a tunable rate of false positives"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # double hashing, k positions out of one sha256
+        digest = hashlib.sha256(item.encode("utf-8")).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationCache:
+    """In process view of the RevokeToken table for the JWT blocklist check.
+
+    A bloom filter answers "not revoked" for almost every token without any I/O. Only the
+    rare filter hits are confirmed, first against a bounded LRU of known revoked JTIs and then
+    against the table. JTIs revoked by other workers are pulled in incrementally by created_at,
+    re-reading the last REVOCATION_GRACE_SECONDS so rows that committed late or were stamped by
+    a host with a slower clock are not skipped.
+
+    The pull runs in the CatalogRefresher thread every CATALOG_REFRESH_SECONDS, and on the
+    request path when REVOCATION_REFRESH_SECONDS went by without one (the thread is off or
+    stuck). A token logged out on another worker is therefore still accepted here for up to
+    that long, 1 s with the defaults, plus the replication lag when reads go to a replica.
+    Lowering either setting narrows the window at the cost of one small query per tick.
+
+    The check never writes: the rows of tokens that expired anyway are deleted by
+    `flask purge-revoked-tokens` (run it from cron), and a worker rebuilds its filter from the
+    table once it holds more JTIs than it was sized for.
+    """
+
+    def __init__(self, app=None):
+        self.refresh_seconds = 1
+        self.grace = timedelta(seconds=30)
+        self.lru_size = 10000
+        self.capacity = 100000
+        self._bloom = None
+        self._confirmed = OrderedDict()
+        self._watermark = None
+        self._last_refresh = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("REVOCATION_REFRESH_SECONDS", 1)
+        app.config.setdefault("REVOCATION_GRACE_SECONDS", 30)
+        app.config.setdefault("REVOCATION_LRU_SIZE", 10000)
+        app.config.setdefault("REVOCATION_BLOOM_CAPACITY", 100000)
+        self.refresh_seconds = app.config["REVOCATION_REFRESH_SECONDS"]
+        self.grace = timedelta(seconds=app.config["REVOCATION_GRACE_SECONDS"])
+        self.lru_size = app.config["REVOCATION_LRU_SIZE"]
+        self.capacity = app.config["REVOCATION_BLOOM_CAPACITY"]
+        # JTIs loaded for a previous app, which may have used another database
+        self.reset()
+        app.extensions["revocation_cache"] = self
+
+    def reset(self):
+        """Forget the filter and the confirmed JTIs, the next check rebuilds from the table"""
+        with self._lock:
+            self._bloom = None
+            self._confirmed.clear()
+            self._watermark = None
+
+    def is_revoked(self, jti):
+        self._maybe_refresh()
+
+        if jti not in self._bloom:
+            return False
+
+        with self._lock:
+            if jti in self._confirmed:
+                self._confirmed.move_to_end(jti)
+                return True
+
+        # bloom filter hit that is not in the LRU, could be a false positive
+        from resource.models import RevokeToken
+        if RevokeToken.query.filter_by(jti=jti).first() is None:
+            return False
+
+        self._remember(jti)
+        return True
+
+    def revoke(self, jti):
+        """Mark a JTI revoked in this worker right away, the caller stores the RevokeToken row"""
+        self._maybe_refresh()
+        with self._lock:
+            self._bloom.add(jti)
+        self._remember(jti)
+
+    def _remember(self, jti):
+        with self._lock:
+            self._confirmed[jti] = True
+            self._confirmed.move_to_end(jti)
+            while len(self._confirmed) > self.lru_size:
+                self._confirmed.popitem(last=False)
+
+    def _maybe_refresh(self):
+        if self._bloom is None or self._bloom.count > self._bloom.capacity:
+            self.rebuild()
+        elif time.monotonic() - self._last_refresh >= self.refresh_seconds:
+            self.refresh()
+
+    def refresh(self):
+        """Add the JTIs revoked since the last refresh, minus the grace window, to the filter"""
+        if self._bloom is None:
+            # nothing checked yet, the first check builds the filter from the whole table
+            return
+        rows = self._load(self._watermark - self.grace if self._watermark is not None else None)
+        with self._lock:
+            self._watermark = self._add_rows(self._bloom, rows, self._watermark)
+            self._last_refresh = time.monotonic()
+
+    def rebuild(self):
+        """Swap in a filter built from the whole table, sized for what is in it"""
+        rows = self._load(None)
+        bloom = BloomFilter(max(self.capacity, 2 * len(rows)))
+        watermark = self._add_rows(bloom, rows, None)
+        with self._lock:
+            self._bloom = bloom
+            self._watermark = watermark
+            self._confirmed.clear()
+            self._last_refresh = time.monotonic()
+
+    @staticmethod
+    def purge():
+        """Delete the rows of tokens that have expired anyway, returns how many.
+
+        The workers keep the purged JTIs in their filters until they rebuild them, which is
+        harmless: an expired token is rejected before the blocklist is checked.
+        """
+        from resource import db
+        from resource.models import RevokeToken
+
+        deleted = RevokeToken.query.filter(RevokeToken.expires_at < datetime.utcnow()) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    @staticmethod
+    def _load(since):
+        from resource.models import RevokeToken
+
+        query = RevokeToken.query.with_entities(RevokeToken.jti, RevokeToken.created_at)
+        if since is not None:
+            query = query.filter(RevokeToken.created_at >= since)
+        return query.all()
+
+    @staticmethod
+    def _add_rows(bloom, rows, watermark):
+        for jti, created_at in rows:
+            # the grace window reads rows again, they must not count twice towards the capacity
+            if jti not in bloom:
+                bloom.add(jti)
+            if created_at and (watermark is None or created_at > watermark):
+                watermark = created_at
+        return watermark
@@ -1,11 +1,29 @@
-from flask import request, jsonify
+from flask import request, jsonify, current_app
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt, create_refresh_token
 from flask_restx import Resource, Namespace, fields
-from resource import db, bcrypt
-from resource.models import Users, RevokeToken, DishView
+from resource import db, hasher, image_store, thumbnails, revoked_tokens, ingredient_index, name_index, \
+    recommender, response_cache, trending, catalog_snapshot, rate_limiter, ingredient_dictionary
+from resource.hashing import HashPoolOverloaded
+from resource.models import Users, RevokeToken, DishView, likes
+from resource.pagination import keyset_page, keyset_query, page_limit, snapshot_page, decode_cursor, \
+    InvalidCursor
+from resource.streaming import stream_format, batches, streamed_response
+from resource.database import read_only
+from resource.serializers import DETAIL, LISTING, SEARCH_RESULT, InvalidMask, dish_serializer, liker_serializer, \
+    request_mask, wants
+from resource.bulk import BulkRowError, parse_row, write_batch, write_rows_one_by_one, export_row
+from resource.storage import ImageTooLarge, sniff_image_type
+from resource.catalog import log_changes
+from resource.search import SEARCH_MODES, normalize_ingredients, search_ingredients_sql, search_text_sql, \
+    search_text_fallback, most_used_ingredients_sql
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 import base64
-from flask import make_response
+import io
+from flask import send_file
 
 user = Namespace("user", description="Operations on users..")
 dish = Namespace("dish", description="Operations regarding dishes..")
@@ -40,6 +58,7 @@ dish_view_model = dish.model("DishView", {
     'date_posted': fields.DateTime(required=True, description="Date when the dish was viewed"),
     "dish_image_url": fields.String(required=True, description="Dish image"),
     "user_id": fields.Integer(required=True, description="user id"),
+    "like_count": fields.Integer(description="Number of users who liked the dish"),
     "user_likes": fields.List(fields.Nested(user_model), required=True)
 })
 
@@ -52,6 +71,9 @@ class Register(Resource):
                  validate=True)
     @user.response(200, "user created successfully")
     @user.response(400, "user with email address already exist")
+    @user.response(429, "too many sign ups from this address, retry later")
+    @user.response(503, "too many sign ups in progress, retry later")
+    @rate_limiter.limit("register", "auth")
     def post(self):
         data = request.get_json()
         firstname = data.get("firstname")
@@ -60,8 +82,6 @@ class Register(Resource):
         password = data.get("password")
         phone = str(data.get("phone"))
 
-        hashed_password = bcrypt.generate_password_hash(password).decode("utf-8")
-
         email_exist = Users.query.filter_by(email=email).first()
 
         if email_exist:
@@ -70,6 +90,12 @@ class Register(Resource):
             }
             return jsonify(response)
 
+        # only hash once the cheap checks passed
+        try:
+            hashed_password = hasher.hash(password)
+        except HashPoolOverloaded as e:
+            return {"Error": str(e)}, 503, {"Retry-After": str(e.retry_after)}
+
         new_user = Users(firstname=firstname,
                          lastname=lastname,
                          email=email,
@@ -89,28 +115,46 @@ class Register(Resource):
 
 
 def verify_user(email, password):
-    """Function that verify each user login"""
+    """Function that verify each user login, raises HashPoolOverloaded when the hash pool is full"""
     # Retrieve the user from the database based on the provided email
     user = Users.query.filter_by(email=email).first()
 
-    if user and bcrypt.check_password_hash(user.password, password):
+    if user and hasher.check(user.password, password):
+        if hasher.needs_rehash(user.password):
+            upgrade_password_hash(user, password)
         return user.id
 
     return None
 
 
+def upgrade_password_hash(user, password):
+    """Rehash a password with the current BCRYPT_LOG_ROUNDS, skipped when the hash pool is busy"""
+    try:
+        user.password = hasher.hash(password)
+        db.session.commit()
+    except HashPoolOverloaded:
+        # the next login will try again
+        pass
+
+
 @user.route("/login")
 class Login(Resource):
     @user.doc(description="Generate access token")
     @user.expect(user_login, validate=True)
     @user.response(200, "User successfully logged in", user_login)
     @user.response(400, "Invalid credentials")
+    @user.response(429, "too many logins from this address, retry later")
+    @user.response(503, "too many logins in progress, retry later")
+    @rate_limiter.limit("login", "auth")
     def post(self):
         data = request.get_json()
         email = data.get('email')
         password = data.get('password')
 
-        user_id = verify_user(email, password)
+        try:
+            user_id = verify_user(email, password)
+        except HashPoolOverloaded as e:
+            return {"Error": str(e)}, 503, {"Retry-After": str(e.retry_after)}
         if user_id:
             access_token = create_access_token(identity=user_id)
             refresh_token = create_refresh_token(identity=user_id)
@@ -150,11 +194,13 @@ class Logout(Resource):
     @jwt_required(refresh=True)
     @user.doc(description="Logout user", security="jwt")
     def post(self):
-        jti = get_jwt()["jti"]
-        revoke_token = RevokeToken(jti=jti)
+        token = get_jwt()
+        jti = token["jti"]
+        revoke_token = RevokeToken(jti=jti, expires_at=datetime.utcfromtimestamp(token["exp"]))
 
         db.session.add(revoke_token)
         db.session.commit()
+        revoked_tokens.revoke(jti)
 
         return {"message": "User successfully logged out!!"}, 200
 
@@ -167,46 +213,60 @@ class Logout(Resource):
 @dish.route("")
 class PostDishView(Resource):
     @jwt_required(refresh=True)
-    @dish.expect(dish_model, validate=True)
+    @dish.expect(dish_model)
     @dish.response(201, "Dish created successfully")
     @dish.response(400, "Bad request")
-    @dish.doc(description="Creating a dish", security="jwt")
+    @dish.response(413, "Image too large")
+    @dish.response(415, "Unsupported image")
+    @dish.response(429, "Too many dishes created, retry later")
+    @dish.response(503, "Too many uploads in progress, retry later")
+    @dish.doc(description="Creating a dish, send multipart/form-data with the image in the dish_image_url "
+                          "file field, or JSON with a base64 encoded dish_image_url", security="jwt")
+    @rate_limiter.limit("dish_create", "upload")
     def post(self):
-        data = request.get_json()
+        if request.mimetype == "multipart/form-data":
+            name = request.form.get("name")
+            instructions = request.form.get("Instructions")
+            ingredients = request.form.getlist("Ingredients")
+            user_ids = request.form.getlist("user_likes", type=int)
+            has_image = "dish_image_url" in request.files
+        else:
+            data = request.get_json()
+            # the model can only be validated for JSON bodies
+            dish_model.validate(data)
+
+            name = data.get("name")
+            instructions = data.get("Instructions")
+            ingredients = data.get("Ingredients")
+            user_ids = data.get("user_likes", [])
+            has_image = bool(data.get("dish_image_url"))
 
-        name = data.get("name")
-        instructions = data.get("Instructions")
-        ingredients = data.get("Ingredients")
         date_posted = datetime.utcnow()
-        dish_image_url = data.get("dish_image_url")
-        user_ids = data.get("user_likes", [])
 
-        if not all([name, instructions, ingredients, dish_image_url]):
+        if not all([name, instructions, ingredients, has_image]):
             return {"Error": "Missing some fields"}, 400
 
-        try:
-            image64 = base64.b64decode(dish_image_url)
-        except Exception as e:
-            return {"Error": "Invalid image data"}, 400
-
         new_dish = DishView(
             name=name,
             Instructions=instructions,
             Ingredients=ingredients,
             date_posted=date_posted,
-            dish_image_url=image64,
             user_id=2
         )
 
-        if image64:
-            new_dish.dish_image_url = image64
+        try:
+            store_image_upload(new_dish, "dish_image_url")
+        except ImageUploadError as e:
+            return {"Error": e.message}, e.status
 
-        for user_id in user_ids:
+        for user_id in set(user_ids):
             user = Users.query.get(user_id)
-            if user:
-                new_dish.user_likes.append(user)
-
+            if user is None:
                 return {"Error": f"User with ID {user_id} not found!"}, 404
+            new_dish.user_likes.append(user)
+        new_dish.like_count = len(set(user_ids))
+        new_dish.trending_score = trending.updated_score(trending.initial_score(date_posted),
+                                                         [date_posted] * new_dish.like_count)
 
         try:
             db.session.add(new_dish)
@@ -215,6 +275,9 @@ class PostDishView(Resource):
             db.session.rollback()
             return {f"Failed to create Dishview: {str(e)}"}, 500
 
+        thumbnails.submit(new_dish.image_key)
+        dish_saved(new_dish)
+
         return jsonify(
             {
                 "message": f"Dish successfully created for {user_ids}",
@@ -223,98 +286,277 @@ class PostDishView(Resource):
         )
 
 
-# Get all the dishes in the DishView table
+def dish_saved(dish):
+    """Keep the in-process indexes of this worker and the response cache current after a dish was created
+    or updated, the other workers pick it up by its id when it is new, and through log_changes otherwise"""
+    ingredient_index.add(dish.id, dish.ingredient_ids)
+    name_index.add(dish.id, dish.name)
+    recommender.add(dish.id, dish.ingredient_ids)
+    catalog_snapshot.reload([dish.id])
+    response_cache.invalidate(f"dish:{dish.id}", f"user:{dish.user_id}")
+
+
+def dish_deleted(dish_id, user_id):
+    """Drop a deleted dish from the in-process indexes of this worker and the response cache,
+    log_changes tells the other workers"""
+    ingredient_index.remove(dish_id)
+    name_index.remove(dish_id)
+    recommender.remove(dish_id)
+    catalog_snapshot.remove(dish_id)
+    response_cache.invalidate(f"dish:{dish_id}", f"user:{user_id}")
+
+
+def load_user_likes(dish_ids, liker):
+    """Load the users who liked each of the given dishes with a single query on the likes table"""
+    user_likes = {dish_id: [] for dish_id in dish_ids}
+    if not dish_ids:
+        return user_likes
+
+    rows = db.session.query(likes.c["dishview.id"], *liker.columns) \
+        .join(Users, Users.id == likes.c["user.id"]) \
+        .filter(likes.c["dishview.id"].in_(dish_ids))
+
+    for row in rows:
+        user_likes[row[0]].append(liker(row[1:]))
+
+    return user_likes
+
+
+# Get the dishes in the DishView table, newest first, one page per call (?cursor=&limit=)
 @dish.route("/")
 class GetDishView(Resource):
     @jwt_required(refresh=True)
-    @dish.expect(dish.parser().add_argument('X-Fields', location='headers', required=False),
+    @dish.expect(dish.parser().add_argument('X-Fields', location='headers', required=False)
+                 .add_argument('cursor', location='args', required=False)
+                 .add_argument('limit', type=int, location='args', required=False)
+                 .add_argument('include_likes', type=bool, location='args', required=False,
+                               help="Also list the users who liked each dish")
+                 .add_argument('stream', location='args', required=False, choices=("json", "ndjson"),
+                               help="Stream every dish from the cursor on instead of one page"),
                  validate=True)
     @dish.response(200, "Success", dish_view_model)
     @dish.response(400, "Not found")
+    @dish.response(429, "Too many requests, retry later")
+    @dish.response(503, "Too many listings in progress, retry later")
     @dish.doc(description="Get all dishes")
+    @rate_limiter.limit("dish_list", "scan")
+    @read_only
     def get(self):
-        dishes = DishView.query.all()
-        users = Users.query.all()
-
-        recipe_list = []
-        for dish in dishes:
-            user_likes = []
-            for user in users:
-                if user in dish.user_likes:
-                    user_data = {
-                        "id": user.id,
-                        "first_name": user.firstname,
-                        "last_name": user.lastname,
-                        "email": user.email,
-                        "password": user.password,
-                        "phone_number": user.phone
-                    }
-                    user_likes.append(user_data)
-
-            recipe_data = {
-                "id": dish.id,
-                "name": dish.name,
-                "instructions": dish.Instructions,
-                "ingredients": dish.Ingredients,
-                "date_posted": dish.date_posted.isoformat(),
-                "user_likes": user_likes,
-                "user_id": dish.user_id
-            }
-            recipe_list.append(recipe_data)
+        cursor = request.args.get("cursor")
+        try:
+            mask = request_mask()
+            # the pagination cursor is built from date_posted and id even when they are masked out
+            serializer = dish_serializer(LISTING, mask, extra=("date_posted", "id"))
+            liker = liker_serializer(mask)
+        except InvalidMask as e:
+            return {"Error": str(e)}, 400
+        # like_count is enough for most clients, the likes table is only read on request
+        include_likes = request.args.get("include_likes", "").lower() in ("1", "true") \
+            and wants(mask, "user_likes")
+        fmt = stream_format()
+
+        if catalog_snapshot.enabled:
+            # only the likers, when asked for, come from the database
+            try:
+                if fmt:
+                    after = decode_cursor(cursor) if cursor else None
+                    batch_size = current_app.config["STREAM_BATCH_SIZE"]
+                    items = (recipe_list(records, serializer.record, liker if include_likes else None)
+                             for records in catalog_snapshot.newest_batches(after, batch_size))
+                    return streamed_response(fmt, {}, "recipes", items)
+                records, next_cursor = snapshot_page(catalog_snapshot, cursor, page_limit())
+            except InvalidCursor as e:
+                return {"Error": str(e)}, 400
+            return jsonify({"recipes": recipe_list(records, serializer.record, liker if include_likes else None),
+                            "next_cursor": next_cursor})
+
+        query = db.session.query(*serializer.columns)
+        if fmt:
+            try:
+                query = keyset_query(query, DishView, cursor)
+            except InvalidCursor as e:
+                return {"Error": str(e)}, 400
+            items = (recipe_list(rows, serializer, liker if include_likes else None) for rows in batches(query))
+            return streamed_response(fmt, {}, "recipes", items)
+
+        try:
+            rows, next_cursor = keyset_page(query, DishView, cursor, page_limit())
+        except InvalidCursor as e:
+            return {"Error": str(e)}, 400
 
-        response = {"recipes": recipe_list}
+        response = {"recipes": recipe_list(rows, serializer, liker if include_likes else None),
+                    "next_cursor": next_cursor}
         return jsonify(response)
 
 
+def recipe_list(rows, serializer, liker=None):
+    """Listing entries of a batch of dish rows, likers are loaded for the whole batch at once"""
+    recipes = [serializer(row) for row in rows]
+    if liker is not None:
+        user_likes = load_user_likes([row.id for row in rows], liker)
+        for row, recipe_data in zip(rows, recipes):
+            recipe_data["user_likes"] = user_likes.get(row.id, [])
+
+    return recipes
+
+
+# the most popular dishes right now, likes count less the older they are
+@dish.route("/trending")
+class TrendingDishes(Resource):
+    @dish.expect(dish.parser().add_argument('X-Fields', location='headers', required=False)
+                 .add_argument('limit', type=int, location='args', required=False))
+    @dish.response(200, "Success", dish_view_model)
+    @dish.response(400, "Bad request")
+    @dish.doc(description="Trending dishes, most popular first")
+    @read_only
+    def get(self):
+        limit = max(1, min(request.args.get("limit", current_app.config["TRENDING_MAX_RESULTS"], type=int),
+                           current_app.config["TRENDING_MAX_RESULTS"]))
+        try:
+            serializer = dish_serializer(LISTING, request_mask())
+        except InvalidMask as e:
+            return {"Error": str(e)}, 400
+
+        # the first entries of ix_dishview_trending_score_id, the likes table is not read
+        rows = db.session.query(*serializer.columns) \
+            .order_by(DishView.trending_score.desc(), DishView.id.desc()) \
+            .limit(limit).all()
+        return {"recipes": recipe_list(rows, serializer)}, 200
+
+
+class ImageUploadError(Exception):
+    """Raised by store_image_upload with the message and status code to send back"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def store_image_upload(dish, field):
+    """Stream the image of the current request into the image store and point the dish at it.
+
+    The image is read from the `field` file of a multipart/form-data body, from the raw body
+    of an application/octet-stream or image/* request, or, when IMAGE_ACCEPT_BASE64 is on,
+    from the base64 encoded `field` of a JSON body.
+    """
+    mimetype = request.mimetype
+
+    if mimetype == "multipart/form-data":
+        upload = request.files.get(field)
+        if upload is None:
+            raise ImageUploadError("No image data provided")
+        stream = upload.stream
+    elif mimetype == "application/octet-stream" or mimetype.startswith("image/"):
+        stream = request.stream
+    elif request.is_json and current_app.config["IMAGE_ACCEPT_BASE64"]:
+        encoded = (request.get_json() or {}).get(field)
+        if not encoded:
+            raise ImageUploadError("No image data provided")
+        try:
+            stream = io.BytesIO(base64.b64decode(encoded))
+        except Exception:
+            raise ImageUploadError("Invalid image data")
+    else:
+        raise ImageUploadError(f"Unsupported content type {mimetype}", 415)
+
+    try:
+        key, size, head = image_store.put_stream(stream, current_app.config["IMAGE_MAX_BYTES"])
+    except ImageTooLarge as e:
+        raise ImageUploadError(str(e), 413)
+
+    content_type = sniff_image_type(head)
+    if content_type is None:
+        # identical bytes always sniff the same, so no valid image can share this key
+        image_store.delete(key)
+        raise ImageUploadError("Unsupported image type", 415)
+
+    dish.image_key = key
+    dish.image_size = size
+    dish.image_content_type = content_type
+    dish.dish_image_url = None
+
+
 # uploading a dish image by dish_id
 @dish.route("/image/<int:dish_id>/")
 class UpdateDishImage(Resource):
     @jwt_required(refresh=True)
     @dish.response(201, "Imagae uploaded successfully")
     @dish.response(400, "Bad request")
+    @dish.response(413, "Image too large")
+    @dish.response(415, "Unsupported image")
+    @dish.response(429, "Too many uploads, retry later")
     @dish.response(500, "Server error")
-    @dish.doc(description="Uploading an image", security="jwt")
+    @dish.response(503, "Too many uploads in progress, retry later")
+    @dish.doc(description="Uploading an image, send the raw bytes as application/octet-stream, "
+                          "multipart/form-data with a dish_image_data file field, "
+                          "or JSON with a base64 encoded dish_image_data", security="jwt")
+    @rate_limiter.limit("dish_image", "upload")
     def put(self, dish_id):
-        data = request.get_json()
         dish = DishView.query.get(dish_id)
 
         if dish is None:
             return {"error": f"Dish with ID {dish_id} does not exist"}
 
-        if "dish_image_data" in data:
-            try:
-                # Assuming 'dish_image_data' contains base64 encoded image data
-                image_data = data["dish_image_data"]
-                decoded_image = base64.b64decode(image_data)
-                dish.dish_image_url = decoded_image
-                db.session.commit()
-                return {"message": f"Image updated for dish ID {dish_id}"}, 200
-            except Exception as e:
-                db.session.rollback()
-                return {"error": str(e)}, 500
-        else:
-            return {"error": "No image data provided"}, 400
+        try:
+            store_image_upload(dish, "dish_image_data")
+        except ImageUploadError as e:
+            return {"error": e.message}, e.status
+
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return {"error": str(e)}, 500
+
+        thumbnails.submit(dish.image_key)
+        dish_saved(dish)
+        return {"message": f"Image updated for dish ID {dish_id}"}, 200
 
 
 # Endpoint to view dish image by dish_id
 @dish.route("/image/view/<int:dish_id>")
 class ViewDishImage(Resource):
+    @dish.expect(dish.parser().add_argument('size', type=int, location='args', required=False,
+                                            help="Width/height in px of a resized copy"))
     @dish.response(201, "Image viewed successfully")
     @dish.response(404, "Not found")
     @dish.response(500, "Server error")
+    @read_only
     def get(self, dish_id):
         dish = DishView.query.get(dish_id)
 
         if dish is None:
             return {"error": f"Dish with ID {dish_id} does not exist"}, 404
 
+        # send_file with conditional=True answers If-None-Match with 304 and Range with 206
+        size = request.args.get("size", type=int)
+        if dish.image_key and size:
+            # only clients that explicitly list webp get it, */* does not count
+            fmt = "webp" if "image/webp" in request.headers.get("Accept", "") else "jpeg"
+            path, variant_size = thumbnails.find(dish.image_key, size, fmt)
+            # variants are built in the background, until then the original is served
+            if path:
+                response = send_file(path,
+                                     mimetype=f"image/{fmt}",
+                                     etag=f"{dish.image_key}-{variant_size}.{fmt}",
+                                     conditional=True)
+                response.vary.add("Accept")
+                return response
+
+        if dish.image_key:
+            return send_file(image_store.path(dish.image_key),
+                             mimetype=dish.image_content_type,
+                             etag=dish.image_key,
+                             conditional=True)
+
+        # rows that the migrate-images command has not moved yet
         dish_image = dish.dish_image_url
-
         if dish_image:
-            encoded_image = base64.b64encode(dish_image).decode("utf-8")
-            response = make_response(encoded_image)
-            response.headers.set('Content-Type', 'image')  # Adjust the content type based on the image format
-            return response
+            return send_file(io.BytesIO(dish_image),
+                             mimetype=sniff_image_type(dish_image[:32]) or "application/octet-stream",
+                             etag=False,
+                             conditional=True)
 
         return {"error": "No image found for this dish"}, 404
 
@@ -333,9 +575,11 @@ class DeleteDishImage(Resource):
         if dish is None:
             return {"error": f"Dish with ID {dish_id} does not exist"}, 404
 
+        # the blob itself stays in the image store, other dishes may share the same key
+        dish.image_key = None
+        dish.image_size = None
+        dish.image_content_type = None
         dish.dish_image_url = None
-        # Assuming dish_image_url is a column holding image data
-        # Delete the record from the database
 
         db.session.commit()
 
@@ -352,53 +596,131 @@ class LikeDish(Resource):
     @dish.response(404, "Not found")
     def post(self, dish_id):
         current_user_id = get_jwt_identity()
+        liked_at = datetime.utcnow()
 
-        user = Users.query.get(current_user_id)
-        dish = DishView.query.get(dish_id)
+        try:
+            liked = insert_like(current_user_id, dish_id, liked_at)
+            counted = bump_like_count(dish_id, 1 if liked else 0)
+        except IntegrityError:
+            # foreign key on the likes table, the user or the dish does not exist
+            counted = None
+
+        if counted is None:
+            db.session.rollback()
+            return {"Error": "User or dish not found!"}, 404
+
+        like_count, owner_id, trending_score = counted
+        if liked:
+            trending.apply(db.session, {dish_id: (trending_score, [liked_at], [])})
+            catalog_snapshot.log(db.session, [dish_id])
+        db.session.commit()
+        if liked:
+            catalog_snapshot.reload([dish_id])
+            response_cache.invalidate(f"dish:{dish_id}", f"user:{owner_id}")
+
+        if not liked:
+            return {"Error": "User already liked the dish", "like_count": like_count}
 
-        if not user or not dish:
-            return {"Error": "User or dish not found!"}
+        return {"message": "Dish liked successful", "like_count": like_count}
 
-        if user in user.liked_dishes:
-            return {"Error": "User already liked the dish"}
+    @jwt_required(refresh=True)
+    @dish.doc(description="unlike a dish", security="jwt")
+    @dish.response(200, "unlike successful")
+    @dish.response(404, "Not found")
+    def delete(self, dish_id):
+        current_user_id = get_jwt_identity()
+
+        removed = db.session.execute(
+            likes.delete().where(likes.c["user.id"] == current_user_id, likes.c["dishview.id"] == dish_id)
+            .returning(likes.c["created_at"])
+        ).first()
+        unliked = removed is not None
+        counted = bump_like_count(dish_id, -1 if unliked else 0)
 
-        user.liked_dishes.append(dish)
+        if counted is None:
+            db.session.rollback()
+            return {"Error": "Dish not found!"}, 404
+
+        like_count, owner_id, trending_score = counted
+        if unliked:
+            trending.apply(db.session, {dish_id: (trending_score, [], [removed.created_at])})
+            catalog_snapshot.log(db.session, [dish_id])
         db.session.commit()
+        if unliked:
+            catalog_snapshot.reload([dish_id])
+            response_cache.invalidate(f"dish:{dish_id}", f"user:{owner_id}")
+
+        if not unliked:
+            return {"Error": "User has not liked the dish", "like_count": like_count}
+
+        return {"message": "Dish unliked successful", "like_count": like_count}
+
+
+def insert_like(user_id, dish_id, liked_at):
+    """Insert a row in the likes table, False when the user already liked the dish"""
+    insert = pg_insert if db.engine.dialect.name == "postgresql" else sqlite_insert
+    statement = insert(likes).values({likes.c["user.id"]: user_id, likes.c["dishview.id"]: dish_id,
+                                      likes.c["created_at"]: liked_at}) \
+        .on_conflict_do_nothing()
+    return db.session.execute(statement).rowcount == 1
+
 
-        return {"message": "Dish liked successful"}
+def bump_like_count(dish_id, delta):
+    """Add delta to the like_count of a dish in place.
+
+    Returns the new count, the id of the dish's creator and the trending score, None when there
+    is no such dish. The row stays locked until the commit, so the score can be updated from it.
+    """
+    statement = update(DishView).where(DishView.id == dish_id) \
+        .values(like_count=DishView.like_count + delta) \
+        .returning(DishView.like_count, DishView.user_id, DishView.trending_score)
+    return db.session.execute(statement).first()
 
 
 # Get all the dishes by a particular user
 @dish.route("/user/<int:user_id>")
 class GetDishByUser(Resource):
     @jwt_required(refresh=True)
-    @dish.expect(dish.parser().add_argument('X-Fields', location='headers', required=False),
+    @dish.expect(dish.parser().add_argument('X-Fields', location='headers', required=False)
+                 .add_argument('stream', location='args', required=False, choices=("json", "ndjson"),
+                               help="Stream the dishes instead of building the whole list first"),
                  validate=True)
     @dish.response(200, "Success", dish_view_model)
     @dish.response(400, "Not found")
     @dish.doc(description="User", security="jwt")
+    @response_cache.cached(lambda user_id: [f"user:{user_id}"])
+    @read_only
     def get(self, user_id):
-        user = Users.query.get(user_id)
-        if not user:
-            return jsonify({"message": "User not found"}), 404
+        try:
+            serializer = dish_serializer(DETAIL, request_mask())
+        except InvalidMask as e:
+            return {"Error": str(e)}, 400
 
-        user_dishes = DishView.query.filter_by(user_id=user_id).all()
+        fmt = stream_format()
 
-        dish_list = []
-        for dish in user_dishes:
-            dish_data = {
-                "id": dish.id,
-                "name": dish.name,
-                "instructions": dish.Instructions,
-                "ingredients": dish.Ingredients,
-                "date_posted": dish.date_posted.isoformat(),
+        if catalog_snapshot.enabled:
+            if not catalog_snapshot.has_user(user_id):
+                return {"message": "User not found"}, 404
+            records = catalog_snapshot.by_user(user_id)
+            if fmt:
+                size = current_app.config["STREAM_BATCH_SIZE"]
+                items = ([serializer.record(record) for record in records[start:start + size]]
+                         for start in range(0, len(records), size))
+                return streamed_response(fmt, {"user_id": user_id}, "dishes", items)
+            return jsonify({"user_id": user_id, "dishes": [serializer.record(record) for record in records]})
 
-            }
-            dish_list.append(dish_data)
+        if db.session.query(Users.id).filter_by(id=user_id).first() is None:
+            return {"message": "User not found"}, 404
+
+        query = db.session.query(*serializer.columns).filter(DishView.user_id == user_id)
+
+        if fmt:
+            items = ([serializer(row) for row in rows] for rows in batches(query.order_by(DishView.id)))
+            return streamed_response(fmt, {"user_id": user_id}, "dishes", items)
 
         response = {
             "user_id": user_id,
-            "dishes": dish_list
+            "dishes": [serializer(row) for row in query]
         }
         return jsonify(response)
 
@@ -420,12 +742,14 @@ class UpdateDish(Resource):
 
         if "name" in data:
             dish.name = data["name"]
-        if "instructions" in data:
-            dish.instructions = data["Instructions"]
-        if "ingredients" in data:
-            dish.ingredients = data["Ingredients"]
+        if "Instructions" in data:
+            dish.Instructions = data["Instructions"]
+        if "Ingredients" in data:
+            dish.Ingredients = data["Ingredients"]
 
+        log_changes(db.session, [dish.id])
         db.session.commit()
+        dish_saved(dish)
 
         return {"message": f"Dish updated for dish ID {dish_id} successfully!"}
 
@@ -442,9 +766,12 @@ class DeleteDish(Resource):
         dish = DishView.query.get(dish_id)
 
         if dish:
+            user_id = dish.user_id
             try:
                 db.session.delete(dish)
+                log_changes(db.session, [dish_id])
                 db.session.commit()
+                dish_deleted(dish_id, user_id)
                 return {"message": f"Dish with ID {dish_id} deleted successfully"}, 200
             except Exception as e:
                 db.session.rollback()
@@ -456,23 +783,487 @@ class DeleteDish(Resource):
 # get a single dish
 @dish.route("/dishes/<int:dish_id>")
 class GetSingleDish(Resource):
+    @dish.expect(dish.parser().add_argument('X-Fields', location='headers', required=False))
     @dish.response(201, "Success", dish_model)
     @dish.response(404, "Not found")
     @dish.doc(description="Get a particular dish")
+    @response_cache.cached(lambda dish_id: [f"dish:{dish_id}"])
+    @read_only
     def get(self, dish_id):
-        dish = DishView.query.get(dish_id)
+        try:
+            serializer = dish_serializer(DETAIL, request_mask())
+        except InvalidMask as e:
+            return {"Error": str(e)}, 400
 
-        if dish:
+        if catalog_snapshot.enabled:
+            record = catalog_snapshot.get(dish_id)
+            dish_data = serializer.record(record) if record is not None else None
+        else:
+            row = db.session.query(*serializer.columns).filter(DishView.id == dish_id).first()
+            dish_data = serializer(row) if row is not None else None
+
+        if dish_data:
             response = {
-                "resource": {
-                    "id": dish.id,
-                    "name": dish.name,
-                    "instructions": dish.Instructions,
-                    "ingredients": dish.Ingredients,
-                    "date_posted": dish.date_posted.isoformat()
-                }
+                "resource": dish_data
             }
             return response, 200
         else:
             return {"error": f"Dish with ID {dish_id} not found"}, 404
 
+
+def ranked_dishes(ranked):
+    """(dish dict, score) in the order of ranked (dish_id, score) pairs, ids deleted meanwhile are skipped"""
+    serializer = dish_serializer(SEARCH_RESULT)
+    rows = db.session.query(*serializer.columns).filter(DishView.id.in_([dish_id for dish_id, _ in ranked]))
+    dishes = {row.id: serializer(row) for row in rows}
+    return [(dishes[dish_id], score) for dish_id, score in ranked if dish_id in dishes]
+
+
+def use_sql_ingredient_search():
+    """Postgres answers ingredient searches from its GIN index, everything else from the in-memory index"""
+    backend = current_app.config["INGREDIENT_SEARCH"]
+    if backend == "auto":
+        return db.engine.dialect.name == "postgresql"
+    return backend == "sql"
+
+
+# search dishes by ingredients, e.g. ?ingredients=eggs,flour,milk&mode=most
+@dish.route("/search/ingredients")
+class SearchDishByIngredients(Resource):
+    @jwt_required(refresh=True)
+    @dish.expect(dish.parser()
+                 .add_argument('ingredients', location='args', required=True,
+                               help="Comma separated ingredients")
+                 .add_argument('mode', location='args', required=False, choices=SEARCH_MODES,
+                               help="all: every ingredient, any: at least one, most: more than half")
+                 .add_argument('offset', type=int, location='args', required=False)
+                 .add_argument('limit', type=int, location='args', required=False))
+    @dish.response(200, "Success")
+    @dish.response(400, "Bad request")
+    @dish.doc(description="Dishes containing the given ingredients, most matching first", security="jwt")
+    def get(self):
+        terms = normalize_ingredients(request.args.get("ingredients", "").split(","))
+        mode = request.args.get("mode", "all")
+        offset = max(0, request.args.get("offset", 0, type=int))
+        limit = page_limit()
+
+        if not terms:
+            return {"Error": "No ingredients given"}, 400
+        if mode not in SEARCH_MODES:
+            return {"Error": f"mode must be one of {', '.join(SEARCH_MODES)}"}, 400
+
+        term_ids = ingredient_dictionary.lookup(terms)
+        if use_sql_ingredient_search():
+            ranked = search_ingredients_sql(db.session, term_ids, mode, offset, limit)
+        else:
+            ranked = ingredient_index.search(term_ids, mode, offset, limit)
+
+        results = []
+        for dish_data, overlap in ranked_dishes(ranked):
+            dish_data["overlap"] = overlap
+            results.append(dish_data)
+
+        next_offset = offset + limit if len(ranked) == limit else None
+        return {"ingredients": terms, "mode": mode, "dishes": results, "next_offset": next_offset}, 200
+
+
+# full text search over dish names and instructions, e.g. ?q=chocolate cake
+@dish.route("/search")
+class SearchDish(Resource):
+    @jwt_required(refresh=True)
+    @dish.expect(dish.parser()
+                 .add_argument('q', location='args', required=True, help="Search terms")
+                 .add_argument('offset', type=int, location='args', required=False)
+                 .add_argument('limit', type=int, location='args', required=False))
+    @dish.response(200, "Success")
+    @dish.response(400, "Bad request")
+    @dish.doc(description="Dishes matching the search terms, best match first", security="jwt")
+    def get(self):
+        q = request.args.get("q", "").strip()
+        offset = max(0, request.args.get("offset", 0, type=int))
+        limit = page_limit()
+
+        if not q:
+            return {"Error": "No search terms given"}, 400
+
+        if db.engine.dialect.name == "postgresql":
+            ranked = search_text_sql(db.session, q, offset, limit)
+        else:
+            ranked = search_text_fallback(db.session, q, offset, limit)
+
+        results = []
+        for dish_data, rank in ranked_dishes(ranked):
+            dish_data["rank"] = rank
+            results.append(dish_data)
+
+        next_offset = offset + limit if len(ranked) == limit else None
+        return {"q": q, "dishes": results, "next_offset": next_offset}, 200
+
+
+# dish name suggestions while typing, answered from memory
+@dish.route("/autocomplete")
+class AutocompleteDish(Resource):
+    @jwt_required(refresh=True)
+    @dish.expect(dish.parser()
+                 .add_argument('prefix', location='args', required=True)
+                 .add_argument('limit', type=int, location='args', required=False))
+    @dish.response(200, "Success")
+    @dish.doc(description="Dish names starting with the prefix", security="jwt")
+    def get(self):
+        prefix = request.args.get("prefix", "").strip()
+        limit = max(1, min(request.args.get("limit", 10, type=int), current_app.config["AUTOCOMPLETE_MAX_RESULTS"]))
+
+        if not prefix:
+            return {"prefix": prefix, "names": []}, 200
+
+        return {"prefix": prefix, "names": name_index.complete(prefix, limit)}, 200
+
+
+# the ingredients in the most dishes, counted over the ingredient ids
+@dish.route("/ingredients/popular")
+class PopularIngredients(Resource):
+    @dish.expect(dish.parser().add_argument('limit', type=int, location='args', required=False))
+    @dish.response(200, "Success")
+    @dish.doc(description="Most used ingredients, the one in the most dishes first")
+    @response_cache.cached(lambda: ["ingredients"])
+    @read_only
+    def get(self):
+        limit = max(1, min(request.args.get("limit", 20, type=int),
+                           current_app.config["POPULAR_INGREDIENTS_MAX_RESULTS"]))
+
+        # a full scan on postgres, the cached answer is only recounted after RESPONSE_CACHE_TTL
+        if use_sql_ingredient_search():
+            counts = most_used_ingredients_sql(db.session, limit)
+        else:
+            counts = ingredient_index.most_used(limit)
+
+        names = ingredient_dictionary.names([ingredient_id for ingredient_id, _ in counts])
+        return {"ingredients": [{"id": ingredient_id, "name": name, "dish_count": count}
+                                for (ingredient_id, count), name in zip(counts, names)]}, 200
+
+
+def recommendation_limit():
+    return max(1, min(request.args.get("limit", 10, type=int), current_app.config["SIMILAR_MAX_RESULTS"]))
+
+
+# dishes sharing the most ingredients with a dish, answered from the in-memory similarity matrix
+@dish.route("/<int:dish_id>/similar")
+class SimilarDishes(Resource):
+    @jwt_required(refresh=True)
+    @dish.expect(dish.parser().add_argument('limit', type=int, location='args', required=False))
+    @dish.response(200, "Success")
+    @dish.response(404, "Not found")
+    @dish.doc(description="Dishes with the most similar ingredients, most similar first", security="jwt")
+    def get(self, dish_id):
+        ranked = recommender.similar(dish_id, recommendation_limit())
+        if ranked is None:
+            return {"error": f"Dish with ID {dish_id} not found"}, 404
+
+        results = []
+        for dish_data, score in ranked_dishes(ranked):
+            dish_data["similarity"] = round(score, 4)
+            results.append(dish_data)
+
+        return {"dish_id": dish_id, "metric": recommender.metric, "dishes": results}, 200
+
+
+# "because you liked" recommendations from the ingredients of the dishes the user liked
+@dish.route("/feed")
+class DishFeed(Resource):
+    @jwt_required(refresh=True)
+    @dish.expect(dish.parser().add_argument('limit', type=int, location='args', required=False))
+    @dish.response(200, "Success")
+    @dish.doc(description="Dishes similar to the ones the user liked", security="jwt")
+    def get(self):
+        user_id = get_jwt_identity()
+        liked_ids = [dish_id for dish_id, in db.session.query(likes.c["dishview.id"])
+                     .filter(likes.c["user.id"] == user_id)
+                     .order_by(likes.c["dishview.id"].desc())
+                     .limit(current_app.config["FEED_MAX_LIKES"])]
+
+        feed = recommender.feed(liked_ids, recommendation_limit())
+        because = {dish_id: liked_id for dish_id, _, liked_id in feed}
+
+        results = []
+        for dish_data, score in ranked_dishes([(dish_id, score) for dish_id, score, _ in feed]):
+            dish_data["similarity"] = round(score, 4)
+            dish_data["because_you_liked"] = because[dish_data["id"]]
+            results.append(dish_data)
+
+        return {"dishes": results}, 200
+
+
+def is_admin():
+    return get_jwt_identity() in current_app.config["ADMIN_USER_IDS"]
+
+
+# whole catalog import/export as NDJSON, one dish per line
+@dish.route("/bulk", endpoint="dish_bulk")
+class BulkDish(Resource):
+    @jwt_required(refresh=True)
+    @dish.expect(dish.parser().add_argument('resume_from', type=int, location='args', required=False,
+                                            help="last_committed_line of an interrupted import"))
+    @dish.response(200, "Import finished, see errors for the rejected lines")
+    @dish.response(403, "Forbidden")
+    @dish.response(500, "Import stopped, resume from last_committed_line")
+    @dish.doc(description="Import dishes from an NDJSON body, one object per line with name, Instructions, "
+                          "Ingredients and optionally date_posted, user_id and a base64 dish_image", security="jwt")
+    def post(self):
+        if not is_admin():
+            return {"Error": "Admins only"}, 403
+
+        resume_from = max(0, request.args.get("resume_from", 0, type=int))
+        batch_size = current_app.config["BULK_BATCH_SIZE"]
+        max_errors = current_app.config["BULK_MAX_REPORTED_ERRORS"]
+        table = DishView.__table__
+
+        imported = 0
+        error_count = 0
+        errors = []
+        user_ids = set()
+        batch = []
+        last_committed_line = resume_from
+        line_number = resume_from
+
+        def report(line, error):
+            nonlocal error_count
+            error_count += 1
+            if len(errors) < max_errors:
+                errors.append({"line": line, "error": error})
+
+        def flush():
+            nonlocal imported, last_committed_line
+            if batch:
+                try:
+                    write_batch(db.session, table, [row for _, row in batch])
+                    db.session.commit()
+                    failed = []
+                except Exception:
+                    # find the rows the database refused
+                    db.session.rollback()
+                    failed = write_rows_one_by_one(db.session, table, batch)
+                    db.session.commit()
+                for line, error in failed:
+                    report(line, error)
+                imported += len(batch) - len(failed)
+                user_ids.update(row["user_id"] for _, row in batch)
+                batch.clear()
+            last_committed_line = line_number
+
+        try:
+            for line_number, line in enumerate(request.stream, start=1):
+                if line_number <= resume_from:
+                    continue
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    batch.append((line_number, parse_row(line, image_store, trending, ingredient_dictionary)))
+                except BulkRowError as e:
+                    report(line_number, str(e))
+                if len(batch) >= batch_size:
+                    flush()
+            flush()
+        except Exception as e:
+            db.session.rollback()
+            return {"Error": f"Import stopped: {e}", "imported": imported, "error_count": error_count,
+                    "errors": errors, "last_committed_line": last_committed_line}, 500
+        finally:
+            # the rows did not go through the handlers, the search indexes of every worker pick them
+            # up by their ids on the next refresh
+            if imported:
+                response_cache.invalidate(*[f"user:{user_id}" for user_id in user_ids])
+
+        return {"imported": imported, "error_count": error_count, "errors": errors,
+                "last_committed_line": last_committed_line}, 200
+
+    @jwt_required(refresh=True)
+    @dish.expect(dish.parser()
+                 .add_argument('after_id', type=int, location='args', required=False,
+                               help="Only dishes with a bigger id, to resume an export")
+                 .add_argument('include_images', type=bool, location='args', required=False,
+                               help="Embed the images base64 encoded"))
+    @dish.response(200, "NDJSON, one dish per line")
+    @dish.response(403, "Forbidden")
+    @dish.doc(description="Export every dish as NDJSON", security="jwt")
+    def get(self):
+        if not is_admin():
+            return {"Error": "Admins only"}, 403
+
+        after_id = request.args.get("after_id", 0, type=int)
+        include_images = request.args.get("include_images", "").lower() in ("1", "true")
+
+        query = DishView.query.filter(DishView.id > after_id).order_by(DishView.id)
+        items = ([export_row(dish, image_store, include_images) for dish in dishes] for dishes in batches(query))
+        return streamed_response("ndjson", {}, None, items)
+
+
+def batch_ids(data, key):
+    """Validated, de-duplicated list of dish ids under key of a batch request body, raises ValueError"""
+    ids = (data or {}).get(key, [])
+    if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+        raise ValueError(f"{key} must be a list of dish ids")
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > current_app.config["BATCH_MAX_ITEMS"]:
+        raise ValueError(f"At most {current_app.config['BATCH_MAX_ITEMS']} ids per request")
+    return ids
+
+
+# several dishes in one request and one query
+@dish.route("/batch/get")
+class BatchGetDish(Resource):
+    @dish.expect(dish.model("BatchIds", {"ids": fields.List(fields.Integer, required=True)}))
+    @dish.response(200, "Success, see the status of each item")
+    @dish.response(400, "Bad request")
+    @dish.doc(description="Get many dishes by id")
+    def post(self):
+        try:
+            ids = batch_ids(request.get_json(), "ids")
+        except ValueError as e:
+            return {"Error": str(e)}, 400
+
+        serializer = dish_serializer(DETAIL)
+        rows = db.session.query(*serializer.columns).filter(DishView.id.in_(ids)) if ids else []
+        dishes = {row.id: row for row in rows}
+
+        items = []
+        for dish_id in ids:
+            row = dishes.get(dish_id)
+            if row is None:
+                items.append({"id": dish_id, "status": 404, "error": f"Dish with ID {dish_id} not found"})
+            else:
+                items.append({"id": dish_id, "status": 200, "resource": serializer(row)})
+
+        return {"items": items}, 200
+
+
+# like and unlike many dishes in one transaction
+@dish.route("/batch/likes")
+class BatchLikeDish(Resource):
+    @jwt_required(refresh=True)
+    @dish.expect(dish.model("BatchLikes", {"like": fields.List(fields.Integer),
+                                           "unlike": fields.List(fields.Integer)}))
+    @dish.response(200, "Success, see the status of each item")
+    @dish.response(400, "Bad request")
+    @dish.doc(description="Like and unlike many dishes", security="jwt")
+    def post(self):
+        data = request.get_json()
+        try:
+            like_ids = batch_ids(data, "like")
+            unlike_ids = batch_ids(data, "unlike")
+        except ValueError as e:
+            return {"Error": str(e)}, 400
+        if set(like_ids) & set(unlike_ids):
+            return {"Error": "A dish can not be liked and unliked in the same request"}, 400
+
+        current_user_id = get_jwt_identity()
+        liked_at = datetime.utcnow()
+        requested = like_ids + unlike_ids
+        existing = {dish_id for dish_id, in db.session.query(DishView.id).filter(DishView.id.in_(requested))} \
+            if requested else set()
+
+        liked = insert_likes(current_user_id, [i for i in like_ids if i in existing], liked_at)
+        unliked = delete_likes(current_user_id, [i for i in unlike_ids if i in existing])
+        counts = bump_like_counts(liked, 1)
+        counts.update(bump_like_counts(unliked, -1))
+        trending.apply(db.session, {dish_id: (trending_score, [liked_at] if dish_id in liked else [],
+                                              [unliked[dish_id]] if dish_id in unliked else [])
+                                    for dish_id, (_, _, trending_score) in counts.items()})
+        catalog_snapshot.log(db.session, list(counts))
+
+        # dishes whose count did not move still report it
+        unchanged = existing - set(counts)
+        if unchanged:
+            counts.update({dish_id: (like_count, owner_id, None) for dish_id, like_count, owner_id in
+                           db.session.query(DishView.id, DishView.like_count, DishView.user_id)
+                          .filter(DishView.id.in_(unchanged))})
+
+        db.session.commit()
+        catalog_snapshot.reload(set(liked) | set(unliked))
+        for dish_id, (_, owner_id, _) in counts.items():
+            if dish_id in liked or dish_id in unliked:
+                response_cache.invalidate(f"dish:{dish_id}", f"user:{owner_id}")
+
+        items = []
+        for action, ids, changed in (("like", like_ids, liked), ("unlike", unlike_ids, unliked)):
+            for dish_id in ids:
+                if dish_id not in existing:
+                    items.append({"id": dish_id, "action": action, "status": 404,
+                                  "error": f"Dish with ID {dish_id} not found"})
+                else:
+                    items.append({"id": dish_id, "action": action, "status": 200,
+                                  "changed": dish_id in changed, "like_count": counts[dish_id][0]})
+
+        return {"items": items}, 200
+
+
+def insert_likes(user_id, dish_ids, liked_at):
+    """Insert the likes of one user in one statement, returns the dish ids that were not liked yet"""
+    if not dish_ids:
+        return set()
+    insert = pg_insert if db.engine.dialect.name == "postgresql" else sqlite_insert
+    statement = insert(likes).values([{likes.c["user.id"]: user_id, likes.c["dishview.id"]: dish_id,
+                                       likes.c["created_at"]: liked_at}
+                                      for dish_id in dish_ids]) \
+        .on_conflict_do_nothing() \
+        .returning(likes.c["dishview.id"])
+    return set(db.session.execute(statement).scalars())
+
+
+def delete_likes(user_id, dish_ids):
+    """Delete the likes of one user in one statement, returns {dish_id: created_at} of the dishes that were liked"""
+    if not dish_ids:
+        return {}
+    statement = likes.delete() \
+        .where(likes.c["user.id"] == user_id, likes.c["dishview.id"].in_(dish_ids)) \
+        .returning(likes.c["dishview.id"], likes.c["created_at"])
+    return {dish_id: created_at for dish_id, created_at in db.session.execute(statement)}
+
+
+def bump_like_counts(dish_ids, delta):
+    """bump_like_count for many dishes in one statement, returns {dish_id: (like_count, owner_id, trending_score)}"""
+    if not dish_ids:
+        return {}
+    statement = update(DishView).where(DishView.id.in_(list(dish_ids))) \
+        .values(like_count=DishView.like_count + delta) \
+        .returning(DishView.id, DishView.like_count, DishView.user_id, DishView.trending_score)
+    return {dish_id: (like_count, owner_id, trending_score)
+            for dish_id, like_count, owner_id, trending_score in db.session.execute(statement)}
+
+
+# delete many dishes in one transaction
+@dish.route("/batch/delete")
+class BatchDeleteDish(Resource):
+    @jwt_required(refresh=True)
+    @dish.expect(dish.model("BatchDelete", {"ids": fields.List(fields.Integer, required=True)}))
+    @dish.response(200, "Success, see the status of each item")
+    @dish.response(400, "Bad request")
+    @dish.response(500, "Nothing was deleted")
+    @dish.doc(description="Delete many dishes", security="jwt")
+    def post(self):
+        try:
+            ids = batch_ids(request.get_json(), "ids")
+        except ValueError as e:
+            return {"Error": str(e)}, 400
+
+        dishes = {dish.id: dish for dish in DishView.query.filter(DishView.id.in_(ids))} if ids else {}
+        owners = {dish_id: dish.user_id for dish_id, dish in dishes.items()}
+
+        try:
+            for dish in dishes.values():
+                db.session.delete(dish)
+            log_changes(db.session, list(dishes))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return {"error": str(e)}, 500
+
+        items = []
+        for dish_id in ids:
+            if dish_id in owners:
+                dish_deleted(dish_id, owners[dish_id])
+                items.append({"id": dish_id, "status": 200})
+            else:
+                items.append({"id": dish_id, "status": 404, "error": f"Dish with ID {dish_id} not found"})
+
+        return {"items": items}, 200
@@ -0,0 +1,365 @@
+import bisect
+import heapq
+import threading
+from collections import Counter
+from sqlalchemy import case, or_, text
+from resource.catalog import ChangeFeed, load_rows
+
+SEARCH_MODES = ("all", "any", "most")
+
+
+def clean_ingredients(ingredients):
+    """Lower cased, trimmed and de-duplicated ingredient names, in the order they were given"""
+    return list(dict.fromkeys(name.strip().lower() for name in ingredients or [] if name and name.strip()))
+
+
+def normalize_ingredients(ingredients):
+    """Lower cased, trimmed, de-duplicated and sorted ingredient names"""
+    return sorted(clean_ingredients(ingredients))
+
+
+def min_overlap(mode, terms):
+    """How many of the searched ingredients a dish needs to match"""
+    if mode == "all":
+        return len(terms)
+    if mode == "most":
+        # a majority of them
+        return len(terms) // 2 + 1
+    return 1
+
+
+class IngredientIndex:
+    """Inverted index ingredient id -> dish ids, used when the database has no GIN index (SQLite, tests).
+
+    Built from the dishview table on first use, then kept current by the create, update and
+    delete handlers of this worker through add/remove, and with the writes of the other workers
+    by the CatalogRefresher through refresh().
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._dishes = {}
+        self._built = False
+        self._feed = ChangeFeed()
+        self._lock = threading.RLock()
+
+    def init_app(self, app):
+        # the postings of a previous app would outlive it, its database may not be this one
+        self.reset()
+        app.extensions["ingredient_index"] = self
+
+    def reset(self):
+        """Forget everything, the next search rebuilds from the table"""
+        with self._lock:
+            self._postings = {}
+            self._dishes = {}
+            self._built = False
+            self._feed = ChangeFeed()
+
+    def _ensure_built(self):
+        if self._built:
+            return
+        from resource import db
+        from resource.models import DishView
+
+        with self._lock:
+            if self._built:
+                return
+            # before the table is read, the first refresh applies whatever is written meanwhile
+            self._feed.start(db.session)
+            rows = db.session.query(DishView.id, DishView.ingredient_ids).all()
+            for dish_id, ingredient_ids in rows:
+                self._add(dish_id, ingredient_ids or ())
+            self._built = True
+
+    def refresh(self):
+        """Re-read the dishes other workers created, changed or deleted since the last refresh"""
+        if not self._built:
+            return
+        from resource import db
+        from resource.models import DishView
+
+        # read outside the lock, searches go on against the current postings meanwhile
+        rows, deleted = load_rows(db.session, [DishView.id, DishView.ingredient_ids], self._feed.poll(db.session))
+        with self._lock:
+            for dish_id, ingredient_ids in rows:
+                ingredient_ids = tuple(ingredient_ids or ())
+                if self._dishes.get(dish_id) != ingredient_ids:
+                    self._add(dish_id, ingredient_ids)
+            for dish_id in deleted:
+                self._remove(dish_id)
+
+    def _add(self, dish_id, ingredient_ids):
+        self._remove(dish_id)
+        self._dishes[dish_id] = tuple(ingredient_ids)
+        for ingredient_id in ingredient_ids:
+            self._postings.setdefault(ingredient_id, set()).add(dish_id)
+
+    def _remove(self, dish_id):
+        for ingredient_id in self._dishes.pop(dish_id, ()):
+            postings = self._postings.get(ingredient_id)
+            if postings is not None:
+                postings.discard(dish_id)
+                if not postings:
+                    del self._postings[ingredient_id]
+
+    def add(self, dish_id, ingredient_ids):
+        # before the first search there is nothing to keep current, the build reads the table
+        with self._lock:
+            if self._built:
+                self._add(dish_id, ingredient_ids or ())
+
+    def remove(self, dish_id):
+        with self._lock:
+            if self._built:
+                self._remove(dish_id)
+
+    def search(self, term_ids, mode, offset, limit):
+        """Ranked (dish_id, overlap) pairs, most overlapping first then newest.
+
+        term_ids are the ids of the searched ingredients, None for the ones no dish uses.
+        """
+        self._ensure_built()
+        needed = min_overlap(mode, term_ids)
+
+        with self._lock:
+            postings = [self._postings.get(ingredient_id, set()) for ingredient_id in term_ids]
+            if mode == "all":
+                # intersect starting from the rarest ingredient
+                postings.sort(key=len)
+                matches = set(postings[0]).intersection(*postings[1:]) if postings else set()
+                ranked = [(dish_id, len(term_ids)) for dish_id in matches]
+            else:
+                overlap = Counter()
+                for dish_ids in postings:
+                    overlap.update(dish_ids)
+                ranked = [(dish_id, count) for dish_id, count in overlap.items() if count >= needed]
+
+        page = heapq.nsmallest(offset + limit, ranked, key=lambda pair: (-pair[1], -pair[0]))
+        return page[offset:]
+
+    def ingredients_of(self, dish_id):
+        """Ingredient ids of an indexed dish, None for an unknown dish"""
+        self._ensure_built()
+        with self._lock:
+            return self._dishes.get(dish_id)
+
+    def overlaps(self, weights):
+        """{dish_id: (weighted overlap, ingredient count)} of the dishes sharing an ingredient with weights"""
+        self._ensure_built()
+        overlap = Counter()
+        with self._lock:
+            for ingredient_id, weight in weights.items():
+                for dish_id in self._postings.get(ingredient_id, ()):
+                    overlap[dish_id] += weight
+            return {dish_id: (value, len(self._dishes[dish_id])) for dish_id, value in overlap.items()}
+
+    def most_used(self, limit):
+        """(ingredient_id, dish count) of the ingredients in the most dishes, most first"""
+        self._ensure_built()
+        with self._lock:
+            counts = [(ingredient_id, len(dish_ids)) for ingredient_id, dish_ids in self._postings.items()]
+        return heapq.nsmallest(limit, counts, key=lambda pair: (-pair[1], pair[0]))
+
+
+# GIN index on dishview.ingredient_ids answers && (any) and @> (all), the overlap count
+# is only computed for the rows the index let through
+_SQL_ALL = text("""
+    SELECT id, :needed AS overlap FROM dishview
+    WHERE ingredient_ids @> CAST(:ids AS integer[])
+    ORDER BY id DESC
+    LIMIT :limit OFFSET :offset
+""")
+
+_SQL_OVERLAP = text("""
+    SELECT d.id, count(*) AS overlap
+    FROM dishview d, unnest(d.ingredient_ids) AS i(id)
+    WHERE d.ingredient_ids && CAST(:ids AS integer[]) AND i.id = ANY(CAST(:ids AS integer[]))
+    GROUP BY d.id
+    HAVING count(*) >= :needed
+    ORDER BY overlap DESC, d.id DESC
+    LIMIT :limit OFFSET :offset
+""")
+
+_SQL_MOST_USED = text("""
+    SELECT i.id, count(*) AS dish_count
+    FROM dishview d, unnest(d.ingredient_ids) AS i(id)
+    GROUP BY i.id
+    ORDER BY dish_count DESC, i.id
+    LIMIT :limit
+""")
+
+
+def search_ingredients_sql(session, term_ids, mode, offset, limit):
+    """Postgres version of IngredientIndex.search"""
+    ids = [ingredient_id for ingredient_id in term_ids if ingredient_id is not None]
+    needed = min_overlap(mode, term_ids)
+    if len(ids) < needed:
+        return []
+    statement = _SQL_ALL if mode == "all" else _SQL_OVERLAP
+    params = {"ids": ids, "needed": needed, "offset": offset, "limit": limit}
+    return [(dish_id, overlap) for dish_id, overlap in session.execute(statement, params)]
+
+
+def most_used_ingredients_sql(session, limit):
+    """Postgres version of IngredientIndex.most_used, counted over the integer arrays of every dish"""
+    return [(ingredient_id, count) for ingredient_id, count in session.execute(_SQL_MOST_USED, {"limit": limit})]
+
+
+class NameIndex:
+    """Sorted array of lower cased dish names for prefix autocomplete without touching the database.
+
+    Built from the dishview table on first use, then kept current by the create, update and
+    delete handlers of this worker through add/remove, and with the writes of the other workers
+    by the CatalogRefresher through refresh().
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._names = {}
+        self._built = False
+        self._feed = ChangeFeed()
+        self._lock = threading.RLock()
+
+    def init_app(self, app):
+        self.reset()
+        app.extensions["name_index"] = self
+
+    def reset(self):
+        """Forget everything, the next completion rebuilds from the table"""
+        with self._lock:
+            self._entries = []
+            self._names = {}
+            self._built = False
+            self._feed = ChangeFeed()
+
+    def _ensure_built(self):
+        if self._built:
+            return
+        from resource import db
+        from resource.models import DishView
+
+        with self._lock:
+            if self._built:
+                return
+            # before the table is read, the first refresh applies whatever is written meanwhile
+            self._feed.start(db.session)
+            rows = db.session.query(DishView.id, DishView.name).all()
+            self._names = {dish_id: name for dish_id, name in rows}
+            self._entries = sorted((name.lower(), name, dish_id) for dish_id, name in rows)
+            self._built = True
+
+    def refresh(self):
+        """Re-read the dishes other workers created, renamed or deleted since the last refresh"""
+        if not self._built:
+            return
+        from resource import db
+        from resource.models import DishView
+
+        # read outside the lock, completions go on against the current entries meanwhile
+        rows, deleted = load_rows(db.session, [DishView.id, DishView.name], self._feed.poll(db.session))
+        with self._lock:
+            for dish_id, name in rows:
+                if self._names.get(dish_id) != name:
+                    self._add(dish_id, name)
+            for dish_id in deleted:
+                self._remove(dish_id)
+
+    def _add(self, dish_id, name):
+        self._remove(dish_id)
+        self._names[dish_id] = name
+        bisect.insort(self._entries, (name.lower(), name, dish_id))
+
+    def _remove(self, dish_id):
+        name = self._names.pop(dish_id, None)
+        if name is not None:
+            entry = (name.lower(), name, dish_id)
+            position = bisect.bisect_left(self._entries, entry)
+            if position < len(self._entries) and self._entries[position] == entry:
+                del self._entries[position]
+
+    def add(self, dish_id, name):
+        with self._lock:
+            if self._built:
+                self._add(dish_id, name)
+
+    def remove(self, dish_id):
+        with self._lock:
+            if self._built:
+                self._remove(dish_id)
+
+    def complete(self, prefix, limit):
+        """Up to limit distinct dish names starting with prefix, case insensitive"""
+        self._ensure_built()
+        prefix = prefix.lower()
+        names = []
+
+        with self._lock:
+            position = bisect.bisect_left(self._entries, (prefix,))
+            while position < len(self._entries) and len(names) < limit:
+                key, name, _ = self._entries[position]
+                if not key.startswith(prefix):
+                    break
+                if not names or names[-1] != name:
+                    names.append(name)
+                position += 1
+
+        return names
+
+
+# keeps dishview.search_vector current on postgres, also for rows written with COPY or raw SQL
+SEARCH_VECTOR_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION dishview_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW."Instructions", '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS dishview_search_vector_trigger ON dishview",
+    """
+    CREATE TRIGGER dishview_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, "Instructions" ON dishview
+    FOR EACH ROW EXECUTE FUNCTION dishview_search_vector_update()
+    """,
+]
+
+_SQL_FULL_TEXT = text("""
+    SELECT id, ts_rank_cd(search_vector, query) AS rank
+    FROM dishview, websearch_to_tsquery('english', :q) AS query
+    WHERE search_vector @@ query
+    ORDER BY rank DESC, id DESC
+    LIMIT :limit OFFSET :offset
+""")
+
+
+def search_text_sql(session, q, offset, limit):
+    """Ranked (dish_id, rank) pairs from the tsvector GIN index"""
+    return [(dish_id, rank) for dish_id, rank in session.execute(
+        _SQL_FULL_TEXT, {"q": q, "offset": offset, "limit": limit})]
+
+
+def search_text_fallback(session, q, offset, limit):
+    """Ranked (dish_id, rank) pairs for databases without full text search, a match in the name counts double"""
+    from resource.models import DishView
+
+    terms = [term for term in q.lower().split() if term]
+    if not terms:
+        return []
+
+    rank = sum(
+        case((DishView.name.icontains(term, autoescape=True), 2), else_=0) +
+        case((DishView.Instructions.icontains(term, autoescape=True), 1), else_=0)
+        for term in terms
+    )
+    matches = or_(*[or_(DishView.name.icontains(term, autoescape=True),
+                        DishView.Instructions.icontains(term, autoescape=True))
+                    for term in terms])
+
+    rows = session.query(DishView.id, rank).filter(matches) \
+        .order_by(rank.desc(), DishView.id.desc()) \
+        .offset(offset).limit(limit).all()
+    return [(dish_id, float(score)) for dish_id, score in rows]
@@ -0,0 +1,205 @@
+import functools
+import json
+from operator import attrgetter
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+from flask_restx.mask import Mask, ParseError
+
+try:
+    import orjson
+except ImportError:  # optional, the standard library encoder is used without it
+    orjson = None
+
+
+def dumps(obj):
+    """Compact JSON text, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"))
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """app.json provider for jsonify, keys are not sorted and orjson encodes when available"""
+
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            try:
+                return dumps(obj)
+            except TypeError:
+                # types only the default provider knows (dates, decimals, uuids, dataclasses)
+                pass
+        return super().dumps(obj, **kwargs)
+
+
+def output_json(data, code, headers=None):
+    """flask_restx representation of dicts returned by the handlers"""
+    response = current_app.response_class(dumps(data) + "\n", status=code, mimetype="application/json")
+    response.headers.extend(headers or {})
+    return response
+
+
+class InvalidMask(ValueError):
+    """The X-Fields header can not be parsed or names an unknown field"""
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def _ingredients(ingredient_ids, ingredient_labels, legacy_ingredients):
+    if ingredient_ids is None:
+        # not converted by `flask migrate-ingredients` yet
+        return legacy_ingredients
+    if ingredient_labels is not None:
+        return ingredient_labels
+    from resource import ingredient_dictionary
+    return ingredient_dictionary.names(ingredient_ids)
+
+
+# output name -> (DishView attribute, converter), with a tuple of attributes the converter gets all of them
+DISH_FIELDS = {
+    "id": ("id", None),
+    "name": ("name", None),
+    "instructions": ("Instructions", None),
+    "ingredients": (("ingredient_ids", "ingredient_labels", "legacy_ingredients"), _ingredients),
+    "date_posted": ("date_posted", _iso),
+    "like_count": ("like_count", None),
+    "user_id": ("user_id", None),
+}
+
+# output name -> (Users attribute, converter), the password hash is never part of it
+LIKER_FIELDS = {
+    "id": ("id", None),
+    "first_name": ("firstname", None),
+    "last_name": ("lastname", None),
+    "email": ("email", None),
+    "phone_number": ("phone", None),
+}
+
+LISTING = ("id", "name", "instructions", "ingredients", "date_posted", "like_count", "user_id")
+DETAIL = ("id", "name", "instructions", "ingredients", "date_posted", "like_count")
+SEARCH_RESULT = ("id", "name", "instructions", "ingredients", "date_posted", "user_id")
+
+
+def _dict_builder(names, values_of, converters):
+    """Function of a row to the dict of names and values, converters are (name, function of the value and the row)"""
+    if not converters:
+        return lambda row: dict(zip(names, values_of(row)))
+
+    def build(row):
+        item = dict(zip(names, values_of(row)))
+        for name, converter in converters:
+            item[name] = converter(item[name], row)
+        return item
+
+    return build
+
+
+def _row_converter(converter, indexes):
+    if not indexes:
+        return lambda value, row: converter(value)
+    return lambda value, row: converter(value, *[row[index] for index in indexes])
+
+
+def _record_converter(converter, attributes):
+    if not attributes:
+        return lambda value, record: converter(value)
+    return lambda value, record: converter(value, *[getattr(record, attribute) for attribute in attributes])
+
+
+class RowSerializer:
+    """Turns result rows of a column projection into dicts.
+
+    `columns` is what to select, in the order the serializer reads the row. The names and the
+    converters are resolved once per field list, a row is then zipped with the names into a dict
+    and only the fields with a converter are touched again. `record` is the same for objects
+    that carry the model attributes, read with one attrgetter, e.g. the catalog snapshot records.
+    """
+
+    def __init__(self, model, spec, fields, extra=()):
+        self.fields = tuple(fields)
+        attributes, more = [], {}
+        for name in self.fields:
+            attribute = spec[name][0]
+            if isinstance(attribute, tuple):
+                attribute, more[name] = attribute[0], attribute[1:]
+            attributes.append(attribute)
+        # columns the converters read besides the field's own, and the ones needed by the
+        # handler (e.g. the pagination cursor), neither are sent
+        for attribute in [attribute for names in more.values() for attribute in names] + list(extra):
+            if attribute not in attributes:
+                attributes.append(attribute)
+        self.columns = [getattr(model, attribute) for attribute in attributes]
+
+        converters, record_converters = [], []
+        for name in self.fields:
+            converter = spec[name][1]
+            if converter is not None:
+                others = more.get(name, ())
+                converters.append((name, _row_converter(converter, [attributes.index(a) for a in others])))
+                record_converters.append((name, _record_converter(converter, others)))
+        # zip stops at the sent fields, they come first in the row and the extra columns after them
+        self._serialize = _dict_builder(self.fields, iter, converters)
+        if len(self.fields) == 1:
+            record_values = lambda row, get=attrgetter(attributes[0]): (get(row),)
+        else:
+            record_values = attrgetter(*attributes[:len(self.fields)]) if self.fields else lambda row: ()
+        self.record = _dict_builder(self.fields, record_values, record_converters)
+
+    def __call__(self, row):
+        return self._serialize(row)
+
+
+def _masked(fields, spec, mask):
+    if mask is None or "*" in mask:
+        return tuple(fields)
+    unknown = [name for name in mask if name not in spec and name != "user_likes"]
+    if unknown:
+        raise InvalidMask(f"Unknown field {unknown[0]} in X-Fields")
+    return tuple(name for name in fields if name in mask)
+
+
+@functools.lru_cache(maxsize=256)
+def _dish_serializer(fields, extra):
+    from resource.models import DishView
+    return RowSerializer(DishView, DISH_FIELDS, fields, extra)
+
+
+@functools.lru_cache(maxsize=64)
+def _liker_serializer(fields):
+    from resource.models import Users
+    return RowSerializer(Users, LIKER_FIELDS, fields)
+
+
+def request_mask():
+    """The parsed X-Fields header of the current request, None when there is none"""
+    header = request.headers.get("X-Fields")
+    if not header:
+        return None
+    try:
+        return Mask(header)
+    except ParseError as e:
+        raise InvalidMask(f"Invalid X-Fields: {e}")
+
+
+def dish_serializer(fields, mask=None, extra=()):
+    """Serializer of the given DishView fields, narrowed down by an X-Fields mask.
+
+    extra names DishView attributes the handler needs in the rows besides the sent fields, the
+    id is always selected so a mask can not leave the SELECT empty.
+    """
+    return _dish_serializer(_masked(fields, DISH_FIELDS, mask), tuple(extra) + ("id",))
+
+
+def liker_serializer(mask=None):
+    """Serializer of the users in user_likes, narrowed down by the user_likes{...} part of a mask"""
+    nested = mask.get("user_likes") if mask is not None else None
+    return _liker_serializer(_masked(tuple(LIKER_FIELDS), LIKER_FIELDS,
+                                     nested if isinstance(nested, Mask) else None))
+
+
+def wants(mask, name):
+    """Whether a field outside of the column serializers (e.g. user_likes) is part of the response"""
+    return mask is None or "*" in mask or name in mask
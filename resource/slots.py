@@ -0,0 +1,132 @@
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+
+# a slot held longer than this is taken back, in case its release failed
+SLOT_LEASE_SECONDS = 600
+
+SLOTS_SCHEMA = (
+    # AUTOINCREMENT, the late release of a reclaimed slot must not free a newer one
+    "CREATE TABLE IF NOT EXISTS slots (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, "
+    "pid INTEGER NOT NULL, acquired REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_slots_name ON slots (name)",
+)
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedSQLite:
+    """A SQLite file shared by the worker processes of one host.
+
+    Every transaction on it is short, put the file on a tmpfs such as /dev/shm to keep it off the
+    disk. Connections are opened per thread and again after a fork, the first one creates the schema.
+    """
+
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            # autocommit mode, the transactions are started explicitly
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            for statement in self.schema:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Write transaction, IMMEDIATE takes the lock up front so two workers never read the same state"""
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+
+class LocalSlots:
+    """Concurrency slots counted in this worker process only"""
+
+    def __init__(self):
+        self._held = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, name, cap):
+        """Take one of the cap slots of name, returns the token to release it with or None when all are taken"""
+        with self._lock:
+            held = self._held.get(name, 0)
+            if held >= cap:
+                return None
+            self._held[name] = held + 1
+            return name
+
+    def release(self, token):
+        with self._lock:
+            self._held[token] -= 1
+
+    def held(self, name):
+        return self._held.get(name, 0)
+
+
+class SharedSlots:
+    """Concurrency slots counted in a SQLite file, one count for every worker of the host.
+
+    This also bounds sync workers, which each hold at most one slot at a time. A slot row carries
+    the pid of its worker, the slots of a worker that was killed before it could release them are
+    taken back once the cap is reached, as are the ones held past SLOT_LEASE_SECONDS.
+    """
+
+    def __init__(self, path):
+        self.db = SharedSQLite(path, SLOTS_SCHEMA)
+
+    def acquire(self, name, cap):
+        """Take one of the cap slots of name, returns the token to release it with or None when all are taken"""
+        with self.db.transaction() as connection:
+            held = connection.execute("SELECT count(*) FROM slots WHERE name = ?", (name,)).fetchone()[0]
+            if held >= cap:
+                held -= self._reclaim(connection, name)
+            if held >= cap:
+                return None
+            return connection.execute("INSERT INTO slots (name, pid, acquired) VALUES (?, ?, ?)",
+                                      (name, os.getpid(), time.time())).lastrowid
+
+    @staticmethod
+    def _reclaim(connection, name):
+        """Delete the slots of dead workers and the ones past their lease, returns how many"""
+        stale = [pid for pid, in connection.execute("SELECT DISTINCT pid FROM slots WHERE name = ?", (name,))
+                 if not process_alive(pid)]
+        reclaimed = 0
+        for pid in stale:
+            reclaimed += connection.execute("DELETE FROM slots WHERE name = ? AND pid = ?", (name, pid)).rowcount
+        reclaimed += connection.execute("DELETE FROM slots WHERE name = ? AND acquired < ?",
+                                        (name, time.time() - SLOT_LEASE_SECONDS)).rowcount
+        return reclaimed
+
+    def release(self, token):
+        self.db.connection().execute("DELETE FROM slots WHERE id = ?", (token,))
+
+    def held(self, name):
+        """Slots of name taken right now, across the workers"""
+        return self.db.connection().execute("SELECT count(*) FROM slots WHERE name = ?", (name,)).fetchone()[0]
@@ -0,0 +1,116 @@
+import hashlib
+import os
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+
+# magic numbers of the image formats we accept
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+
+class ImageTooLarge(Exception):
+    """Raised when an upload goes over the configured size cap"""
+
+
+def sniff_image_type(head):
+    """Guess the content type of an image from its first bytes, None when it is not an image we know"""
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+class ImageStore:
+    """Content addressed image store on the local filesystem.
+
+    Every blob is saved under the sha256 of its bytes, so identical uploads are
+    only written once and a key never changes meaning once it has been handed out.
+    Files are laid out as <root>/ab/cd/abcd... to keep directories small.
+    """
+
+    def __init__(self, app=None):
+        self.root = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("IMAGE_STORE_PATH", os.path.join(app.instance_path, "images"))
+        self.root = app.config["IMAGE_STORE_PATH"]
+        os.makedirs(self.root, exist_ok=True)
+        app.extensions["image_store"] = self
+
+    def path(self, key):
+        """Absolute path of the blob stored under key"""
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def delete(self, key):
+        if self.exists(key):
+            os.unlink(self.path(key))
+
+    def put(self, data):
+        """Store the given bytes and return their key, identical bytes are stored once"""
+        key = hashlib.sha256(data).hexdigest()
+        if not self.exists(key):
+            self._write(key, data)
+        return key
+
+    def put_stream(self, stream, max_bytes=None):
+        """Copy a file like object into the store chunk by chunk.
+
+        Returns (key, size, head) where head holds the first bytes for content sniffing.
+        Raises ImageTooLarge as soon as more than max_bytes have been read.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        head = b""
+        os.makedirs(os.path.join(self.root, "tmp"), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, "tmp"))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise ImageTooLarge(f"Image is larger than {max_bytes} bytes")
+                    if len(head) < 32:
+                        head += chunk[:32 - len(head)]
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            key = digest.hexdigest()
+            if self.exists(key):
+                os.unlink(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+                os.replace(tmp_path, self.path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        return key, size, head
+
+    def _write(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temp file first so readers never see a half written blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
@@ -0,0 +1,55 @@
+from itertools import islice
+from flask import Response, current_app, request, stream_with_context
+from resource.serializers import dumps
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+def stream_format():
+    """'json' or 'ndjson' when the client asked for a streamed response, None otherwise"""
+    requested = request.args.get("stream", "").lower()
+    if requested in ("json", "ndjson"):
+        return requested
+    if requested in ("1", "true"):
+        return "json"
+    if request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        return "ndjson"
+    return None
+
+
+def batches(query, batch_size=None):
+    """Iterate a query batch by batch with a server side cursor, lists of at most batch_size rows"""
+    batch_size = batch_size or current_app.config["STREAM_BATCH_SIZE"]
+    rows = iter(query.yield_per(batch_size))
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def streamed_response(fmt, head, key, items):
+    """Stream an iterable of lists of dicts.
+
+    json: {**head, key: [item, ...]} written one batch at a time.
+    ndjson: one item per line, head is left out.
+    """
+    if fmt == "ndjson":
+        def generate():
+            for batch in items:
+                yield "".join(dumps(item) + "\n" for item in batch)
+
+        return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+    def generate():
+        opening = dumps(head)[:-1]
+        yield opening + (", " if head else "") + dumps(key) + ": ["
+        first = True
+        for batch in items:
+            if not batch:
+                continue
+            yield ("" if first else ", ") + ", ".join(dumps(item) for item in batch)
+            first = False
+        yield "]}\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
@@ -0,0 +1,125 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from PIL import Image
+except ImportError:  # thumbnails are skipped and the original image is served
+    Image = None
+
+VARIANT_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+
+
+def variant_path(root, key, size, fmt):
+    """Where the resized copy of the blob `key` lives, next to the image store blobs"""
+    return os.path.join(root, "variants", key[:2], f"{key}_{size}.{fmt}")
+
+
+def build_variants(src_path, root, key, sizes):
+    """Resize one image into every size and format, runs inside the worker processes"""
+    with Image.open(src_path) as original:
+        original.load()
+        image = original.convert("RGB")
+
+    for size in sizes:
+        resized = image.copy()
+        # thumbnail keeps the aspect ratio and never scales up
+        resized.thumbnail((size, size))
+        for fmt, pil_format in VARIANT_FORMATS.items():
+            path = variant_path(root, key, size, fmt)
+            if os.path.exists(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    resized.save(f, pil_format, quality=85)
+                os.replace(tmp_path, path)
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+
+    return key
+
+
+class ThumbnailPipeline:
+    """Builds resized variants of stored images in a pool of worker processes.
+
+    Uploads only queue the work, the view endpoint serves a variant once it exists
+    on disk and falls back to the original image until then.
+    """
+
+    def __init__(self, app=None, store=None):
+        self.store = store
+        self.sizes = ()
+        self.workers = 0
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, store)
+
+    def init_app(self, app, store):
+        app.config.setdefault("THUMBNAIL_SIZES", (128, 512, 1024))
+        app.config.setdefault("THUMBNAIL_WORKERS", 2)
+        self.store = store
+        self.sizes = tuple(sorted(app.config["THUMBNAIL_SIZES"]))
+        self.workers = app.config["THUMBNAIL_WORKERS"]
+        app.extensions["thumbnails"] = self
+
+    @property
+    def enabled(self):
+        return Image is not None and self.workers > 0
+
+    def _get_executor(self):
+        # created on first use so every gunicorn worker gets its own pool after the fork
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def submit(self, key):
+        """Queue the variants of the blob `key`, returns right away"""
+        if not self.enabled or key is None:
+            return
+
+        with self._lock:
+            if key in self._pending:
+                return
+            try:
+                future = self._get_executor().submit(
+                    build_variants, self.store.path(key), self.store.root, key, self.sizes)
+            except BrokenProcessPool:
+                self._executor = None
+                future = self._get_executor().submit(
+                    build_variants, self.store.path(key), self.store.root, key, self.sizes)
+            self._pending.add(key)
+
+        future.add_done_callback(lambda f: self._done(key))
+
+    def _done(self, key):
+        with self._lock:
+            self._pending.discard(key)
+
+    def build(self, key):
+        """Build the variants of `key` in the calling process"""
+        if Image is not None:
+            build_variants(self.store.path(key), self.store.root, key, self.sizes)
+
+    def pick_size(self, requested):
+        """Smallest variant size that covers the requested one, the largest when none does"""
+        for size in self.sizes:
+            if size >= requested:
+                return size
+        return self.sizes[-1] if self.sizes else None
+
+    def find(self, key, requested, fmt):
+        """Path of a ready variant of `key`, None when it has not been built (yet)"""
+        size = self.pick_size(requested)
+        if size is None:
+            return None, None
+        path = variant_path(self.store.root, key, size, fmt)
+        if os.path.exists(path):
+            return path, size
+        return None, None
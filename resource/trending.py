@@ -0,0 +1,113 @@
+import math
+from datetime import datetime
+from sqlalchemy import update
+
+# scores are log weights relative to this moment, only their differences matter
+TRENDING_EPOCH = datetime(2024, 1, 1)
+
+# below this distance between a score and the like taken out of it the subtraction loses its precision
+_MIN_GAP = 1e-6
+
+
+def log_add(a, b):
+    """log(e**a + e**b) without leaving log space"""
+    high, low = (a, b) if a >= b else (b, a)
+    return high + math.log1p(math.exp(low - high))
+
+
+class TrendingScores:
+    """Time decayed popularity of the dishes, materialized in dishview.trending_score.
+
+    Every like, and the posting of the dish itself, weighs e**(rate * (t - epoch)) with rate set
+    by the half life. Ordering dishes by the sum of those weights orders them exactly like the
+    weights decayed to now would, because now scales all of them by the same factor, so the
+    stored score (the log of the sum) never has to be decayed. A like adds its weight and an
+    unlike takes it out again in O(1), and the index on the column serves the top K directly.
+    """
+
+    def __init__(self):
+        self.rate = None
+
+    def init_app(self, app):
+        app.config.setdefault("TRENDING_HALF_LIFE_HOURS", 48)
+        app.config.setdefault("TRENDING_MAX_RESULTS", 50)
+        self.rate = math.log(2) / app.config["TRENDING_HALF_LIFE_HOURS"]
+        app.extensions["trending"] = self
+
+    def event_score(self, when):
+        """Log weight of a like at `when`"""
+        return (when - TRENDING_EPOCH).total_seconds() / 3600 * self.rate
+
+    def initial_score(self, date_posted):
+        """Score of a dish nobody liked yet, posting it counts like one like"""
+        return self.event_score(date_posted)
+
+    def updated_score(self, score, liked_at=(), unliked_at=()):
+        """Score after likes at liked_at were added and the likes created at unliked_at were taken out.
+
+        None when the score has to be recomputed from the likes table, for likes from before
+        likes.created_at existed or when the subtraction would be imprecise.
+        """
+        for when in liked_at:
+            score = log_add(score, self.event_score(when))
+        for when in unliked_at:
+            if when is None:
+                return None
+            gap = score - self.event_score(when)
+            if gap <= _MIN_GAP:
+                return None
+            score += math.log1p(-math.exp(-gap))
+        return score
+
+    def recompute(self, session, dish_ids):
+        """{dish_id: score} from the likes of the given dishes, likes without created_at count at date_posted"""
+        from resource.models import DishView, likes
+
+        if not dish_ids:
+            return {}
+        posted = dict(session.query(DishView.id, DishView.date_posted).filter(DishView.id.in_(dish_ids)))
+        scores = {dish_id: self.initial_score(date_posted) for dish_id, date_posted in posted.items()}
+        rows = session.query(likes.c["dishview.id"], likes.c["created_at"]) \
+            .filter(likes.c["dishview.id"].in_(list(posted)))
+        for dish_id, created_at in rows:
+            scores[dish_id] = log_add(scores[dish_id], self.event_score(created_at or posted[dish_id]))
+        return scores
+
+    def recompute_all(self, session, batch_size=1000):
+        """Rewrite every score from the likes table, one transaction per batch of dishes, returns how many"""
+        from resource.models import DishView
+
+        last_id = 0
+        total = 0
+        while True:
+            dish_ids = [dish_id for dish_id, in session.query(DishView.id).filter(DishView.id > last_id)
+                        .order_by(DishView.id).limit(batch_size)]
+            if not dish_ids:
+                return total
+            scores = self.recompute(session, dish_ids)
+            session.execute(update(DishView), [{"id": dish_id, "trending_score": score}
+                                               for dish_id, score in scores.items()])
+            session.commit()
+            total += len(dish_ids)
+            last_id = dish_ids[-1]
+
+    def apply(self, session, changes):
+        """Write the scores after likes and unlikes.
+
+        changes maps dish_id -> (stored score, liked_at, unliked_at), the stored score must be read
+        after the like_count update of the same transaction locked the row.
+        """
+        from resource.models import DishView
+
+        scores = {}
+        stale = []
+        for dish_id, (score, liked_at, unliked_at) in changes.items():
+            updated = self.updated_score(score, liked_at, unliked_at)
+            if updated is None:
+                stale.append(dish_id)
+            else:
+                scores[dish_id] = updated
+        scores.update(self.recompute(session, stale))
+        if scores:
+            session.execute(update(DishView), [{"id": dish_id, "trending_score": score}
+                                               for dish_id, score in scores.items()])
@@ -0,0 +1,73 @@
+import os
+import tempfile
+
+import pytest
+from flask_jwt_extended import create_refresh_token
+
+from resource import create_app, db, bcrypt
+from resource.models import Users
+
+TEST_DIR = tempfile.mkdtemp()
+
+CONFIG = {
+    "TESTING": True,
+    "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(TEST_DIR, "test.sqlite"),
+    "HASH_SLOTS_FILE": os.path.join(TEST_DIR, "hash_slots.sqlite"),
+    "BCRYPT_LOG_ROUNDS": 4,
+    "METRICS_DIR": os.path.join(TEST_DIR, "metrics"),
+    # the address of the test client
+    "METRICS_ALLOWED_IPS": ["127.0.0.1"],
+    # the tests refresh the in-process indexes by hand, no background thread racing the fixtures
+    "CATALOG_REFRESH_SECONDS": 0,
+    # fresh buckets per app, every request of the suite comes from the same address
+    "RATE_LIMIT_BACKEND": "local",
+    "RATE_LIMIT_PROXY_HOPS": 0,
+    # the database is rebuilt for every test, a cache shared between the apps would outlive it
+    "RESPONSE_CACHE_BACKEND": "local",
+}
+
+
+@pytest.fixture
+def app():
+    """A new app per test, which also starts the per worker caches and indexes over"""
+    app = create_app(CONFIG)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    """Adds a user and returns its id, the password is hashed with the cheapest bcrypt cost"""
+    count = iter(range(1, 1000))
+
+    def make(password="secret", **fields):
+        number = next(count)
+        fields.setdefault("email", f"cook{number}@example.com")
+        with app.app_context():
+            user = Users(firstname="Cook", lastname=str(number), phone="555",
+                         password=bcrypt.generate_password_hash(password, 4).decode("utf-8"), **fields)
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+
+    return make
+
+
+@pytest.fixture
+def auth(app):
+    """Authorization headers of a refresh token for the given user id, what the dish endpoints expect"""
+
+    def headers(user_id):
+        with app.app_context():
+            return {"Authorization": f"Bearer {create_refresh_token(identity=user_id)}"}
+
+    return headers
@@ -0,0 +1,66 @@
+import os
+
+from sqlalchemy import inspect
+
+from resource import create_app, db, name_index
+from resource.commands import boot_report, init_db
+from resource.models import DishView
+
+from conftest import CONFIG
+
+
+def test_engine_options_follow_the_configured_database(monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "postgresql://kally@db.invalid/kally")
+
+    on_postgres = create_app()
+    on_sqlite = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:"})
+
+    assert on_postgres.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_pre_ping"] is True
+    assert on_sqlite.config["SQLALCHEMY_ENGINE_OPTIONS"] == {}
+    with on_sqlite.app_context():
+        assert db.session.execute(db.text("SELECT 1")).scalar() == 1
+
+
+def test_building_the_app_does_not_touch_the_database(tmp_path):
+    path = tmp_path / "kally.sqlite"
+
+    create_app({**CONFIG, "SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}"})
+
+    assert not path.exists()
+
+
+def test_init_db_creates_the_schema(tmp_path):
+    app = create_app({**CONFIG, "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'kally.sqlite'}"})
+
+    result = app.test_cli_runner().invoke(init_db)
+
+    assert result.exit_code == 0
+    with app.app_context():
+        assert {"dishview", "user_sign_up", "catalog_changes"} <= set(inspect(db.engine).get_table_names())
+
+
+def test_boot_report_times_the_first_request(app):
+    result = app.test_cli_runner().invoke(boot_report)
+
+    assert "GET /swagger.json: 200" in result.output
+    assert "first_request_seconds" in result.output
+    assert app.extensions["boot_timings"]["first_request_seconds"] is not None
+
+
+def test_api_docs_can_be_turned_off():
+    app = create_app({**CONFIG, "API_DOCS": False})
+
+    assert app.test_client().get("/").status_code == 404
+
+
+def test_a_new_app_starts_the_per_worker_indexes_over(app, tmp_path):
+    with app.app_context():
+        db.session.add(DishView(name="Pancakes", Instructions="fry", Ingredients=["eggs"], dish_image_url=b""))
+        db.session.commit()
+        assert name_index.complete("pan", 10) == ["Pancakes"]
+
+    other = create_app({**CONFIG, "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'other.sqlite'}"})
+    with other.app_context():
+        db.create_all()
+        assert name_index.complete("pan", 10) == []
+    assert not os.path.exists(tmp_path / "kally.sqlite")
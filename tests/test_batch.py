@@ -0,0 +1,74 @@
+import pytest
+
+import resource.routes
+from resource import db
+from resource.models import CatalogChange, DishView
+from resource.search import NameIndex
+
+
+def add_dishes(app, count, user_id=None):
+    with app.app_context():
+        dishes = [DishView(name=f"dish {i}", Instructions="cook", Ingredients=["salt"], dish_image_url=b"",
+                           user_id=user_id) for i in range(count)]
+        db.session.add_all(dishes)
+        db.session.commit()
+        return [dish.id for dish in dishes]
+
+
+def statuses(body):
+    return [(item["id"], item["status"]) for item in body["items"]]
+
+
+def test_batch_get_reports_missing_ids_in_order(app, client):
+    first, second = add_dishes(app, 2)
+
+    body = client.post("/dish/batch/get", json={"ids": [second, 999, first, second]}).get_json()
+
+    assert statuses(body) == [(second, 200), (999, 404), (first, 200)]
+    assert body["items"][0]["resource"]["name"] == "dish 1"
+
+
+@pytest.mark.parametrize("body", [{"ids": "1,2"}, {"ids": [1, "2"]}, {"ids": list(range(101))}])
+def test_batch_rejects_bad_id_lists(client, body):
+    assert client.post("/dish/batch/get", json=body).status_code == 400
+
+
+def test_batch_likes_count_each_user_once(app, client, make_user, auth):
+    first, second, third = add_dishes(app, 3)
+    headers = auth(make_user())
+    client.post(f"/dish/likes/{third}", headers=headers)
+
+    body = client.post("/dish/batch/likes", headers=headers,
+                       json={"like": [first, second, 999], "unlike": [third]}).get_json()
+    again = client.post("/dish/batch/likes", headers=headers, json={"like": [first], "unlike": [third]}).get_json()
+
+    assert [(item["id"], item["action"], item["status"], item.get("changed"), item.get("like_count"))
+            for item in body["items"]] == [
+        (first, "like", 200, True, 1), (second, "like", 200, True, 1), (999, "like", 404, None, None),
+        (third, "unlike", 200, True, 0)]
+    assert [(item["changed"], item["like_count"]) for item in again["items"]] == [(False, 1), (False, 0)]
+
+
+def test_batch_likes_refuse_liking_and_unliking_one_dish(app, client, make_user, auth):
+    dish_id, = add_dishes(app, 1)
+
+    response = client.post("/dish/batch/likes", headers=auth(make_user()), json={"like": [dish_id], "unlike": [dish_id]})
+
+    assert response.status_code == 400
+
+
+def test_batch_delete_logs_the_dishes_for_the_other_workers(app, client, make_user, auth, monkeypatch):
+    index = NameIndex()
+    monkeypatch.setattr(resource.routes, "name_index", index)
+    user_id = make_user()
+    headers = auth(user_id)
+    first, second = add_dishes(app, 2, user_id=user_id)
+    assert client.get("/dish/autocomplete?prefix=dish", headers=headers).get_json()["names"] == ["dish 0", "dish 1"]
+
+    body = client.post("/dish/batch/delete", headers=headers, json={"ids": [first, 999]}).get_json()
+
+    assert statuses(body) == [(first, 200), (999, 404)]
+    assert client.get("/dish/autocomplete?prefix=dish", headers=headers).get_json()["names"] == ["dish 1"]
+    with app.app_context():
+        assert [dish.id for dish in DishView.query] == [second]
+        assert [change.dish_id for change in CatalogChange.query] == [first]
@@ -0,0 +1,92 @@
+import base64
+import json
+
+import pytest
+
+from resource import db, image_store
+from resource.models import DishView
+
+IMAGE = b"\x89PNG\r\n\x1a\n" + b"pixels" * 10
+
+
+@pytest.fixture
+def admin(app, make_user, auth, monkeypatch, tmp_path):
+    monkeypatch.setattr(image_store, "root", str(tmp_path))
+    user_id = make_user()
+    monkeypatch.setitem(app.config, "ADMIN_USER_IDS", [user_id])
+    return auth(user_id)
+
+
+def ndjson(*rows):
+    return "".join((row if isinstance(row, str) else json.dumps(row)) + "\n" for row in rows)
+
+
+def dish(name, **fields):
+    return {"name": name, "Instructions": "cook", "Ingredients": ["Salt"], **fields}
+
+
+def test_bulk_needs_an_admin(client, make_user, auth):
+    headers = auth(make_user())
+
+    assert client.post("/dish/bulk", headers=headers, data=ndjson(dish("soup"))).status_code == 403
+    assert client.get("/dish/bulk", headers=headers).status_code == 403
+
+
+def test_import_reports_bad_lines_and_keeps_the_rest(app, client, admin, monkeypatch):
+    monkeypatch.setitem(app.config, "BULK_BATCH_SIZE", 2)
+    body = ndjson(dish("soup"), "{not json", dish(""), "", dish("stew", dish_image=base64.b64encode(IMAGE).decode()),
+                  dish("pie", date_posted="yesterday"), dish("tart"))
+
+    result = client.post("/dish/bulk", headers=admin, data=body).get_json()
+
+    assert result["imported"] == 3
+    assert result["last_committed_line"] == 7
+    assert [(error["line"], error["error"]) for error in result["errors"]] == [
+        (2, "Invalid JSON"),
+        (3, "name must be a string of 1 to 255 characters"),
+        (6, "date_posted must be an ISO 8601 date"),
+    ]
+    with app.app_context():
+        dishes = {dish.name: dish for dish in DishView.query}
+        assert sorted(dishes) == ["soup", "stew", "tart"]
+        assert dishes["soup"].Ingredients == ["Salt"]
+        assert dishes["soup"].ingredient_labels is None
+        assert dishes["stew"].image_content_type == "image/png"
+
+
+def test_import_resumes_after_the_committed_lines(app, client, admin):
+    body = ndjson(dish("soup"), dish("stew"), dish("pie"))
+
+    result = client.post("/dish/bulk?resume_from=2", headers=admin, data=body).get_json()
+
+    assert result["imported"] == 1
+    with app.app_context():
+        assert [dish.name for dish in DishView.query] == ["pie"]
+
+
+def test_export_streams_every_dish_from_after_id(app, client, admin):
+    client.post("/dish/bulk", headers=admin, data=ndjson(dish("soup"), dish("stew"), dish("pie")))
+    with app.app_context():
+        first_id = db.session.query(db.func.min(DishView.id)).scalar()
+
+    response = client.get(f"/dish/bulk?after_id={first_id}", headers=admin)
+
+    rows = [json.loads(line) for line in response.data.splitlines()]
+    assert response.mimetype == "application/x-ndjson"
+    assert [row["name"] for row in rows] == ["stew", "pie"]
+    assert rows[0]["Ingredients"] == ["Salt"]
+
+
+def test_exported_rows_import_again(app, client, admin):
+    client.post("/dish/bulk", headers=admin,
+                data=ndjson(dish("stew", dish_image=base64.b64encode(IMAGE).decode())))
+    exported = client.get("/dish/bulk?include_images=true", headers=admin).data.decode()
+    with app.app_context():
+        DishView.query.delete()
+        db.session.commit()
+
+    result = client.post("/dish/bulk", headers=admin, data=exported).get_json()
+
+    assert (result["imported"], result["errors"]) == (1, [])
+    with app.app_context():
+        assert DishView.query.one().image_size == len(IMAGE)
@@ -0,0 +1,119 @@
+import os
+
+import pytest
+
+from resource import create_app, db, response_cache
+from resource.cache import FileCacheBackend, LocalCacheBackend
+from resource.models import DishView
+from conftest import CONFIG
+
+
+def add_dish(app, user_id):
+    with app.app_context():
+        dish = DishView(name="soup", Instructions="boil", Ingredients=["water"], dish_image_url=b"", user_id=user_id)
+        db.session.add(dish)
+        db.session.commit()
+        return dish.id
+
+
+@pytest.fixture(params=["local", "filesystem"])
+def backend(request, tmp_path, monkeypatch):
+    backend = LocalCacheBackend(100, 60) if request.param == "local" else FileCacheBackend(str(tmp_path), 60)
+    monkeypatch.setattr(response_cache, "backend", backend)
+    return backend
+
+
+def test_matching_etag_is_a_304(app, client, make_user, backend):
+    dish_id = add_dish(app, make_user())
+
+    first = client.get(f"/dish/dishes/{dish_id}")
+    again = client.get(f"/dish/dishes/{dish_id}", headers={"If-None-Match": first.headers["ETag"]})
+
+    assert first.status_code == 200
+    assert first.get_json()["resource"]["name"] == "soup"
+    assert again.status_code == 304
+    assert again.headers["ETag"] == first.headers["ETag"]
+
+
+def test_writes_invalidate_the_dish_and_its_user(app, client, make_user, auth, backend):
+    user_id = make_user()
+    dish_id = add_dish(app, user_id)
+    headers = auth(user_id)
+    detail = client.get(f"/dish/dishes/{dish_id}")
+    by_user = client.get(f"/dish/user/{user_id}", headers=headers)
+
+    client.put(f"/dish/{dish_id}", headers=headers, json={"name": "stew"})
+
+    changed = client.get(f"/dish/dishes/{dish_id}", headers={"If-None-Match": detail.headers["ETag"]})
+    assert changed.status_code == 200
+    assert changed.get_json()["resource"]["name"] == "stew"
+    assert client.get(f"/dish/user/{user_id}",
+                      headers={**headers, "If-None-Match": by_user.headers["ETag"]}).status_code == 200
+
+    client.post(f"/dish/likes/{dish_id}", headers=headers)
+    assert client.get(f"/dish/dishes/{dish_id}").get_json()["resource"]["like_count"] == 1
+
+
+def test_missing_dishes_are_not_cached(app, client, backend):
+    assert client.get("/dish/dishes/1").status_code == 404
+    dish_id = add_dish(app, None)
+
+    assert dish_id == 1
+    assert client.get("/dish/dishes/1").status_code == 200
+
+
+def test_local_backend_evicts_the_least_recently_used():
+    backend = LocalCacheBackend(2, 60)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    backend.get("a")
+    backend.set("c", 3)
+
+    assert (backend.get("a"), backend.get("b"), backend.get("c")) == (1, None, 3)
+
+
+def test_file_backend_keeps_one_entry_per_url(app, client, make_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, "backend", FileCacheBackend(str(tmp_path), 60))
+    dish_id = add_dish(app, make_user())
+
+    for _ in range(5):
+        client.get(f"/dish/dishes/{dish_id}")
+        response_cache.invalidate(f"dish:{dish_id}")
+
+    # the entry of the URL, the version of its scope and the sweep marker
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_file_backend_sweeps_expired_files(tmp_path):
+    backend = FileCacheBackend(str(tmp_path), 60)
+    backend.set("old", 1)
+    backend.set("new", 2)
+    os.utime(backend._path("old"), (0, 0))
+
+    assert backend.sweep() == 1
+    assert (backend.get("old"), backend.get("new")) == (None, 2)
+
+
+def test_the_workers_share_the_cache_by_default(tmp_path):
+    config = {key: value for key, value in CONFIG.items() if key != "RESPONSE_CACHE_BACKEND"}
+    create_app({**config, "RESPONSE_CACHE_DIR": str(tmp_path)})
+
+    assert isinstance(response_cache.backend, FileCacheBackend)
+
+
+def test_a_write_through_another_worker_invalidates_the_cached_response(app, client, make_user, auth, tmp_path,
+                                                                       monkeypatch):
+    # two backends on the same directory stand in for the caches of two workers
+    this_worker, other_worker = FileCacheBackend(str(tmp_path), 60), FileCacheBackend(str(tmp_path), 60)
+    user_id = make_user()
+    dish_id = add_dish(app, user_id)
+    monkeypatch.setattr(response_cache, "backend", this_worker)
+    cached = client.get(f"/dish/dishes/{dish_id}")
+
+    monkeypatch.setattr(response_cache, "backend", other_worker)
+    client.put(f"/dish/{dish_id}", headers=auth(user_id), json={"name": "stew"})
+    monkeypatch.setattr(response_cache, "backend", this_worker)
+    again = client.get(f"/dish/dishes/{dish_id}", headers={"If-None-Match": cached.headers["ETag"]})
+
+    assert again.status_code == 200
+    assert again.get_json()["resource"]["name"] == "stew"
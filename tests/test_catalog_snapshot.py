@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from resource import db, catalog_refresher, catalog_snapshot, response_cache
+from resource.catalog import log_changes
+from resource.commands import catalog_report
+from resource.models import CatalogChange, DishView
+
+
+@pytest.fixture
+def snapshot(app, monkeypatch):
+    monkeypatch.setattr(catalog_snapshot, "enabled", True)
+    return catalog_snapshot
+
+
+def add_dish(app, name, user_id=None, posted=None):
+    with app.app_context():
+        dish = DishView(name=name, Instructions="cook", Ingredients=["salt", "pepper"], dish_image_url=b"",
+                        user_id=user_id, date_posted=posted or datetime.utcnow())
+        db.session.add(dish)
+        db.session.commit()
+        return dish.id
+
+
+def listing(client, headers, **args):
+    query = "&".join(f"{name}={value}" for name, value in args.items())
+    response = client.get(f"/dish/?{query}", headers=headers)
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+
+def names(client, headers):
+    return [recipe["name"] for recipe in client.get("/dish/", headers=headers).get_json()["recipes"]]
+
+
+@pytest.fixture
+def statements(app):
+    """SQL statements run while the list is not None"""
+    executed = []
+    with app.app_context():
+        engine = db.engine
+
+    def count(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    yield executed
+    event.remove(engine, "before_cursor_execute", count)
+
+
+def test_reads_answer_like_the_database(app, client, make_user, auth, monkeypatch):
+    # both rounds are built by the handlers
+    monkeypatch.setattr(response_cache, "backend", None)
+    user_id = make_user()
+    headers = auth(user_id)
+    start = datetime(2025, 1, 1)
+    dish_ids = [add_dish(app, f"dish {i}", user_id if i % 2 else None, start + timedelta(hours=i % 3))
+                for i in range(7)]
+    client.post(f"/dish/likes/{dish_ids[2]}", headers=headers)
+
+    def answers():
+        first = client.get("/dish/?limit=3", headers=headers).get_json()
+        return [
+            first,
+            listing(client, headers, limit=3, cursor=first["next_cursor"]),
+            listing(client, headers, include_likes="true"),
+            listing(client, headers, stream="ndjson"),
+            client.get(f"/dish/user/{user_id}", headers=headers).get_data(as_text=True),
+            client.get(f"/dish/dishes/{dish_ids[2]}", headers={**headers, "X-Fields": "{name,like_count}"}).get_json(),
+        ]
+
+    from_database = answers()
+    monkeypatch.setattr(catalog_snapshot, "enabled", True)
+    assert answers() == from_database
+
+
+def test_dishes_not_converted_yet_serve_their_legacy_ingredients(app, client, make_user, auth, monkeypatch):
+    monkeypatch.setattr(response_cache, "backend", None)
+    user_id = make_user()
+    headers = auth(user_id)
+    dish_id = add_dish(app, "soup", user_id)
+    with app.app_context():
+        # a row as the ingredient table migration leaves it, before `flask migrate-ingredients`
+        DishView.query.filter_by(id=dish_id).update(
+            {"ingredient_ids": None, "ingredient_labels": None, "legacy_ingredients": ["Water", "salt"]})
+        db.session.commit()
+
+    def ingredients():
+        return [client.get("/dish/", headers=headers).get_json()["recipes"][0]["ingredients"],
+                client.get(f"/dish/dishes/{dish_id}", headers=headers).get_json()["resource"]["ingredients"],
+                client.get(f"/dish/user/{user_id}", headers=headers).get_json()["dishes"][0]["ingredients"]]
+
+    assert ingredients() == [["Water", "salt"]] * 3
+    monkeypatch.setattr(catalog_snapshot, "enabled", True)
+    assert ingredients() == [["Water", "salt"]] * 3
+
+
+def test_reads_do_not_query_once_built(app, client, make_user, auth, snapshot, statements):
+    user_id = make_user()
+    headers = auth(user_id)
+    first, second = add_dish(app, "soup", user_id), add_dish(app, "salad", user_id)
+    client.get(f"/dish/dishes/{first}", headers=headers)
+
+    statements.clear()
+    assert client.get(f"/dish/dishes/{second}", headers=headers).status_code == 200
+    assert client.get("/dish/", headers=headers).status_code == 200
+    assert client.get(f"/dish/user/{user_id}", headers=headers).status_code == 200
+
+    assert [statement for statement in statements if "dishview" in statement] == []
+
+
+def test_this_workers_writes_show_up_right_away(app, client, make_user, auth, snapshot):
+    headers = auth(make_user())
+    dish_id = add_dish(app, "soup")
+    assert names(client, headers) == ["soup"]
+
+    client.post(f"/dish/likes/{dish_id}", headers=headers)
+    assert client.get(f"/dish/dishes/{dish_id}", headers=headers).get_json()["resource"]["like_count"] == 1
+
+    client.put(f"/dish/{dish_id}", headers=headers, json={"name": "broth"})
+    assert names(client, headers) == ["broth"]
+
+    client.delete(f"/dish/delete/{dish_id}", headers=headers)
+    assert names(client, headers) == []
+    assert client.get(f"/dish/dishes/{dish_id}", headers=headers).status_code == 404
+
+
+def test_other_workers_writes_show_up_after_a_refresh(app, client, make_user, auth, snapshot):
+    headers = auth(make_user())
+    renamed, deleted = add_dish(app, "soup"), add_dish(app, "salad")
+    assert names(client, headers) == ["salad", "soup"]
+
+    # another worker creates, renames and deletes, only the log and the table tell this one
+    created = add_dish(app, "stew")
+    with app.app_context():
+        db.session.get(DishView, renamed).name = "broth"
+        db.session.delete(db.session.get(DishView, deleted))
+        log_changes(db.session, [renamed, deleted])
+        db.session.commit()
+
+    assert names(client, headers) == ["salad", "soup"]
+    # a dish past the watermark is read through
+    assert client.get(f"/dish/dishes/{created}", headers=headers).get_json()["resource"]["name"] == "stew"
+
+    catalog_refresher.refresh_all()
+
+    assert names(client, headers) == ["stew", "broth"]
+
+
+def test_likes_are_only_logged_with_the_snapshot_on(app, client, make_user, auth, monkeypatch):
+    headers = auth(make_user())
+    dish_id = add_dish(app, "soup")
+
+    client.post(f"/dish/likes/{dish_id}", headers=headers)
+    monkeypatch.setattr(catalog_snapshot, "enabled", True)
+    client.delete(f"/dish/likes/{dish_id}", headers=headers)
+
+    with app.app_context():
+        assert [change.dish_id for change in CatalogChange.query] == [dish_id]
+
+
+def test_catalog_report(app):
+    add_dish(app, "soup")
+
+    result = app.test_cli_runner().invoke(catalog_report)
+
+    assert result.exit_code == 0
+    assert "1 dishes built" in result.output
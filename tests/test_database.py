@@ -0,0 +1,66 @@
+import sqlite3
+
+from flask import Flask, g
+from flask_sqlalchemy import SQLAlchemy
+
+from resource.database import RoutingSession, configure_database, engine_options, read_only
+
+
+def test_sqlite_keeps_its_own_pool():
+    assert engine_options("sqlite:///kally.sqlite") == {}
+
+
+def test_pool_settings_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "20")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "0")
+
+    options = engine_options("postgresql://db/kally")
+
+    assert options["pool_size"] == 20
+    assert options["pool_pre_ping"] is False
+    assert options["pool_recycle"] == 1800
+
+
+def test_configured_engine_options_are_kept():
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI="postgresql://db/kally", SQLALCHEMY_ENGINE_OPTIONS={"echo": True},
+                      DATABASE_REPLICA_URL="sqlite:///replica.sqlite")
+
+    configure_database(app)
+
+    assert app.config["SQLALCHEMY_ENGINE_OPTIONS"] == {"echo": True}
+    assert app.config["SQLALCHEMY_BINDS"] == {"replica": {"url": "sqlite:///replica.sqlite"}}
+
+
+def make_database(path, name):
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE source (name TEXT)")
+        connection.execute("INSERT INTO source VALUES (?)", (name,))
+
+
+def test_read_only_handlers_read_from_the_replica_until_they_write(tmp_path):
+    # the INSERT is raw SQL on purpose, the session can not tell whether it writes
+    make_database(tmp_path / "primary.sqlite", "primary")
+    make_database(tmp_path / "replica.sqlite", "replica")
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'primary.sqlite'}",
+                      DATABASE_REPLICA_URL=f"sqlite:///{tmp_path / 'replica.sqlite'}")
+    configure_database(app)
+    db = SQLAlchemy(app, session_options={"class_": RoutingSession})
+
+    def source():
+        return db.session.execute(db.select(db.column("name")).select_from(db.table("source"))).scalars().all()
+
+    @read_only
+    def handler():
+        before = source()
+        db.session.execute(db.text("INSERT INTO source VALUES ('written')"))
+        return before, source()
+
+    with app.app_context():
+        assert source() == ["primary"]
+    with app.app_context():
+        before, after = handler()
+        assert g.db_read_only
+    assert before == ["replica"]
+    assert after == ["primary", "written"]
@@ -0,0 +1,79 @@
+import subprocess
+import sys
+
+import pytest
+
+from resource import bcrypt, db, hasher
+from resource.models import Users
+from resource.slots import SharedSlots
+
+SIGN_UP = {"id": 0, "firstname": "Ada", "lastname": "Cook", "email": "ada@example.com", "password": "secret",
+           "phone": "555"}
+
+
+@pytest.fixture
+def other_worker():
+    """The hash slots as another worker process of the host sees them"""
+    return SharedSlots(hasher.slots.db.path)
+
+
+@pytest.fixture
+def fill_slots(other_worker):
+    tokens = []
+    yield lambda: tokens.extend(other_worker.acquire(hasher.SLOT_NAME, hasher.capacity)
+                                for _ in range(hasher.capacity))
+    for token in tokens:
+        other_worker.release(token)
+
+
+def test_register_and_login(client):
+    assert client.post("/user/register", json=SIGN_UP).status_code == 200
+
+    response = client.post("/user/login", json={"email": SIGN_UP["email"], "password": "secret"})
+
+    assert response.status_code == 200
+    assert client.post("/user/login", json={"email": SIGN_UP["email"], "password": "wrong"}).status_code == 401
+    assert hasher.slots.held(hasher.SLOT_NAME) == 0
+
+
+def test_duplicate_sign_up_is_not_hashed(client, make_user, monkeypatch):
+    make_user(email=SIGN_UP["email"])
+    monkeypatch.setattr(hasher, "hash", lambda password: pytest.fail("hashed a duplicate sign up"))
+
+    assert "Error" in client.post("/user/register", json=SIGN_UP).get_json()
+
+
+def test_hashes_in_flight_on_other_workers_count(client, make_user, fill_slots):
+    make_user(email="bea@example.com")
+    fill_slots()
+
+    response = client.post("/user/login", json={"email": "bea@example.com", "password": "secret"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(hasher.retry_after)
+
+
+def test_slots_of_a_dead_worker_are_taken_back(client, make_user, other_worker):
+    make_user(email="bea@example.com")
+    dead = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    with other_worker.db.transaction() as connection:
+        connection.executemany("INSERT INTO slots (name, pid, acquired) VALUES (?, ?, 0)",
+                               [(hasher.SLOT_NAME, int(dead.stdout))] * hasher.capacity)
+
+    response = client.post("/user/login", json={"email": "bea@example.com", "password": "secret"})
+
+    assert response.status_code == 200
+    assert hasher.slots.held(hasher.SLOT_NAME) == 0
+
+
+def test_login_upgrades_a_hash_of_another_cost(app, client, make_user):
+    user_id = make_user(email="bea@example.com")
+    with app.app_context():
+        user = db.session.get(Users, user_id)
+        user.password = bcrypt.generate_password_hash("secret", 5).decode("utf-8")
+        db.session.commit()
+
+    assert client.post("/user/login", json={"email": "bea@example.com", "password": "secret"}).status_code == 200
+
+    with app.app_context():
+        assert not hasher.needs_rehash(db.session.get(Users, user_id).password)
@@ -0,0 +1,75 @@
+from resource import db
+from resource.commands import recount_likes
+from resource.models import DishView, likes
+
+
+def add_dish(app):
+    with app.app_context():
+        dish = DishView(name="soup", Instructions="boil", Ingredients=["water"], dish_image_url=b"")
+        db.session.add(dish)
+        db.session.commit()
+        return dish.id
+
+
+def like_rows(app, dish_id):
+    with app.app_context():
+        return db.session.execute(db.select(db.func.count()).select_from(likes)
+                                  .where(likes.c["dishview.id"] == dish_id)).scalar()
+
+
+def test_liking_twice_counts_once(app, client, make_user, auth):
+    dish_id = add_dish(app)
+    headers = auth(make_user())
+
+    first = client.post(f"/dish/likes/{dish_id}", headers=headers).get_json()
+    again = client.post(f"/dish/likes/{dish_id}", headers=headers).get_json()
+
+    assert first == {"message": "Dish liked successful", "like_count": 1}
+    assert again == {"Error": "User already liked the dish", "like_count": 1}
+    assert like_rows(app, dish_id) == 1
+
+
+def test_unliking_twice_counts_once(app, client, make_user, auth):
+    dish_id = add_dish(app)
+    liker, other = auth(make_user()), auth(make_user())
+    client.post(f"/dish/likes/{dish_id}", headers=liker)
+    client.post(f"/dish/likes/{dish_id}", headers=other)
+
+    first = client.delete(f"/dish/likes/{dish_id}", headers=liker).get_json()
+    again = client.delete(f"/dish/likes/{dish_id}", headers=liker).get_json()
+
+    assert first == {"message": "Dish unliked successful", "like_count": 1}
+    assert again == {"Error": "User has not liked the dish", "like_count": 1}
+    assert like_rows(app, dish_id) == 1
+
+
+def test_liking_a_missing_dish_is_a_404_and_leaves_no_row(app, client, make_user, auth):
+    response = client.post("/dish/likes/999", headers=auth(make_user()))
+
+    assert response.status_code == 404
+    assert like_rows(app, 999) == 0
+
+
+def test_responses_carry_the_count(app, client, make_user, auth):
+    dish_id = add_dish(app)
+    headers = auth(make_user())
+    client.post(f"/dish/likes/{dish_id}", headers=headers)
+
+    recipe, = client.get("/dish/", headers=headers).get_json()["recipes"]
+    single = client.get(f"/dish/dishes/{dish_id}", headers=headers).get_json()
+
+    assert recipe["like_count"] == 1
+    assert "user_likes" not in recipe
+    assert single["resource"]["like_count"] == 1
+
+
+def test_recount_likes_repairs_the_counters(app, client, make_user, auth):
+    dish_id = add_dish(app)
+    client.post(f"/dish/likes/{dish_id}", headers=auth(make_user()))
+    with app.app_context():
+        db.session.get(DishView, dish_id).like_count = 7
+        db.session.commit()
+
+    assert app.test_cli_runner().invoke(recount_likes).exit_code == 0
+    with app.app_context():
+        assert db.session.get(DishView, dish_id).like_count == 1
@@ -0,0 +1,115 @@
+import json
+import os
+
+import pytest
+
+from resource import create_app, hasher, metrics
+from conftest import CONFIG
+
+
+def scrape(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+
+def test_requests_and_their_queries_are_counted(client, make_user, auth):
+    headers = auth(make_user())
+    client.get("/dish/", headers=headers)
+    client.get("/dish/", headers=headers)
+
+    body = scrape(client)
+
+    assert 'http_requests_total{endpoint="dish_get_dish_view",method="GET",status="200"} 2' in body
+    assert 'db_queries_per_request_count{endpoint="dish_get_dish_view"} 2' in body
+    assert 'endpoint="metrics"' not in body
+
+
+def test_bcrypt_time_is_observed():
+    hasher.check(hasher.hash("secret"), "secret")
+
+    observed = {labels: entry for (name, labels), entry in metrics.registry.histograms.items()
+                if name == "bcrypt_duration_seconds"}
+
+    assert sum(observed[(("operation", "hash"),)][:-1]) == 1
+    assert sum(observed[(("operation", "check"),)][:-1]) == 1
+
+
+def test_the_files_of_every_worker_are_summed(app, client, make_user, auth):
+    headers = auth(make_user())
+    client.get("/dish/", headers=headers)
+    metrics.flush()
+    with open(metrics._path()) as f:
+        other_worker = json.load(f)
+    # pid 1 is alive, so its file is summed as it is
+    with open(os.path.join(metrics.directory, "1-0.json"), "w") as f:
+        json.dump(other_worker, f)
+
+    try:
+        body = scrape(client)
+    finally:
+        os.remove(os.path.join(metrics.directory, "1-0.json"))
+
+    assert 'http_requests_total{endpoint="dish_get_dish_view",method="GET",status="200"} 2' in body
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "directory", str(tmp_path))
+    return tmp_path
+
+
+def test_the_counts_of_dead_workers_are_kept(client, make_user, auth, metrics_dir):
+    headers = auth(make_user())
+    client.get("/dish/", headers=headers)
+    metrics.flush()
+    with open(metrics._path()) as f:
+        dead_worker = json.load(f)
+    # no process has this pid, a worker that got the pid of a dead one would have another start time
+    with open(os.path.join(metrics_dir, "999999999-1.json"), "w") as f:
+        json.dump(dead_worker, f)
+
+    first = scrape(client)
+    client.get("/dish/", headers=headers)
+    second = scrape(client)
+
+    assert 'http_requests_total{endpoint="dish_get_dish_view",method="GET",status="200"} 2' in first
+    assert 'http_requests_total{endpoint="dish_get_dish_view",method="GET",status="200"} 3' in second
+    assert not os.path.exists(os.path.join(metrics_dir, "999999999-1.json"))
+    assert os.path.exists(os.path.join(metrics_dir, metrics.RETIRED_FILE))
+
+
+def test_a_dead_worker_folded_halfway_is_not_counted_twice(client, make_user, auth, metrics_dir):
+    client.get("/dish/", headers=auth(make_user()))
+    metrics.flush()
+    with open(metrics._path()) as f:
+        dead_worker = json.load(f)
+    with open(os.path.join(metrics_dir, "999999999-1.json"), "w") as f:
+        json.dump(dead_worker, f)
+    # a scrape that wrote the retired counts and died before it removed the file
+    with open(os.path.join(metrics_dir, metrics.RETIRED_FILE), "w") as f:
+        json.dump({**dead_worker, "folded": ["999999999-1.json"]}, f)
+
+    body = scrape(client)
+
+    assert 'http_requests_total{endpoint="dish_get_dish_view",method="GET",status="200"} 2' in body
+    assert not os.path.exists(os.path.join(metrics_dir, "999999999-1.json"))
+
+
+def test_scrapes_need_an_allowed_address_or_the_token():
+    app = create_app({**CONFIG, "METRICS_ALLOWED_IPS": ["10.0.0.0/8"], "METRICS_TOKEN": "s3cret"})
+    client = app.test_client()
+
+    assert client.get("/metrics", environ_base={"REMOTE_ADDR": "10.1.2.3"}).status_code == 200
+    assert client.get("/metrics").status_code == 403
+    assert client.get("/metrics", headers={"Authorization": "Bearer s3cret"}).status_code == 200
+    assert client.get("/metrics", headers={"Authorization": "Bearer guess"}).status_code == 403
+    # through a proxy on the allowed network every client would look allowed
+    assert client.get("/metrics", environ_base={"REMOTE_ADDR": "10.1.2.3"},
+                      headers={"X-Forwarded-For": "203.0.113.9"}).status_code == 403
+
+
+def test_metrics_are_off_without_a_token_or_addresses():
+    app = create_app({**CONFIG, "METRICS_ALLOWED_IPS": []})
+
+    assert app.test_client().get("/metrics").status_code == 404
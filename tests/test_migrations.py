@@ -0,0 +1,86 @@
+import os
+
+import pytest
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from flask_migrate import Migrate, downgrade, upgrade
+
+from resource import db, trending
+from resource.commands import migrate_ingredients
+from resource.models import DishView
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(__file__)), "migrations")
+
+
+def created_on(dialect):
+    """Leaves out the indexes the models only create on another database, e.g. postgres GIN indexes"""
+
+    def include_object(obj, name, type_, reflected, compare_to):
+        ddl_if = getattr(obj, "_ddl_if", None)
+        return ddl_if is None or ddl_if.dialect is None or ddl_if.dialect == dialect
+
+    return include_object
+
+
+@pytest.fixture
+def empty_database(app):
+    """An app context on a database without tables, for the migrations to build"""
+    Migrate(app, db)
+    with app.app_context():
+        db.drop_all()
+        try:
+            yield
+        finally:
+            db.session.remove()
+            db.drop_all()
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql("DROP TABLE IF EXISTS alembic_version")
+
+
+def test_migrations_build_the_schema_of_the_models(empty_database):
+    upgrade(directory=MIGRATIONS)
+
+    with db.engine.connect() as connection:
+        diff = compare_metadata(MigrationContext.configure(
+            connection, opts={"include_object": created_on(connection.dialect.name)}), db.metadata)
+    assert diff == []
+
+
+def test_trending_scores_of_existing_dishes_are_filled(empty_database):
+    upgrade(directory=MIGRATIONS, revision="d8b5e2f4a761")
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO dishview (id, name, \"Instructions\", \"Ingredients\", date_posted, like_count) "
+            "VALUES (1, 'soup', 'boil', '[\"water\"]', '2025-03-01 12:00:00', 2), "
+            "(2, 'salad', 'mix', '[\"lettuce\"]', '2025-03-02 12:00:00', 0)")
+        connection.exec_driver_sql('INSERT INTO likes ("user.id", "dishview.id") VALUES (1, 1), (2, 1)')
+
+    upgrade(directory=MIGRATIONS)
+
+    with db.engine.connect() as connection:
+        stored = dict(connection.exec_driver_sql("SELECT id, trending_score FROM dishview").all())
+    assert stored == pytest.approx(trending.recompute(db.session, [1, 2]))
+    # two likes a day earlier still outweigh a newer dish nobody liked
+    assert stored[1] > stored[2]
+
+
+def test_legacy_ingredients_survive_the_upgrade_and_the_conversion(app, empty_database):
+    upgrade(directory=MIGRATIONS, revision="f3a7c9e1b258")
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO dishview (id, name, \"Instructions\", \"Ingredients\", date_posted) "
+            "VALUES (1, 'soup', 'boil', '[\"Water\", \"salt\"]', '2025-03-01 12:00:00')")
+
+    upgrade(directory=MIGRATIONS)
+    # read through the legacy column until the rows are converted
+    assert db.session.get(DishView, 1).Ingredients == ["Water", "salt"]
+    db.session.remove()
+
+    assert app.test_cli_runner().invoke(migrate_ingredients).exit_code == 0
+    dish = db.session.get(DishView, 1)
+    assert (dish.legacy_ingredients, dish.Ingredients) == (None, ["Water", "salt"])
+    db.session.remove()
+
+    downgrade(directory=MIGRATIONS, revision="f3a7c9e1b258")
+    with db.engine.connect() as connection:
+        assert connection.exec_driver_sql("SELECT \"Ingredients\" FROM dishview").scalar() == '["Water", "salt"]'
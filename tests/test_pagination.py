@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from resource import db
+from resource.models import DishView, Users
+from resource.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+
+def add_dishes(app, count, date_posted=None):
+    """Adds dishes a minute apart, or all at date_posted, and returns their ids"""
+    start = datetime(2023, 1, 1)
+    with app.app_context():
+        dishes = [DishView(name=f"dish {i}", Instructions="cook", Ingredients=["salt"], dish_image_url=b"",
+                           date_posted=date_posted or start + timedelta(minutes=i))
+                  for i in range(count)]
+        db.session.add_all(dishes)
+        db.session.commit()
+        return [dish.id for dish in dishes]
+
+
+def walk(client, headers, limit):
+    """Follows next_cursor until the last page, returns the pages"""
+    pages = []
+    cursor = None
+    while True:
+        url = f"/dish/?limit={limit}" + (f"&cursor={cursor}" if cursor else "")
+        body = client.get(url, headers=headers).get_json()
+        pages.append([recipe["id"] for recipe in body["recipes"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_cursor_round_trip():
+    date_posted = datetime(2023, 5, 17, 12, 30, 45, 123456)
+    assert decode_cursor(encode_cursor(date_posted, 42)) == (date_posted, 42)
+
+
+@pytest.mark.parametrize("cursor", ["not base64 at all!", "bm8gc2VwYXJhdG9y", encode_cursor(datetime(2023, 1, 1), 1)[:-4]])
+def test_decode_cursor_rejects_garbage(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_listing_walks_every_dish_once_newest_first(app, client, make_user, auth):
+    ids = add_dishes(app, 7)
+    pages = walk(client, auth(make_user()), limit=3)
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [dish_id for page in pages for dish_id in page] == ids[::-1]
+
+
+def test_dishes_posted_at_the_same_time_are_ordered_by_id(app, client, make_user, auth):
+    ids = add_dishes(app, 5, date_posted=datetime(2023, 1, 1))
+    pages = walk(client, auth(make_user()), limit=2)
+
+    assert [dish_id for page in pages for dish_id in page] == sorted(ids, reverse=True)
+
+
+def test_limit_is_capped(app, client, make_user, auth):
+    add_dishes(app, 5)
+    app.config["DISH_MAX_PAGE_SIZE"] = 2
+    try:
+        body = client.get("/dish/?limit=50", headers=auth(make_user())).get_json()
+    finally:
+        app.config["DISH_MAX_PAGE_SIZE"] = 100
+
+    assert len(body["recipes"]) == 2
+    assert body["next_cursor"] is not None
+
+
+def test_invalid_cursor_is_a_400(client, make_user, auth):
+    response = client.get("/dish/?cursor=garbage", headers=auth(make_user()))
+
+    assert response.status_code == 400
+
+
+def test_likers_are_listed_without_their_password(app, client, make_user, auth):
+    user_id = make_user()
+    dish_id, = add_dishes(app, 1)
+    with app.app_context():
+        user = db.session.get(Users, user_id)
+        user.liked_dishes.append(db.session.get(DishView, dish_id))
+        db.session.commit()
+
+    recipe, = client.get("/dish/?include_likes=true", headers=auth(user_id)).get_json()["recipes"]
+
+    assert [liker["id"] for liker in recipe["user_likes"]] == [user_id]
+    assert "password" not in recipe["user_likes"][0]
@@ -0,0 +1,130 @@
+import os
+
+import pytest
+
+from resource import create_app, db, rate_limiter
+from resource.ratelimit import parse_pairs, parse_rate
+from resource.slots import SharedSlots
+from conftest import CONFIG
+
+
+@pytest.fixture
+def limited_app(tmp_path):
+    """The app with the token buckets and slots in a SQLite file of its own, like in production"""
+
+    def build(**config):
+        app = create_app({**CONFIG, "RATE_LIMIT_BACKEND": "sqlite",
+                          "RATE_LIMIT_FILE": os.path.join(tmp_path, "rate_limits.sqlite"), **config})
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+        return app
+
+    return build
+
+
+def login(client, address="10.0.0.1", **headers):
+    return client.post("/user/login", json={"email": "nobody@example.com", "password": "secret"},
+                       environ_base={"REMOTE_ADDR": address}, headers=headers)
+
+
+def test_parse_rate():
+    assert parse_rate("10/minute") == (10 / 60, 10)
+    assert parse_rate(" 2/second ") == (2, 2)
+    assert parse_rate("none") is None
+    assert parse_rate("0") is None
+    with pytest.raises(ValueError):
+        parse_rate("10/fortnight")
+
+
+def test_parse_pairs():
+    assert parse_pairs("login=20/minute, dish_list=none,") == {"login": "20/minute", "dish_list": "none"}
+    assert parse_pairs("") == {}
+
+
+def test_login_over_the_limit_is_a_429_per_address(limited_app):
+    client = limited_app(RATE_LIMITS={"login": "2/minute"}).test_client()
+
+    statuses = [login(client).status_code for _ in range(3)]
+    limited = login(client)
+
+    assert statuses == [401, 401, 429]
+    assert 0 < int(limited.headers["Retry-After"]) <= 30
+    assert login(client, address="10.0.0.2").status_code == 401
+
+
+def test_buckets_are_shared_by_the_workers(limited_app):
+    # two apps on the same file stand in for two workers of the host
+    first = limited_app(RATE_LIMITS={"login": "2/minute"}).test_client()
+    second = limited_app(RATE_LIMITS={"login": "2/minute"}).test_client()
+
+    assert login(first).status_code == 401
+    assert login(second).status_code == 401
+    assert login(first).status_code == 429
+
+
+def test_authenticated_endpoints_are_limited_per_user(limited_app, make_user, auth):
+    app = limited_app(RATE_LIMITS={"dish_list": "1/minute"})
+    client = app.test_client()
+    first, second = auth(make_user()), auth(make_user())
+
+    assert client.get("/dish/", headers=first).status_code == 200
+    assert client.get("/dish/", headers=first).status_code == 429
+    assert client.get("/dish/", headers=second).status_code == 200
+
+
+def test_a_limit_can_be_turned_off(limited_app):
+    client = limited_app(RATE_LIMITS={"login": "none"}).test_client()
+
+    assert {login(client).status_code for _ in range(20)} == {401}
+
+
+def test_proxy_hops_take_the_client_from_x_forwarded_for(limited_app):
+    client = limited_app(RATE_LIMITS={"login": "1/minute"}, RATE_LIMIT_PROXY_HOPS=1).test_client()
+
+    assert login(client, X_Forwarded_For="1.1.1.1").status_code == 401
+    assert login(client, X_Forwarded_For="1.1.1.1").status_code == 429
+    assert login(client, X_Forwarded_For="2.2.2.2").status_code == 401
+
+
+def test_the_limits_are_off_by_default():
+    config = {key: value for key, value in CONFIG.items() if not key.startswith("RATE_LIMIT_")}
+    create_app(config)
+
+    assert rate_limiter.backend is None
+
+
+def test_a_backend_without_proxy_hops_refuses_to_start():
+    config = {key: value for key, value in CONFIG.items() if key != "RATE_LIMIT_PROXY_HOPS"}
+
+    with pytest.raises(ValueError, match="RATE_LIMIT_PROXY_HOPS"):
+        create_app(config)
+
+
+def test_slots_held_by_other_workers_are_a_503(limited_app):
+    client = limited_app(CONCURRENCY_LIMITS={"auth": 2}).test_client()
+    other_worker = SharedSlots(rate_limiter.slots.db.path)
+    tokens = [other_worker.acquire("auth", 2) for _ in range(2)]
+
+    busy = login(client)
+    for token in tokens:
+        other_worker.release(token)
+
+    assert busy.status_code == 503
+    assert busy.headers["Retry-After"] == "1"
+    assert login(client).status_code == 401
+    assert rate_limiter.slots.held("auth") == 0
+
+
+def test_a_streamed_listing_holds_its_slot_until_closed(limited_app, make_user, auth):
+    client = limited_app(CONCURRENCY_LIMITS={"scan": 1}).test_client()
+    headers = auth(make_user())
+
+    response = client.get("/dish/?stream=json", headers=headers)
+    assert response.is_streamed
+    assert rate_limiter.slots.held("scan") == 1
+    assert client.get("/dish/", headers=headers).status_code == 503
+
+    response.close()
+    assert rate_limiter.slots.held("scan") == 0
+    assert client.get("/dish/", headers=headers).status_code == 200
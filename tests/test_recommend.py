@@ -0,0 +1,89 @@
+import pytest
+
+import resource.recommend
+from resource import db, catalog_refresher
+from resource.catalog import log_changes
+from resource.models import DishView
+from resource.recommend import SimilarityMatrix
+
+
+@pytest.fixture(params=["numpy", "postings"])
+def vectorized(request, monkeypatch):
+    """Every test runs on the sparse matrix and on the pure Python fallback"""
+    if request.param == "postings":
+        monkeypatch.setattr(resource.recommend, "np", None)
+    return request.param == "numpy"
+
+
+def add_dish(app, *ingredients):
+    with app.app_context():
+        dish = DishView(name=" & ".join(ingredients), Instructions="mix", Ingredients=list(ingredients),
+                        dish_image_url=b"")
+        db.session.add(dish)
+        db.session.commit()
+        return dish.id
+
+
+def similar(client, headers, dish_id):
+    response = client.get(f"/dish/{dish_id}/similar", headers=headers)
+    assert response.status_code == 200
+    return [(dish["id"], dish["similarity"]) for dish in response.get_json()["dishes"]]
+
+
+def test_similar_ranks_by_jaccard(app, client, make_user, auth, vectorized):
+    pancake = add_dish(app, "eggs", "flour", "milk")
+    crepe = add_dish(app, "eggs", "flour", "milk", "butter")
+    omelette = add_dish(app, "eggs", "milk")
+    add_dish(app, "lettuce")
+    headers = auth(make_user())
+
+    assert similar(client, headers, pancake) == [(crepe, 0.75), (omelette, 0.6667)]
+    assert client.get("/dish/999/similar", headers=headers).status_code == 404
+
+
+def test_feed_names_the_liked_dish_behind_each_one(app, client, make_user, auth, vectorized):
+    pancake = add_dish(app, "eggs", "flour", "milk")
+    salad = add_dish(app, "lettuce", "tomato")
+    crepe = add_dish(app, "eggs", "flour", "milk", "butter")
+    caprese = add_dish(app, "tomato", "mozzarella")
+    headers = auth(make_user())
+    client.post(f"/dish/likes/{pancake}", headers=headers)
+    client.post(f"/dish/likes/{salad}", headers=headers)
+
+    dishes = client.get("/dish/feed", headers=headers).get_json()["dishes"]
+
+    assert [(dish["id"], dish["because_you_liked"]) for dish in dishes] == [(crepe, pancake), (caprese, salad)]
+
+
+def test_writes_of_this_and_other_workers_reach_the_recommendations(app, client, make_user, auth, vectorized):
+    pancake = add_dish(app, "eggs", "flour", "milk")
+    crepe = add_dish(app, "eggs", "flour")
+    headers = auth(make_user())
+    assert [dish_id for dish_id, _ in similar(client, headers, pancake)] == [crepe]
+
+    assert client.put(f"/dish/{crepe}", headers=headers, json={"Ingredients": ["rice"]}).status_code == 200
+    assert similar(client, headers, pancake) == []
+
+    # another worker creates one dish and changes the other, only the table and the log tell this one
+    waffle = add_dish(app, "eggs", "flour", "milk", "sugar")
+    with app.app_context():
+        db.session.get(DishView, crepe).Ingredients = ["eggs", "flour"]
+        log_changes(db.session, [crepe])
+        db.session.commit()
+    catalog_refresher.refresh_all()
+
+    assert [dish_id for dish_id, _ in similar(client, headers, pancake)] == [waffle, crepe]
+
+
+def test_compaction_keeps_the_scores():
+    matrix = SimilarityMatrix(compact_after=2)
+    matrix.build([(1, ["eggs", "flour"]), (2, ["eggs"]), (3, ["rice"])])
+    before = matrix.top({0: 1, 1: 1}, "jaccard", 10, {1})
+
+    matrix.add(2, ["eggs"])
+    matrix.add(4, ["flour", "eggs", "milk"])
+    matrix.remove(3)
+
+    assert before == [(2, 0.5)]
+    assert matrix.top({0: 1, 1: 1}, "jaccard", 10, {1}) == [(4, 2 / 3), (2, 0.5)]
+    assert matrix.ingredients_of(3) is None
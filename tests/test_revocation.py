@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask_jwt_extended import create_refresh_token, decode_token
+
+from resource import catalog_refresher, create_app, db, revoked_tokens
+from resource.models import RevokeToken
+from resource.revocation import BloomFilter
+from conftest import CONFIG
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(app):
+    with app.app_context():
+        revoked_tokens.rebuild()
+
+
+@pytest.fixture
+def token(app, make_user):
+    with app.app_context():
+        return create_refresh_token(identity=make_user())
+
+
+def jti_of(app, token):
+    with app.app_context():
+        return decode_token(token)["jti"]
+
+
+def revoke_elsewhere(app, jti, created_at=None):
+    """What a logout on another worker leaves behind: the row, but nothing in this worker's filter"""
+    with app.app_context():
+        db.session.add(RevokeToken(jti=jti, created_at=created_at or datetime.utcnow(),
+                                   expires_at=datetime.utcnow() + timedelta(days=1)))
+        db.session.commit()
+
+
+def refresh(client, token):
+    return client.post("/user/refresh", headers={"Authorization": f"Bearer {token}"})
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000)
+    items = [f"jti-{i}" for i in range(1000)]
+    for item in items:
+        bloom.add(item)
+
+    assert all(item in bloom for item in items)
+    # sized for an error rate of 0.1%
+    assert sum(f"other-{i}" in bloom for i in range(10000)) < 50
+
+
+def test_token_is_rejected_after_logout(client, token):
+    assert refresh(client, token).status_code == 200
+
+    assert client.post("/user/logout", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+
+    assert refresh(client, token).status_code == 401
+
+
+def test_logout_on_another_worker_is_picked_up_by_the_refresh(app, client, token):
+    assert refresh(client, token).status_code == 200
+    revoke_elsewhere(app, jti_of(app, token))
+
+    with app.app_context():
+        revoked_tokens.refresh()
+
+    assert refresh(client, token).status_code == 401
+
+
+def test_logout_on_another_worker_is_picked_up_by_the_background_refresh(app, client, token):
+    assert refresh(client, token).status_code == 200
+    revoke_elsewhere(app, jti_of(app, token))
+
+    # what the refresh thread does every CATALOG_REFRESH_SECONDS
+    catalog_refresher.refresh_all()
+
+    assert refresh(client, token).status_code == 401
+
+
+def test_background_refresh_waits_for_the_filter(app):
+    revoked_tokens.reset()
+    with app.app_context():
+        revoked_tokens.refresh()
+    assert revoked_tokens._bloom is None
+
+
+def test_token_errors_are_answered_outside_of_testing(make_user):
+    # TESTING propagates exceptions, production relies on the handlers of the api
+    app = create_app({**CONFIG, "TESTING": False})
+    client = app.test_client()
+    with app.app_context():
+        user_id = make_user()
+        expired = create_refresh_token(identity=user_id, expires_delta=timedelta(seconds=-1))
+        revoked = create_refresh_token(identity=user_id)
+    assert client.post("/user/logout", headers={"Authorization": f"Bearer {revoked}"}).status_code == 200
+
+    assert refresh(client, expired).status_code == 401
+    assert refresh(client, expired).get_json()["msg"] == "Token has expired"
+    assert refresh(client, revoked).status_code == 401
+    assert refresh(client, "not-a-token").status_code == 422
+
+
+def test_refresh_rereads_rows_that_committed_late(app, client, token, make_user):
+    with app.app_context():
+        newer = create_refresh_token(identity=make_user())
+    revoke_elsewhere(app, jti_of(app, newer))
+    with app.app_context():
+        revoked_tokens.refresh()
+
+    # stamped before the newest row this worker has seen, but inside the grace window
+    revoke_elsewhere(app, jti_of(app, token), created_at=datetime.utcnow() - timedelta(seconds=5))
+    with app.app_context():
+        revoked_tokens.refresh()
+
+    assert refresh(client, token).status_code == 401
+
+
+def test_purge_deletes_the_rows_of_expired_tokens_only(app):
+    with app.app_context():
+        db.session.add_all([
+            RevokeToken(jti="expired", expires_at=datetime.utcnow() - timedelta(seconds=1)),
+            RevokeToken(jti="live", expires_at=datetime.utcnow() + timedelta(days=1)),
+        ])
+        db.session.commit()
+
+        assert revoked_tokens.purge() == 1
+        assert [jti for jti, in db.session.query(RevokeToken.jti)] == ["live"]
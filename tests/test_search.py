@@ -0,0 +1,132 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+import resource.routes
+from resource import db, catalog_refresher
+from resource.catalog import CatalogRefresher, log_changes
+from resource.commands import purge_catalog_changes
+from resource.models import CatalogChange, DishView
+from resource.search import IngredientIndex, NameIndex
+
+
+@pytest.fixture(autouse=True)
+def indexes(monkeypatch):
+    """Fresh per worker indexes, watched by the refresher like the ones of the app"""
+    ingredient_index, name_index = IngredientIndex(), NameIndex()
+    monkeypatch.setattr(resource.routes, "ingredient_index", ingredient_index)
+    monkeypatch.setattr(resource.routes, "name_index", name_index)
+    monkeypatch.setattr(catalog_refresher, "_targets", [ingredient_index, name_index])
+    return ingredient_index, name_index
+
+
+def add_dish(app, name, instructions="cook", ingredients=("salt",)):
+    with app.app_context():
+        dish = DishView(name=name, Instructions=instructions, Ingredients=list(ingredients), dish_image_url=b"")
+        db.session.add(dish)
+        db.session.commit()
+        return dish.id
+
+
+def complete(client, headers, prefix, limit=10):
+    response = client.get(f"/dish/autocomplete?prefix={prefix}&limit={limit}", headers=headers)
+    assert response.status_code == 200
+    return response.get_json()["names"]
+
+
+def test_full_text_fallback_ranks_name_matches_first(app, client, make_user, auth):
+    in_instructions = add_dish(app, "Brownies", instructions="melt the chocolate")
+    in_name = add_dish(app, "Chocolate cake", instructions="bake")
+    add_dish(app, "Salad")
+
+    response = client.get("/dish/search?q=Chocolate", headers=auth(make_user()))
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert [(dish["id"], dish["rank"]) for dish in body["dishes"]] == [(in_name, 2.0), (in_instructions, 1.0)]
+    assert body["next_offset"] is None
+
+
+def test_full_text_search_needs_terms(client, make_user, auth):
+    assert client.get("/dish/search?q=%20", headers=auth(make_user())).status_code == 400
+
+
+def test_autocomplete_is_case_insensitive_and_distinct(app, client, make_user, auth):
+    for name in ["Pancakes", "pancake stack", "Pancakes", "Pasta", "Pizza"]:
+        add_dish(app, name)
+    headers = auth(make_user())
+
+    assert complete(client, headers, "PAN") == ["pancake stack", "Pancakes"]
+    assert complete(client, headers, "p", limit=2) == ["pancake stack", "Pancakes"]
+    assert complete(client, headers, "zz") == []
+
+
+def test_autocomplete_follows_this_workers_writes(app, client, make_user, auth):
+    dish_id = add_dish(app, "Waffles")
+    headers = auth(make_user())
+    assert complete(client, headers, "waf") == ["Waffles"]
+
+    assert client.put(f"/dish/{dish_id}", headers=headers, json={"name": "Crepes"}).status_code == 200
+    assert complete(client, headers, "waf") == []
+    assert complete(client, headers, "cre") == ["Crepes"]
+
+    assert client.delete(f"/dish/delete/{dish_id}", headers=headers).status_code == 200
+    assert complete(client, headers, "cre") == []
+
+
+def test_refresh_pulls_in_the_writes_of_other_workers(app, client, make_user, auth):
+    renamed = add_dish(app, "Waffles", ingredients=["eggs"])
+    deleted = add_dish(app, "Wontons", ingredients=["eggs"])
+    headers = auth(make_user())
+    assert complete(client, headers, "w") == ["Waffles", "Wontons"]
+    assert len(client.get("/dish/search/ingredients?ingredients=eggs", headers=headers).get_json()["dishes"]) == 2
+
+    # another worker creates, renames and deletes, only the log and the table tell this one
+    created = add_dish(app, "Wraps", ingredients=["tortilla"])
+    with app.app_context():
+        db.session.get(DishView, renamed).name = "Crepes"
+        db.session.delete(db.session.get(DishView, deleted))
+        log_changes(db.session, [renamed, deleted])
+        db.session.commit()
+    assert complete(client, headers, "w") == ["Waffles", "Wontons"]
+
+    catalog_refresher.refresh_all()
+
+    assert complete(client, headers, "w") == ["Wraps"]
+    assert complete(client, headers, "c") == ["Crepes"]
+    ranked = client.get("/dish/search/ingredients?ingredients=eggs,tortilla&mode=any", headers=headers).get_json()
+    assert [dish["id"] for dish in ranked["dishes"]] == [created, renamed]
+
+
+def test_refresher_runs_in_a_background_thread(app):
+    refreshed = threading.Event()
+
+    class Target:
+        def refresh(self):
+            refreshed.set()
+
+    refresher = CatalogRefresher(Flask(__name__))
+    refresher.interval = 0.01
+    refresher.watch(Target())
+    refresher.start()
+    refresher.start()
+
+    assert refreshed.wait(5)
+    assert [thread.name for thread in threading.enumerate()].count("catalog-refresh") == 1
+    # the daemon thread stops at its next tick
+    refresher._pid = None
+
+
+def test_purge_catalog_changes_keeps_the_recent_entries(app):
+    with app.app_context():
+        db.session.add_all([CatalogChange(dish_id=1, created_at=datetime.utcnow() - timedelta(days=1)),
+                            CatalogChange(dish_id=2, created_at=datetime.utcnow())])
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(purge_catalog_changes)
+
+    assert "done, 1 rows deleted" in result.output
+    with app.app_context():
+        assert [change.dish_id for change in CatalogChange.query] == [2]
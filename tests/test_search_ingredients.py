@@ -0,0 +1,163 @@
+import pytest
+
+import resource.routes
+from resource import create_app, db, ingredient_dictionary
+from resource.commands import migrate_ingredients
+from resource.models import DishView, Ingredient
+from resource.search import IngredientIndex, clean_ingredients, min_overlap, normalize_ingredients
+from conftest import CONFIG
+
+
+@pytest.fixture(autouse=True)
+def index(monkeypatch):
+    index = IngredientIndex()
+    monkeypatch.setattr(resource.routes, "ingredient_index", index)
+    return index
+
+
+def add_dish(app, *ingredients):
+    with app.app_context():
+        dish = DishView(name=" & ".join(ingredients), Instructions="mix", Ingredients=list(ingredients),
+                        dish_image_url=b"")
+        db.session.add(dish)
+        db.session.commit()
+        return dish.id
+
+
+def search(client, headers, ingredients, **args):
+    query = "".join(f"&{name}={value}" for name, value in args.items())
+    response = client.get(f"/dish/search/ingredients?ingredients={ingredients}{query}", headers=headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def ranked(body):
+    return [(dish["id"], dish["overlap"]) for dish in body["dishes"]]
+
+
+def test_normalize_ingredients():
+    assert normalize_ingredients([" Eggs", "flour ", "", None, "EGGS"]) == ["eggs", "flour"]
+    assert normalize_ingredients(None) == []
+    assert clean_ingredients(["Milk", " eggs", "MILK"]) == ["milk", "eggs"]
+
+
+@pytest.mark.parametrize("mode, needed", [("all", 3), ("any", 1), ("most", 2)])
+def test_min_overlap(mode, needed):
+    assert min_overlap(mode, ["eggs", "flour", "milk"]) == needed
+
+
+def test_modes_rank_by_overlap_then_newest(app, client, make_user, auth):
+    pancake = add_dish(app, "Eggs", "Flour", "Milk")
+    omelette = add_dish(app, "eggs", "milk")
+    bread = add_dish(app, "flour")
+    salad = add_dish(app, "lettuce")
+    headers = auth(make_user())
+
+    assert ranked(search(client, headers, "milk,eggs,flour")) == [(pancake, 3)]
+    assert ranked(search(client, headers, "milk,eggs,flour", mode="most")) == [(pancake, 3), (omelette, 2)]
+    assert ranked(search(client, headers, "milk,eggs,flour", mode="any")) == \
+        [(pancake, 3), (omelette, 2), (bread, 1)]
+    assert ranked(search(client, headers, "lettuce,milk", mode="any")) == [(salad, 1), (omelette, 1), (pancake, 1)]
+
+
+def test_search_pages_with_offset(app, client, make_user, auth):
+    ids = [add_dish(app, "salt") for _ in range(5)]
+    headers = auth(make_user())
+
+    first = search(client, headers, "salt", limit=2)
+    last = search(client, headers, "salt", limit=2, offset=4)
+
+    assert [dish_id for dish_id, _ in ranked(first)] == ids[:-3:-1]
+    assert first["next_offset"] == 2
+    assert [dish_id for dish_id, _ in ranked(last)] == [ids[0]]
+    assert last["next_offset"] is None
+
+
+def test_search_rejects_bad_input(client, make_user, auth):
+    headers = auth(make_user())
+
+    assert client.get("/dish/search/ingredients?ingredients=,,", headers=headers).status_code == 400
+    assert client.get("/dish/search/ingredients?ingredients=eggs&mode=some", headers=headers).status_code == 400
+
+
+def test_updates_and_deletes_reach_the_index(app, client, make_user, auth):
+    dish_id = add_dish(app, "eggs")
+    headers = auth(make_user())
+    assert ranked(search(client, headers, "eggs")) == [(dish_id, 1)]
+
+    response = client.put(f"/dish/{dish_id}", headers=headers, json={"Ingredients": ["Tofu"], "Instructions": "fry"})
+    assert response.status_code == 200
+    with app.app_context():
+        dish = db.session.get(DishView, dish_id)
+        assert (dish.Instructions, dish.Ingredients) == ("fry", ["Tofu"])
+    assert ranked(search(client, headers, "eggs")) == []
+    assert ranked(search(client, headers, "tofu")) == [(dish_id, 1)]
+
+    assert client.delete(f"/dish/delete/{dish_id}", headers=headers).status_code == 200
+    assert ranked(search(client, headers, "tofu")) == []
+
+
+def test_dishes_store_ids_and_echo_what_was_sent(app, client, make_user, auth):
+    first = add_dish(app, "Eggs", "Flour")
+    second = add_dish(app, "eggs ", "MILK", "milk")
+    headers = auth(make_user())
+
+    with app.app_context():
+        ingredients = {ingredient.name: ingredient.display_name for ingredient in Ingredient.query}
+        rows = {dish.id: (dish.ingredient_ids, dish.ingredient_labels) for dish in DishView.query}
+    assert ingredients == {"eggs": "Eggs", "flour": "Flour", "milk": "MILK"}
+    # the names of the first dish are the display names, the second one spells them differently
+    assert rows[first][1] is None
+    assert rows[second] == (rows[first][0][:1] + [rows[second][0][1]], ["eggs ", "MILK", "milk"])
+
+    recipes = client.get("/dish/", headers=headers).get_json()["recipes"]
+    listed = {recipe["id"]: recipe["ingredients"] for recipe in recipes}
+    assert listed == {first: ["Eggs", "Flour"], second: ["eggs ", "MILK", "milk"]}
+    assert ranked(search(client, headers, "EGGS,milk")) == [(second, 2)]
+
+
+def test_popular_ingredients_counts_the_dishes(app, client):
+    add_dish(app, "Eggs", "Flour")
+    add_dish(app, "eggs", "Milk")
+    add_dish(app, "EGGS", "milk", "salt")
+
+    popular = client.get("/dish/ingredients/popular?limit=2").get_json()["ingredients"]
+
+    assert [(item["name"], item["dish_count"]) for item in popular] == [("Eggs", 3), ("Milk", 2)]
+
+
+def test_a_new_app_forgets_the_ingredients_of_the_previous_one(app):
+    add_dish(app, "eggs")
+    other = create_app(CONFIG)
+    with other.app_context():
+        db.drop_all()
+        db.create_all()
+        dish = DishView(name="toast", Instructions="toast", Ingredients=["bread"], dish_image_url=b"")
+        db.session.add(dish)
+        db.session.commit()
+
+        assert dish.ingredient_ids == [db.session.query(Ingredient.id).filter_by(name="bread").scalar()]
+
+
+def test_migrate_ingredients_converts_the_legacy_rows(app):
+    with app.app_context():
+        db.session.execute(db.insert(DishView), [
+            {"name": "pancake", "Instructions": "fry", "legacy_ingredients": ["Eggs", " flour"]},
+            {"name": "omelette", "Instructions": "fry", "legacy_ingredients": ["eggs", "Milk"]},
+        ])
+        db.session.commit()
+        assert [dish.Ingredients for dish in DishView.query.order_by(DishView.id)] == \
+            [["Eggs", " flour"], ["eggs", "Milk"]]
+
+    result = app.test_cli_runner().invoke(migrate_ingredients, ["--batch-size", "1"])
+
+    assert result.exit_code == 0
+    assert "done, 2 dishes converted" in result.output
+    with app.app_context():
+        dishes = DishView.query.order_by(DishView.id).all()
+        assert [dish.Ingredients for dish in dishes] == [["Eggs", " flour"], ["eggs", "Milk"]]
+        assert [dish.legacy_ingredients for dish in dishes] == [None, None]
+        assert dishes[0].ingredient_ids[0] == dishes[1].ingredient_ids[0]
+        assert dishes[0].ingredient_labels == ["Eggs", " flour"]
+        assert dishes[1].ingredient_labels == ["eggs", "Milk"]
+        assert ingredient_dictionary.lookup(["eggs", "flour", "milk", "salt"])[-1] is None
@@ -0,0 +1,78 @@
+from datetime import datetime
+
+from flask_restx.mask import Mask
+
+from resource import db
+from resource.models import DishView
+from resource.serializers import DETAIL, dish_serializer, liker_serializer
+
+
+def add_dish(app, name="soup"):
+    with app.app_context():
+        dish = DishView(name=name, Instructions="boil", Ingredients=["water"], dish_image_url=b"")
+        db.session.add(dish)
+        db.session.commit()
+        return dish.id
+
+
+def test_rows_become_dicts_of_the_sent_fields():
+    serializer = dish_serializer(("id", "date_posted", "name"), extra=("user_id",))
+    posted = datetime(2024, 5, 1, 12, 30)
+
+    assert [column.key for column in serializer.columns] == ["id", "date_posted", "name", "user_id"]
+    assert serializer((3, posted, "soup", 9)) == {"id": 3, "date_posted": "2024-05-01T12:30:00", "name": "soup"}
+    assert dish_serializer(("id", "date_posted", "name"), extra=("user_id",)) is serializer
+
+
+def test_a_mask_prunes_the_selected_columns():
+    serializer = dish_serializer(DETAIL, Mask("{name,like_count}"))
+    liker = liker_serializer(Mask("{id,user_likes{first_name}}"))
+
+    assert serializer.fields == ("name", "like_count")
+    # the id is always selected, the listing pages by it
+    assert [column.key for column in serializer.columns] == ["name", "like_count", "id"]
+    assert liker.fields == ("first_name",)
+
+
+def test_listing_honours_x_fields(app, client, make_user, auth):
+    dish_id = add_dish(app)
+    user_id = make_user(email="liker@example.com")
+    headers = auth(user_id)
+    client.post(f"/dish/likes/{dish_id}", headers=headers)
+
+    masked = client.get("/dish/?include_likes=true", headers={**headers, "X-Fields": "{name,user_likes{email}}"})
+    without_likes = client.get("/dish/?include_likes=true", headers={**headers, "X-Fields": "{name}"})
+
+    assert masked.get_json()["recipes"] == [{"name": "soup", "user_likes": [{"email": "liker@example.com"}]}]
+    assert without_likes.get_json()["recipes"] == [{"name": "soup"}]
+
+
+def test_likers_never_carry_the_password_hash(app, client, make_user, auth):
+    dish_id = add_dish(app)
+    headers = auth(make_user())
+    client.post(f"/dish/likes/{dish_id}", headers=headers)
+
+    liker, = client.get("/dish/?include_likes=true", headers=headers).get_json()["recipes"][0]["user_likes"]
+
+    assert sorted(liker) == ["email", "first_name", "id", "last_name", "phone_number"]
+
+
+def test_detail_responses_are_cached_per_mask(app, client, make_user, auth):
+    dish_id = add_dish(app)
+    headers = auth(make_user())
+
+    name = client.get(f"/dish/dishes/{dish_id}", headers={**headers, "X-Fields": "{name}"})
+    count = client.get(f"/dish/dishes/{dish_id}", headers={**headers, "X-Fields": "{like_count}"})
+
+    assert name.get_json() == {"resource": {"name": "soup"}}
+    assert count.get_json() == {"resource": {"like_count": 0}}
+    assert name.headers["ETag"] != count.headers["ETag"]
+
+
+def test_bad_masks_are_a_400(app, client, make_user, auth):
+    dish_id = add_dish(app)
+    headers = auth(make_user())
+
+    assert client.get("/dish/", headers={**headers, "X-Fields": "{name"}).status_code == 400
+    assert client.get("/dish/", headers={**headers, "X-Fields": "{password}"}).status_code == 400
+    assert client.get(f"/dish/dishes/{dish_id}", headers={**headers, "X-Fields": "{secret}"}).status_code == 400
@@ -0,0 +1,84 @@
+import base64
+import hashlib
+import os
+
+import pytest
+
+from resource import db, image_store
+from resource.commands import migrate_images
+from resource.models import DishView
+
+IMAGE = b"\x89PNG\r\n\x1a\n" + b"pixels" * 100
+
+
+@pytest.fixture(autouse=True)
+def store(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(image_store, "root", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def dish_id(app):
+    with app.app_context():
+        dish = DishView(name="soup", Instructions="boil", Ingredients=["water"])
+        db.session.add(dish)
+        db.session.commit()
+        return dish.id
+
+
+def stored_files(root):
+    return [name for _, _, names in os.walk(root) for name in names]
+
+
+def test_identical_bytes_are_stored_once(store):
+    key = image_store.put(IMAGE)
+
+    assert key == hashlib.sha256(IMAGE).hexdigest()
+    assert image_store.put(IMAGE) == key
+    assert stored_files(store) == [key]
+    with open(image_store.path(key), "rb") as f:
+        assert f.read() == IMAGE
+
+
+def test_uploaded_image_is_served_from_the_store(client, make_user, auth, dish_id):
+    headers = auth(make_user())
+    response = client.put(f"/dish/image/{dish_id}/", headers=headers,
+                          json={"dish_image_data": base64.b64encode(IMAGE).decode()})
+    assert response.status_code == 200
+
+    response = client.get(f"/dish/image/view/{dish_id}")
+    key = hashlib.sha256(IMAGE).hexdigest()
+    assert response.data == IMAGE
+    assert response.headers["ETag"] == f'"{key}"'
+
+    assert client.get(f"/dish/image/view/{dish_id}", headers={"If-None-Match": f'"{key}"'}).status_code == 304
+    partial = client.get(f"/dish/image/view/{dish_id}", headers={"Range": "bytes=0-7"})
+    assert partial.status_code == 206
+    assert partial.data == IMAGE[:8]
+
+
+def test_deleting_the_image_of_a_dish_keeps_the_shared_blob(app, client, make_user, auth, dish_id):
+    key = image_store.put(IMAGE)
+    with app.app_context():
+        dish = db.session.get(DishView, dish_id)
+        dish.image_key, dish.image_size = key, len(IMAGE)
+        db.session.commit()
+
+    assert client.delete(f"/dish/image/delete/{dish_id}", headers=auth(make_user())).status_code == 200
+    assert client.get(f"/dish/image/view/{dish_id}").status_code == 404
+    assert image_store.exists(key)
+
+
+def test_migrate_images_moves_the_legacy_bytes(app, dish_id):
+    with app.app_context():
+        db.session.get(DishView, dish_id).dish_image_url = IMAGE
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(migrate_images)
+
+    assert "done, 1 images moved" in result.output
+    key = hashlib.sha256(IMAGE).hexdigest()
+    with app.app_context():
+        dish = db.session.get(DishView, dish_id)
+        assert (dish.image_key, dish.image_size, dish.dish_image_url) == (key, len(IMAGE), None)
+    assert image_store.exists(key)
@@ -0,0 +1,67 @@
+import json
+from datetime import datetime, timedelta
+
+from resource import db
+from resource.models import DishView
+from resource.pagination import encode_cursor
+from resource.streaming import batches
+
+
+def add_dishes(app, count, user_id=None):
+    start = datetime(2023, 1, 1)
+    with app.app_context():
+        dishes = [DishView(name=f"dish {i}", Instructions="cook", Ingredients=["salt"], dish_image_url=b"",
+                           date_posted=start + timedelta(minutes=i), user_id=user_id)
+                  for i in range(count)]
+        db.session.add_all(dishes)
+        db.session.commit()
+        return [dish.id for dish in dishes]
+
+
+def test_batches_splits_a_query(app):
+    ids = add_dishes(app, 5)
+    with app.app_context():
+        sizes = [[dish.id for dish in batch] for batch in batches(DishView.query.order_by(DishView.id), 2)]
+
+    assert sizes == [ids[0:2], ids[2:4], ids[4:]]
+
+
+def test_listing_streams_every_dish_as_one_json_document(app, client, make_user, auth):
+    app.config["STREAM_BATCH_SIZE"] = 2
+    try:
+        ids = add_dishes(app, 5)
+        response = client.get("/dish/?stream=json", headers=auth(make_user()))
+    finally:
+        app.config["STREAM_BATCH_SIZE"] = 500
+
+    assert response.is_streamed
+    assert [recipe["id"] for recipe in json.loads(response.data)["recipes"]] == ids[::-1]
+
+
+def test_listing_streams_ndjson_from_the_cursor(app, client, make_user, auth):
+    ids = add_dishes(app, 4)
+    with app.app_context():
+        third = db.session.get(DishView, ids[2])
+        cursor = encode_cursor(third.date_posted, third.id)
+
+    response = client.get(f"/dish/?cursor={cursor}", headers={**auth(make_user()), "Accept": "application/x-ndjson"})
+
+    assert response.mimetype == "application/x-ndjson"
+    assert [json.loads(line)["id"] for line in response.data.splitlines()] == [ids[1], ids[0]]
+
+
+def test_empty_stream_is_still_json(client, make_user, auth):
+    response = client.get("/dish/?stream=json", headers=auth(make_user()))
+
+    assert json.loads(response.data) == {"recipes": []}
+
+
+def test_dishes_of_a_user_stream_with_the_head(app, client, make_user, auth):
+    user_id = make_user()
+    ids = add_dishes(app, 3, user_id=user_id)
+
+    response = client.get(f"/dish/user/{user_id}?stream=json", headers=auth(user_id))
+
+    body = json.loads(response.data)
+    assert body["user_id"] == user_id
+    assert [dish["id"] for dish in body["dishes"]] == ids
@@ -0,0 +1,84 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from resource import db, image_store, thumbnails
+from resource.models import DishView
+from resource.thumbnails import build_variants, variant_path
+
+
+def png(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 80, 20)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def store(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(image_store, "root", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def image_key():
+    return image_store.put(png(2000, 1000))
+
+
+@pytest.fixture
+def dish_id(app, image_key):
+    with app.app_context():
+        dish = DishView(name="soup", Instructions="boil", Ingredients=["water"],
+                        image_key=image_key, image_content_type="image/png")
+        db.session.add(dish)
+        db.session.commit()
+        return dish.id
+
+
+def test_build_writes_every_size_and_format(image_key):
+    thumbnails.build(image_key)
+
+    for size in thumbnails.sizes:
+        for fmt in ("jpeg", "webp"):
+            with Image.open(variant_path(image_store.root, image_key, size, fmt)) as variant:
+                # the aspect ratio is kept, the long side is the variant size
+                assert variant.size == (size, size // 2)
+
+
+def test_a_failed_encode_leaves_no_temp_file(image_key, monkeypatch):
+    def broken_save(image, f, *args, **kwargs):
+        f.write(b"half an image")
+        raise OSError("encoder failed")
+
+    monkeypatch.setattr(Image.Image, "save", broken_save)
+
+    with pytest.raises(OSError):
+        build_variants(image_store.path(image_key), image_store.root, image_key, (128,))
+
+    directory = os.path.dirname(variant_path(image_store.root, image_key, 128, "webp"))
+    assert os.listdir(directory) == []
+
+
+@pytest.mark.parametrize("requested, size", [(1, 128), (128, 128), (129, 512), (600, 1024), (5000, 1024)])
+def test_pick_size_covers_the_request(requested, size):
+    assert thumbnails.pick_size(requested) == size
+
+
+def test_original_is_served_until_the_variant_exists(client, dish_id):
+    response = client.get(f"/dish/image/view/{dish_id}?size=100")
+
+    assert response.mimetype == "image/png"
+
+
+def test_variant_format_follows_accept(client, dish_id, image_key):
+    thumbnails.build(image_key)
+
+    jpeg = client.get(f"/dish/image/view/{dish_id}?size=100", headers={"Accept": "*/*"})
+    webp = client.get(f"/dish/image/view/{dish_id}?size=100", headers={"Accept": "image/webp,*/*"})
+
+    assert jpeg.mimetype == "image/jpeg"
+    assert webp.mimetype == "image/webp"
+    assert "Accept" in webp.headers["Vary"]
+    with Image.open(io.BytesIO(webp.data)) as variant:
+        assert variant.size == (128, 64)
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from resource import db, trending
+from resource.commands import recompute_trending
+from resource.models import DishView
+
+
+def add_dish(app, name, posted):
+    with app.app_context():
+        dish = DishView(name=name, Instructions="cook", Ingredients=["salt"], dish_image_url=b"", date_posted=posted)
+        db.session.add(dish)
+        db.session.commit()
+        return dish.id
+
+
+def scores(app, *dish_ids):
+    with app.app_context():
+        stored = dict(db.session.query(DishView.id, DishView.trending_score).filter(DishView.id.in_(dish_ids)))
+        return stored, trending.recompute(db.session, dish_ids)
+
+
+def trending_ids(client, **args):
+    query = "&".join(f"{name}={value}" for name, value in args.items())
+    response = client.get(f"/dish/trending?{query}")
+    assert response.status_code == 200
+    return [recipe["id"] for recipe in response.get_json()["recipes"]]
+
+
+def test_a_like_is_worth_more_the_newer_it_is(app):
+    with app.app_context():
+        posted = trending.initial_score(datetime(2025, 1, 1))
+        half_life_later = trending.initial_score(datetime(2025, 1, 3))
+
+    assert half_life_later - posted == pytest.approx(0.6931, abs=1e-4)
+
+
+def test_likes_and_unlikes_keep_the_stored_score_exact(app, client, make_user, auth):
+    dish_id = add_dish(app, "soup", datetime.utcnow() - timedelta(days=1))
+    users = [auth(make_user()) for _ in range(3)]
+
+    for headers in users:
+        client.post(f"/dish/likes/{dish_id}", headers=headers)
+    client.delete(f"/dish/likes/{dish_id}", headers=users[0])
+    client.post("/dish/batch/likes", headers=users[1], json={"unlike": [dish_id]})
+    client.post("/dish/batch/likes", headers=users[0], json={"like": [dish_id]})
+
+    stored, recomputed = scores(app, dish_id)
+    assert stored == pytest.approx(recomputed)
+
+
+def test_unliking_a_like_without_created_at_recomputes(app, client, make_user, auth):
+    dish_id = add_dish(app, "soup", datetime.utcnow())
+    headers = auth(make_user())
+    client.post(f"/dish/likes/{dish_id}", headers=headers)
+    with app.app_context():
+        # a like from before likes.created_at existed
+        db.session.execute(db.text('UPDATE likes SET created_at = NULL'))
+        db.session.commit()
+
+    client.delete(f"/dish/likes/{dish_id}", headers=headers)
+
+    stored, recomputed = scores(app, dish_id)
+    assert stored == pytest.approx(recomputed)
+
+
+def test_trending_orders_by_decayed_likes(app, client, make_user, auth):
+    now = datetime.utcnow()
+    old_favourite = add_dish(app, "old", now - timedelta(days=30))
+    new_one = add_dish(app, "new", now)
+    liked_today = add_dish(app, "liked", now - timedelta(days=2))
+    for _ in range(2):
+        client.post(f"/dish/likes/{liked_today}", headers=auth(make_user()))
+    with app.app_context():
+        db.session.get(DishView, old_favourite).trending_score = trending.updated_score(
+            trending.initial_score(now - timedelta(days=30)), [now - timedelta(days=30)] * 50)
+        db.session.commit()
+
+    assert trending_ids(client) == [liked_today, new_one, old_favourite]
+    assert trending_ids(client, limit=1) == [liked_today]
+
+
+def test_recompute_trending_rewrites_every_score(app):
+    dish_ids = [add_dish(app, f"dish {i}", datetime(2025, 1, 1 + i)) for i in range(3)]
+    with app.app_context():
+        db.session.execute(db.update(DishView).values(trending_score=0))
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(recompute_trending, ["--batch-size", "2"])
+
+    assert "done, 3 dishes" in result.output
+    stored, recomputed = scores(app, *dish_ids)
+    assert stored == pytest.approx(recomputed)
+    assert stored[dish_ids[0]] != 0
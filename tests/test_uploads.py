@@ -0,0 +1,89 @@
+import base64
+import io
+import os
+
+import pytest
+
+from resource import db, image_store
+from resource.models import DishView
+from resource.storage import sniff_image_type
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 200
+JPEG = b"\xff\xd8\xff\xe0" + b"\x01" * 200
+
+
+@pytest.fixture(autouse=True)
+def store(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(image_store, "root", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def dish_id(app):
+    with app.app_context():
+        dish = DishView(name="soup", Instructions="boil", Ingredients=["water"])
+        db.session.add(dish)
+        db.session.commit()
+        return dish.id
+
+
+@pytest.mark.parametrize("head, content_type", [
+    (JPEG, "image/jpeg"),
+    (PNG, "image/png"),
+    (b"GIF89a....", "image/gif"),
+    (b"RIFF\x00\x00\x00\x00WEBPVP8 ", "image/webp"),
+    (b"%PDF-1.7", None),
+])
+def test_sniff_image_type(head, content_type):
+    assert sniff_image_type(head) == content_type
+
+
+def test_raw_upload_is_served_with_the_sniffed_type(client, make_user, auth, dish_id):
+    response = client.put(f"/dish/image/{dish_id}/", data=JPEG, content_type="application/octet-stream",
+                          headers=auth(make_user()))
+    assert response.status_code == 200
+
+    image = client.get(f"/dish/image/view/{dish_id}")
+    assert image.data == JPEG
+    assert image.mimetype == "image/jpeg"
+
+
+def test_multipart_dish_creation_stores_the_image(app, client, make_user, auth):
+    response = client.post("/dish", headers=auth(make_user()), content_type="multipart/form-data", data={
+        "name": "toast", "Instructions": "toast it", "Ingredients": ["bread", "butter"],
+        "dish_image_url": (io.BytesIO(PNG), "toast.png"),
+    })
+    assert response.status_code == 200
+
+    with app.app_context():
+        dish = db.session.get(DishView, response.get_json()["dish_view_id"])
+        assert dish.Ingredients == ["bread", "butter"]
+        assert (dish.image_size, dish.image_content_type) == (len(PNG), "image/png")
+        assert image_store.exists(dish.image_key)
+
+
+def test_base64_json_upload_still_works(client, make_user, auth, dish_id):
+    response = client.put(f"/dish/image/{dish_id}/", headers=auth(make_user()),
+                          json={"dish_image_data": base64.b64encode(PNG).decode()})
+
+    assert response.status_code == 200
+    assert client.get(f"/dish/image/view/{dish_id}").mimetype == "image/png"
+
+
+def test_too_large_upload_is_a_413_and_leaves_nothing_behind(app, client, make_user, auth, dish_id, store,
+                                                              monkeypatch):
+    monkeypatch.setitem(app.config, "IMAGE_MAX_BYTES", 100)
+
+    response = client.put(f"/dish/image/{dish_id}/", data=PNG, content_type="image/png", headers=auth(make_user()))
+
+    assert response.status_code == 413
+    assert [name for _, _, names in os.walk(store) for name in names] == []
+
+
+def test_unknown_image_type_is_a_415(client, make_user, auth, dish_id, store):
+    response = client.put(f"/dish/image/{dish_id}/", data=b"%PDF-1.7" + b"\x00" * 50,
+                          content_type="application/octet-stream", headers=auth(make_user()))
+
+    assert response.status_code == 415
+    assert [name for _, _, names in os.walk(store) for name in names] == []
+    assert client.get(f"/dish/image/view/{dish_id}").status_code == 404